@@ -9,13 +9,22 @@ from textwrap import dedent as d
 from labour import *
 from spotify import *
 from explain import *
+from cache import callback_cache
+from lazy import warm_up
+from static import add_cache_headers
+from metrics import instrument
+from compress import add_compression
+from jobs import add_session_cookie, job_runner
+from clientside import CLIENTSIDE, threshold_callbacks
+from edges import viewport
 # from information_flow import *
 
 
 # import the css template, and pass the css template into dash
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 external_scripts = ['https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.4/MathJax.js?config=TeX-MML-AM_CHTML']
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets, external_scripts=external_scripts)
+# compress.py compresses responses, in place of dash's Flask-Compress
+app = dash.Dash(__name__, external_stylesheets=external_stylesheets, external_scripts=external_scripts, compress=False)
 app.title = "Tobin South - Stoneham Prize"
 
 
@@ -43,6 +52,12 @@ app.layout = html.Div([
 
 # This line is needed for webhosting
 server = app.server 
+add_cache_headers(server)
+callback_metrics = instrument(app)
+# After the metrics hooks, so they count the bytes sent and the time compressing them
+compressed_cache = add_compression(server)
+add_session_cookie(server)
+warm_up()
 
 ######################################################################################################################################################################
 # These callbacks are what will make everything interactive
@@ -52,79 +67,139 @@ server = app.server
 @app.callback(
     dash.dependencies.Output('spotify-graph', 'figure'),
     [dash.dependencies.Input('spotify_pop_threshold', 'value')])
+# Thresholds off the precomputed ones solve the artist graph's eigenvector, which can take a while
+@job_runner.background(fallback=lambda threshold: spotify.nearest_figure(threshold))
+@callback_cache.memoize()
 def update_main_spotify_output(spotify_pop_threshold):
     return spotify.update_figure(spotify_pop_threshold)
 
 @app.callback(
     dash.dependencies.Output('spotify_first_eigenvector_graph', 'figure'),
     [dash.dependencies.Input('spotify_pop_threshold', 'value')])
+@callback_cache.memoize()
 def update_first_eigenvector_graph(spotify_pop_threshold):
     return plot_first_eigencentraility(spotify_pop_threshold)
 
 @app.callback(
     dash.dependencies.Output('spotify_second_eigenvector_graph', 'figure'),
     [dash.dependencies.Input('spotify_pop_threshold', 'value')])
+@callback_cache.memoize()
 def update_second_eigenvector_graph(spotify_pop_threshold):
     return plot_second_eigencentraility(spotify_pop_threshold)
 
 @app.callback(
     dash.dependencies.Output('spotify_pop_threshold_output', 'children'),
     [dash.dependencies.Input('spotify_pop_threshold', 'value')])
+@callback_cache.memoize()
 def update_main_spotify_pop_threshold_output(spotify_pop_threshold):
     return "You have selected a threshold of %d" % spotify_pop_threshold
 
 
 
 # Labour Networks Tab Callbacks
-@app.callback(
-    dash.dependencies.Output('labour-graph', 'figure'),
-    [dash.dependencies.Input('color_choice', 'value'), 
-     dash.dependencies.Input('labour_edge_threshold', 'value'),
-     dash.dependencies.Input('size_choice', 'value')])
-def update_main_labour_output(color_choice, labour_edge_threshold, size_choice):
-    return labourNetwork.get_updated_graph(color_choice, 1-labour_edge_threshold, size_choice)
+if CLIENTSIDE:
+    # The edge slider is handled in the browser, the server only sends new node markers
+    @app.callback(
+        dash.dependencies.Output('labour-nodes', 'data'),
+        [dash.dependencies.Input('color_choice', 'value'),
+         dash.dependencies.Input('size_choice', 'value'),
+         dash.dependencies.Input('region_choice', 'value'),
+         dash.dependencies.Input('resolution_choice', 'value')])
+    @callback_cache.memoize()
+    def update_labour_nodes(color_choice, size_choice, region_choice, resolution_choice):
+        # Communities are of every edge here, the edge slider never reaches the server
+        return (labourNetwork.highlight_traces(color_choice, region_choice)
+                + [labourNetwork.colored_node_trace(color_choice, size_choice, region_choice, resolution_choice)])
+
+    threshold_callbacks(app, 'labour-graph', 'labour_edge_threshold', 'labour-edges', 'labour-nodes',
+                        labour_edge_store, 'labour_figure')
+else:
+    @app.callback(
+        dash.dependencies.Output('labour-graph', 'figure'),
+        [dash.dependencies.Input('color_choice', 'value'), 
+         dash.dependencies.Input('labour_edge_threshold', 'value'),
+         dash.dependencies.Input('size_choice', 'value'),
+         dash.dependencies.Input('region_choice', 'value'),
+         dash.dependencies.Input('resolution_choice', 'value'),
+         dash.dependencies.Input('labour-graph', 'relayoutData')])
+    # Every zoom is a new view, so only the whole figure is cached
+    @callback_cache.memoize(cacheable=lambda *inputs: viewport(inputs[-1]) is None)
+    def update_main_labour_output(color_choice, labour_edge_threshold, size_choice, region_choice, resolution_choice,
+                                  relayout_data):
+        return labourNetwork.get_updated_graph(color_choice, 1-labour_edge_threshold, size_choice, viewport(relayout_data),
+                                               region_choice, resolution_choice)
 
 @app.callback(
     dash.dependencies.Output('color_choice_output', 'children'),
     [dash.dependencies.Input('color_choice', 'value')])
+@callback_cache.memoize()
 def update_color_choice_output(color_choice):
     return color_choice_output_dict[color_choice]
 
+@app.callback(
+    [dash.dependencies.Output('region_box', 'style'),
+     dash.dependencies.Output('resolution_box', 'style')],
+    [dash.dependencies.Input('color_choice', 'value')])
+def update_labour_controls(color_choice):
+    return control_styles(color_choice)
+
+@app.callback(
+    dash.dependencies.Output('region_output', 'children'),
+    [dash.dependencies.Input('color_choice', 'value'),
+     dash.dependencies.Input('region_choice', 'value'),
+     dash.dependencies.Input('resolution_choice', 'value')])
+@callback_cache.memoize()
+def update_region_output(color_choice, region_choice, resolution_choice):
+    return labourNetwork.region_summary(color_choice, region_choice, resolution_choice)
+
 @app.callback(
     dash.dependencies.Output('size_choice_output', 'children'),
     [dash.dependencies.Input('size_choice', 'value')])
+@callback_cache.memoize()
 def update_size_choice_output(size_choice):
     return size_choice_output_dict[size_choice]
 
 
 # Explain Tab Callbacks
+def explain_seed_value(explain_seed):
+    """The seed box's value as a generator seed, None when empty and reduced into numpy's range otherwise."""
+    return None if explain_seed in (None, '') else int(explain_seed) % 2**32
+
 @app.callback(
     dash.dependencies.Output('explain_graph', 'figure'),
     [dash.dependencies.Input('explain_edge_prob', 'value'), 
      dash.dependencies.Input('explain_number_of_nodes', 'value'),
      dash.dependencies.Input('explain_graph_type', 'value'),
-     dash.dependencies.Input('explain_centrality', 'value')])
-def update_explain_graph(explain_edge_prob, explain_number_of_nodes, explain_graph_type, explain_centrality):
-    return explain_make_network(explain_number_of_nodes, explain_edge_prob, explain_graph_type, explain_centrality)
+     dash.dependencies.Input('explain_centrality', 'value'),
+     dash.dependencies.Input('explain_seed', 'value')])
+@job_runner.background(fallback=lambda p, n, style, color, seed: explain_sketch_network(
+    n, p, style, color, explain_seed_value(seed)))
+@callback_cache.memoize(cacheable=lambda *inputs: inputs[-1] not in (None, ''))
+def update_explain_graph(explain_edge_prob, explain_number_of_nodes, explain_graph_type, explain_centrality, explain_seed):
+    return explain_make_network(explain_number_of_nodes, explain_edge_prob, explain_graph_type, explain_centrality,
+                                explain_seed_value(explain_seed))
 
 @app.callback(
     dash.dependencies.Output('explain_N_M_output', 'children'),
     [dash.dependencies.Input('explain_edge_prob', 'value'), 
      dash.dependencies.Input('explain_number_of_nodes', 'value')])
+@callback_cache.memoize()
 def update_explain_N_M_output(explain_edge_prob, explain_number_of_nodes):
     return "You have selected %d nodes and an edge probability of %.1f" % (explain_number_of_nodes, explain_edge_prob)
 
 @app.callback(
     dash.dependencies.Output('explain_graph_type_output', 'children'),
     [dash.dependencies.Input('explain_graph_type', 'value')])
+@callback_cache.memoize()
 def update_explain_graph_type_output(explain_graph_type):
     return explain_graph_type_output_dict[explain_graph_type]
 
 @app.callback(
     dash.dependencies.Output('explain_centrality_output', 'children'),
     [dash.dependencies.Input('explain_centrality', 'value')])
-def update_explain_graph_type_output(explain_graph_type):
-    return explain_centrality_output_dict[explain_graph_type]
+@callback_cache.memoize()
+def update_explain_centrality_output(explain_centrality):
+    return explain_centrality_output_dict[explain_centrality]
 
 
 
@@ -0,0 +1,51 @@
+// Clientside edge thresholding, see clientside.py.
+//
+// An edge store holds the vertex coordinates, the vertex pairs of all edges
+// in ascending percentile order and the percentile of each edge. The edges
+// above a threshold are then a suffix of the pairs, found by binary search,
+// and drawn as one line trace of x0, x1, null segments like edges.py does,
+// with WebGL and at most the budget's most important edges past its limits.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    networks: {
+        threshold_figure: function(threshold, store, nodes) {
+            if (!store) {
+                return {data: [], layout: {}};
+            }
+            var percentile = store.percentile, pairs = store.edges;
+            var low = 0, high = percentile.length;
+            while (low < high) {
+                var middle = (low + high) >>> 1;
+                if (percentile[middle] <= threshold) {
+                    low = middle + 1;
+                } else {
+                    high = middle;
+                }
+            }
+
+            low = Math.max(low, percentile.length - store.budget);
+            var count = percentile.length - low;
+            var x = new Array(3 * count), y = new Array(3 * count);
+            for (var i = 0, j = 2 * low; i < 3 * count; i += 3, j += 2) {
+                x[i] = store.x[pairs[j]];
+                x[i + 1] = store.x[pairs[j + 1]];
+                x[i + 2] = null;
+                y[i] = store.y[pairs[j]];
+                y[i + 1] = store.y[pairs[j + 1]];
+                y[i + 2] = null;
+            }
+            var edges = Object.assign({}, count >= store.webgl_edges ? store.webgl : store.svg, {x: x, y: y});
+            // The nodes store holds the node trace, or a list of traces drawn over the edges
+            var traces = Array.isArray(nodes) ? nodes : (nodes ? [nodes] : []);
+            var data = [edges];
+            for (var k = 0; k < traces.length; k++) {
+                data.push(traces[k].type === edges.type ? traces[k] : Object.assign({}, traces[k], {type: edges.type}));
+            }
+            return {data: data, layout: store.layout};
+        },
+
+        // The labour slider is the share of edges to keep
+        labour_figure: function(keep, store, nodes) {
+            return window.dash_clientside.networks.threshold_figure(1 - keep, store, nodes);
+        }
+    }
+});
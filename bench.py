@@ -0,0 +1,1130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Benchmarks for the figure builders behind the app.
+#
+#   python bench.py            run every benchmark
+#   python bench.py edges      run just one of them
+import json, os, random, subprocess, sys, tempfile, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import igraph as ig, numpy as np, pandas as pd
+import plotly
+
+from edges import EdgeIndex, edge_segments, graph_segments, rank_percentile
+
+
+def timed(fn, *args, repeat=5):
+    """Best wall time in seconds of `repeat` calls, and the last result."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(name, seconds, baseline=None):
+    line = "  %-40s %10.2f ms" % (name, 1000 * seconds)
+    if baseline:
+        line += "   (%.0fx faster)" % (baseline / seconds)
+    print(line)
+
+
+# The per-edge loop the figure builders used before edges.py
+def legacy_edge_data(G):
+    edge_data = []
+    for e in G.es:
+        n0, n1 = e.tuple
+        x0, y0 = G.vs[n0]['x'], G.vs[n0]['y']
+        x1, y1 = G.vs[n1]['x'], G.vs[n1]['y']
+        edge_data += [(x0, x1, None, y0, y1, None)]
+    return np.array(edge_data)
+
+
+def bench_edges():
+    print("Edge segment construction (python loop vs numpy gather)")
+    graphs = [(name, ig.Graph.Read_Pickle("data/%s.pickle" % name))
+              for name in ['skill_scape_graph', 'spotify_core_graph', 'information_flow_graph']]
+
+    rng = np.random.RandomState(0)
+    G = ig.Graph.Erdos_Renyi(n=250000, m=1000000)
+    G.vs['x'] = rng.randn(G.vcount())
+    G.vs['y'] = rng.randn(G.vcount())
+    graphs.append(('synthetic %d edges' % G.ecount(), G))
+
+    for name, G in graphs:
+        print(" %s (%d edges)" % (name, G.ecount()))
+        loop, old = timed(legacy_edge_data, G, repeat=1 if G.ecount() > 100000 else 3)
+        fast, new = timed(graph_segments, G)
+        old = np.array(old, dtype=float)
+        assert np.allclose(old[:, :3].ravel(), new[0], equal_nan=True)
+        assert np.allclose(old[:, 3:].ravel(), new[1], equal_nan=True)
+        report("loop", loop)
+        report("numpy", fast, loop)
+
+
+def encode(figure):
+    return json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def bench_spotify_cache():
+    from spotify import Spotify, spotify
+
+    print("Spotify threshold cache")
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cached = Spotify()
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print("  %d thresholds built in %.2f s" % (len(spotify.cache), spotify.cache_build_seconds))
+    print("  arrays and strings of the figures: %.2f MB, all allocations: %.2f MB"
+          % (cached.cache_nbytes() / 1e6, allocated / 1e6))
+
+    def rebuild(threshold):
+        return encode(spotify.get_labour_figure(*spotify.threshold_spotify(threshold)))
+
+    def lookup(threshold):
+        return encode(spotify.update_figure(threshold))
+
+    slider = list(range(70))
+    rebuild_time, _ = timed(lambda: [rebuild(t) for t in slider], repeat=3)
+    lookup_time, _ = timed(lambda: [lookup(t) for t in slider], repeat=3)
+    report("rebuild + encode per slider move", rebuild_time / len(slider))
+    report("lookup + encode per slider move", lookup_time / len(slider), rebuild_time / len(slider))
+
+
+def bench_labour_concurrency(requests=100):
+    from labour import labourNetwork
+
+    # tests/test_labour_concurrency.py checks each response is the one for its inputs
+    print("LabourNetwork.get_updated_graph under concurrent requests")
+    combos = [(color, round(1 - slider / 10, 1), size)
+              for color in labourNetwork.markers
+              for slider in range(11)
+              for size in labourNetwork.sizes]
+
+    def request(combo):
+        return encode(labourNetwork.get_updated_graph(*combo))
+
+    rng = random.Random(0)
+    for threads in [1, 2, 4, 8]:
+        work = [rng.choice(combos) for _ in range(requests)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(request, work))
+        elapsed = time.perf_counter() - start
+        print("  %d threads: %6.1f requests/s" % (threads, requests / elapsed))
+
+
+def bench_threshold():
+    # tests/test_edges.py checks the index keeps the same edges as the mask
+    print("Edge thresholding (boolean mask vs sorted prefix index)")
+    from graphstore import load_graph
+
+    for name in ['skill_scape_graph', 'information_flow_graph']:
+        G = load_graph(name)
+        print(" %s (%d edges)" % (name, G.ecount()))
+        percentile = rank_percentile(G.es['weight'])
+        segments = graph_segments(G)
+        index = EdgeIndex(G.get_edgelist(), G.vs['x'], G.vs['y'], G.es['weight'])
+
+        def mask(threshold):
+            keep = np.repeat(percentile > threshold, 3)
+            return list(segments[0, keep].flatten()), list(segments[1, keep].flatten())
+
+        slider = np.linspace(0, 1, 11)
+        mask_time, _ = timed(lambda: [mask(t) for t in slider])
+        index_time, _ = timed(lambda: [index.threshold(t) for t in slider])
+        report("mask + list per threshold", mask_time / len(slider))
+        report("searchsorted slice per threshold", index_time / len(slider), mask_time / len(slider))
+
+
+# Representative inputs for the figure callbacks in app.py
+CALLBACK_INPUTS = [
+    ('update_main_spotify_output', (30,)),
+    ('update_first_eigenvector_graph', (30,)),
+    ('update_second_eigenvector_graph', (30,)),
+    ('update_main_labour_output', ('unemployment', 0.5, 'total_pop', 'Australia', 1.0, None)),
+    ('update_explain_graph', (0.5, 100, 'Erdős–Rényi Random Graph', 'betweenness', None)),
+]
+
+
+def bench_payload():
+    print("Callback response size and encode time")
+    for mode, name in [('0', 'JSON text arrays'), ('1', 'base64 float32 typed arrays')]:
+        print(" %s" % name)
+        sys.stdout.flush()
+        env = dict(os.environ, NETWORKS_BINARY_PAYLOADS=mode)
+        subprocess.check_call([sys.executable, __file__, '_callback_payloads'], env=env)
+
+
+def callback_payloads():
+    import app
+
+    for name, inputs in CALLBACK_INPUTS:
+        figure = getattr(app, name)(*inputs)
+        seconds, response = timed(encode, figure)
+        print("  %-40s %8.1f KB %8.2f ms" % (name, len(response) / 1e3, 1000 * seconds))
+
+
+def bench_layout():
+    import base64, re
+    from urllib.parse import unquote
+    from app import app
+
+    print("Initial _dash-layout response")
+    layout = encode(app.layout)
+    urls = re.findall(r'"src": "/assets/([^"]+)"', layout)
+    # What the same layout weighed when the images were inlined as data URIs
+    inlined = len(layout)
+    for url in urls:
+        path = os.path.join('assets', unquote(url.split('?')[0]))
+        if os.path.exists(path):
+            with open(path, 'rb') as png:
+                inlined += len('data:image/png;base64,' + base64.b64encode(png.read()).decode()) - len('/assets/' + url)
+    print("  with base64 images inlined    %8.1f KB" % (inlined / 1e3))
+    print("  with images linked in assets/ %8.1f KB" % (len(layout) / 1e3))
+
+    client = app.server.test_client()
+    response = client.get('/assets/' + urls[0])
+    print("  GET /assets/%s: %s, Cache-Control: %s, ETag: %s" % (
+        urls[0], response.status_code, response.headers.get('Cache-Control'), response.headers.get('ETag')))
+    revalidated = client.get('/assets/' + urls[0], headers={'If-None-Match': response.headers.get('ETag')})
+    print("  revalidation: %s, %d bytes" % (revalidated.status_code, len(revalidated.data)))
+
+
+def rss_kb():
+    """Private (anonymous) and file-backed, shareable, resident memory in KB."""
+    with open('/proc/self/status') as status:
+        fields = dict(line.split(':', 1) for line in status)
+    return int(fields['RssAnon'].split()[0]), int(fields['RssFile'].split()[0])
+
+
+def bench_graphstore():
+    print("Graph loading (igraph pickle vs memory-mapped .graph)")
+    for name in ['skill_scape_graph', 'spotify_core_graph', 'information_flow_graph']:
+        print(" %s" % name)
+        for extension in ['pickle', 'graph']:
+            sys.stdout.flush()
+            subprocess.check_call([sys.executable, __file__, '_load_graph', 'data/%s.%s' % (name, extension)])
+
+
+def load_graph_once(path):
+    from graphstore import ColumnarGraph
+    load = ig.Graph.Read_Pickle if path.endswith('.pickle') else ColumnarGraph
+    private, shared = rss_kb()
+    start = time.perf_counter()
+    G = load(path)
+    loaded = time.perf_counter() - start
+    # Touch every attribute the way the figure builders do
+    for attributes in [G.vs, G.es]:
+        for name in attributes.attributes():
+            list(attributes[name])
+    used = time.perf_counter() - start
+    after_private, after_shared = rss_kb()
+    print("  %-7s load %7.2f ms, with attributes %7.2f ms, RSS +%5d KB private +%5d KB shareable"
+          % (path.rsplit('.', 1)[1], 1000 * loaded, 1000 * used, after_private - private, after_shared - shared))
+
+
+def bench_startup():
+    for mode in ['0', '1']:
+        env = dict(os.environ, NETWORKS_LAZY=mode)
+        subprocess.check_call([sys.executable, 'profile_startup.py'], env=env)
+
+
+def write_synthetic_artists(directory, n=1250065, m=5000000, chunk=500000):
+    """CSV files of `n` artists with Spotify style ids and `m` random collaborations between them."""
+    rng = np.random.RandomState(0)
+    alphabet = np.frombuffer(b'0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ', dtype=np.uint8)
+    ids = alphabet[rng.randint(0, 62, size=(n, 22))].view('S22').ravel().astype(str)
+    artists_path, edges_path = os.path.join(directory, 'artists.csv'), os.path.join(directory, 'edges.csv')
+    for start in range(0, n, chunk):
+        block = ids[start:start + chunk]
+        pd.DataFrame({'id': block, 'name': np.char.add('Artist ', np.arange(start, start + len(block)).astype(str)),
+                      'popularity': rng.binomial(100, 0.2, len(block)), 'followers': rng.geometric(1e-4, len(block)),
+                      'genre': rng.choice(['pop', 'rock', 'classical', 'jazz', 'hip hop'], len(block))}
+                     ).to_csv(artists_path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    for start in range(0, m, chunk):
+        size = min(chunk, m - start)
+        pd.DataFrame({'source': ids[rng.randint(0, n, size)], 'target': ids[rng.randint(0, n, size)]}
+                     ).to_csv(edges_path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return artists_path, edges_path
+
+
+def bench_ingest(n=1250065, m=5000000):
+    print("Streaming ingest of a synthetic artist graph (%d artists, %d edges)" % (n, m))
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        artists_path, edges_path = write_synthetic_artists(directory, int(n), int(m))
+        print("  CSVs written in %.1f s: artists %d MB, edges %d MB" % (
+            time.perf_counter() - start, os.path.getsize(artists_path) // 2**20, os.path.getsize(edges_path) // 2**20))
+        for mode in ['igraph', 'stream']:
+            sys.stdout.flush()
+            subprocess.check_call([sys.executable, __file__, '_ingest', mode, artists_path, edges_path,
+                                   os.path.join(directory, 'full.graph')])
+        check_ingested(os.path.join(directory, 'full.graph'))
+
+
+def ingest_once(mode, artists_path, edges_path, path):
+    import resource
+    start = time.perf_counter()
+    if mode == 'stream':
+        from ingest import ingest
+        ingest(artists_path, edges_path, path)
+    else:
+        # Everything in memory at once, the way the core graph was built
+        artists = pd.read_csv(artists_path, dtype={'id': str, 'name': str}, keep_default_na=False)
+        edges = pd.read_csv(edges_path, dtype=str)
+        vertex = {artist: i for i, artist in enumerate(artists['id'])}
+        G = ig.Graph(n=len(artists), edges=[(vertex[s], vertex[t]) for s, t in zip(edges['source'], edges['target']) if s != t])
+        G.vs['name'], G.vs['Artist'] = list(artists['id']), list(artists['name'])
+        G.vs['Popularity'], G.vs['Followers'] = list(artists['popularity']), list(artists['followers'])
+    seconds = time.perf_counter() - start
+    lines = sum(1 for _ in open(edges_path)) - 1
+    print("  %-7s %6.1f s, %9.0f edges/s, peak RSS %5d MB" % (
+        mode, seconds, lines / seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024))
+
+
+def check_ingested(path):
+    """Compare the stored CSR and one popularity subgraph against scipy."""
+    import scipy.sparse as sp
+    from edges import csr_subgraph
+    from graphstore import ColumnarGraph
+    G = ColumnarGraph(path)
+    indptr, indices = G.csr()
+    edges = G.get_edgelist()
+    # scipy sums repeated collaborations into one entry, so compare as matrices
+    A = sp.coo_matrix((np.ones(2 * len(edges)), (np.concatenate([edges[:, 0], edges[:, 1]]),
+                                                 np.concatenate([edges[:, 1], edges[:, 0]]))), shape=(G.n, G.n)).tocsr()
+    assert (sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=A.shape) != A).nnz == 0
+    vertices = np.flatnonzero(G.vs['Popularity'] >= 25)
+    start = time.perf_counter()
+    sub_indptr, sub_indices = csr_subgraph(indptr, indices, vertices)
+    seconds = time.perf_counter() - start
+    B = sp.csr_matrix((np.ones(len(sub_indices)), sub_indices, sub_indptr), shape=(len(vertices), len(vertices)))
+    assert (B != A[vertices][:, vertices]).nnz == 0
+    print("  popularity >= 25 subgraph: %d artists, %d edges in %.0f ms" % (len(vertices), len(sub_indices) // 2, 1000 * seconds))
+
+
+def synthetic_artist_graph(n=200000, m=2000000, seed=0):
+    """CSR adjacency and popularity of a random graph in which popular artists collaborate more."""
+    from edges import csr_from_edges
+    rng = np.random.RandomState(seed)
+    popularity = rng.binomial(100, 0.25, n)
+    weights = np.exp(popularity / 12.0)
+    edges = rng.choice(n, size=(m, 2), p=weights / weights.sum())
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    return csr_from_edges(edges, n) + (popularity,)
+
+
+def bench_centrality():
+    from centrality import CentralityEngine, THRESHOLDS
+    from graphstore import ColumnarGraph
+
+    core = ColumnarGraph('data/spotify_core_graph.graph')
+    graphs = [('spotify_core_graph', core.csr() + (core.vs['Popularity'],)),
+              ('synthetic 200000 artists', synthetic_artist_graph())]
+    for name, (indptr, indices, popularity) in graphs:
+        print("Eigenvector centrality over the %d slider thresholds, %s (%d edges)" % (len(THRESHOLDS), name, len(indices) // 2))
+        engine = CentralityEngine(indptr, indices, popularity)
+        vertices = [len(engine.vertices(threshold)) for threshold in THRESHOLDS]
+        print("  subgraphs of %d to %d artists" % (min(vertices), max(vertices)))
+
+        rows = np.repeat(np.arange(len(popularity)), np.diff(indptr))
+        G = ig.Graph(n=len(popularity), edges=np.stack([rows, indices], axis=1)[rows < indices].tolist())
+        start = time.perf_counter()
+        for threshold in THRESHOLDS:
+            G.induced_subgraph(list(engine.vertices(threshold))).eigenvector_centrality(scale=False)
+        baseline = time.perf_counter() - start
+        report("igraph, first eigenvector only", baseline)
+
+        runs = {}
+        for label, method, warm in [('arpack, cold', 'arpack', False), ('arpack, warm-started', 'arpack', True),
+                                    ('lobpcg, warm-started', 'lobpcg', True)]:
+            engine = CentralityEngine(indptr, indices, popularity, method)
+            start = time.perf_counter()
+            runs[label] = list(engine.sweep(THRESHOLDS, warm=warm))
+            report(label, time.perf_counter() - start, baseline)
+        pairs = list(zip(runs['arpack, warm-started'], runs['arpack, cold']))
+        print("  largest relative difference between warm and cold leading eigenvalues: %.1e"
+              % max(abs(warm.values[0] - cold.values[0]) / max(cold.values[0], 1) for warm, cold in pairs))
+        # Where the leading eigenvalue is repeated (e.g. equal components) the eigenvector is not unique
+        unique = [(warm, cold) for warm, cold in pairs if cold.values[0] - cold.values[1] > 1e-6 * cold.values[0]]
+        print("  largest difference between their first eigenvectors, at the %d thresholds where it is unique: %.1e"
+              % (len(unique), max(np.abs(warm.first - cold.first).max() for warm, cold in unique)))
+
+        # One step of the slider in the middle of the popularity range, the way a live callback solves it
+        middle = np.median(popularity)
+        engine = CentralityEngine(indptr, indices, popularity)
+        previous = engine.solve(middle - 0.5)
+        seconds, _ = timed(engine.solve, middle + 0.5, previous, repeat=3)
+        report("live slider step %g -> %g (%d artists)" % (middle - 0.5, middle + 0.5, len(engine.vertices(middle + 0.5))), seconds)
+
+
+def bench_sweep():
+    from centrality import CentralityEngine, PopularitySweep, THRESHOLDS
+    from graphstore import ColumnarGraph
+
+    core = ColumnarGraph('data/spotify_core_graph.graph')
+    for name, (indptr, indices, popularity) in [('spotify_core_graph', core.csr() + (core.vs['Popularity'],)),
+                                                ('synthetic 200000 artists', synthetic_artist_graph())]:
+        print("Centrality sweep over the %d slider thresholds, %s" % (len(THRESHOLDS), name))
+        start = time.perf_counter()
+        independent = list(CentralityEngine(indptr, indices, popularity).sweep(THRESHOLDS, warm=False))
+        baseline = time.perf_counter() - start
+        report("independent solves", baseline)
+        start = time.perf_counter()
+        list(CentralityEngine(indptr, indices, popularity).sweep(THRESHOLDS))
+        report("subgraph solves warm-started upwards", time.perf_counter() - start, baseline)
+        start = time.perf_counter()
+        sweep = PopularitySweep(indptr, indices, popularity)
+        setup = time.perf_counter() - start
+        swept = list(sweep.sweep(THRESHOLDS))
+        report("incremental sweep downwards", time.perf_counter() - start, baseline)
+        report("  ranking artists and edges, once", setup)
+
+        error = 0
+        for cold, result in zip(independent, reversed(swept)):
+            order = np.argsort(result.vertices)
+            assert np.array_equal(result.vertices[order], cold.vertices)
+            error = max(error, abs(result.values[0] - cold.values[0]))
+            if cold.values[0] - cold.values[1] > 1e-6 * cold.values[0]:
+                error = max(error, np.abs(result.first[order] - cold.first).max())
+        print("  largest difference from the independent solves: %.1e" % error)
+
+
+def bench_batch(n=50000, m=500000):
+    from graphstore import write_graph
+
+    cores = os.cpu_count()
+    counts = sorted(set([1, 2] + [count for count in [4, 8, 16] if count <= cores]))
+    print("Batch centrality tables over a process pool (%d CPUs here)" % cores)
+    with tempfile.TemporaryDirectory() as directory:
+        indptr, indices, popularity = synthetic_artist_graph(n, m)
+        rows = np.repeat(np.arange(n), np.diff(indptr))
+        path = os.path.join(directory, 'synthetic.graph')
+        write_graph(path, np.stack([rows, indices], axis=1)[rows < indices], n, False,
+                    {'name': ['artist%d' % i for i in range(n)], 'Artist': ['Artist %d' % i for i in range(n)],
+                     'Popularity': popularity, 'Followers': np.zeros(n, dtype=np.int64)},
+                    arrays={'csr/indptr': indptr, 'csr/indices': indices})
+        print("  %d artists, %d edges; workers map the %d MB file instead of unpickling the adjacency"
+              % (n, len(indices) // 2, os.path.getsize(path) // 2**20))
+        baseline = None
+        for count in counts:
+            start = time.perf_counter()
+            subprocess.check_call([sys.executable, '-W', 'ignore', 'centrality.py', '--graph', path, '--independent',
+                                   '--processes', str(count), '--out', os.path.join(directory, str(count))],
+                                  stdout=subprocess.DEVNULL)
+            seconds = time.perf_counter() - start
+            baseline = baseline or seconds
+            report("%d process%s" % (count, "es" if count > 1 else ""), seconds, baseline if 1 < count <= cores else None)
+        # With fewer CPUs than workers the pool cannot speed up, so also project the scaling from
+        # the time of each threshold's solve, handed out in order to whichever worker is free first
+        from centrality import CentralityEngine, THRESHOLDS
+        engine = CentralityEngine(indptr, indices, popularity)
+        times = [timed(engine.solve, threshold, None, False, repeat=1)[0] for threshold in THRESHOLDS]
+        for count in [2, 4, 8, 16]:
+            free = np.zeros(count)
+            for seconds in times:
+                free[np.argmin(free)] += seconds
+            print("  projected with %2d CPUs: %.1fx (solves only)" % (count, sum(times) / free.max()))
+
+        # Artists tied in centrality may be listed in any order, so compare the values
+        tables = [pd.read_csv(os.path.join(directory, str(count), 'top100results.csv')).sort_values(['Threshold', 'Centraility'])
+                  for count in counts]
+        for table in tables[1:]:
+            np.testing.assert_allclose(table['Centraility'].values, tables[0]['Centraility'].values, atol=1e-8)
+
+
+# The genre averages and plot the Spotify tab used before GenreAverages
+def legacy_genre_averages(rows):
+    grouped = rows.groupby('Eigenvector')
+    return {eigenvector: grouped.get_group(eigenvector).groupby('Genre').apply(
+                lambda x: x.groupby('Threshold')['Centraility'].mean()).reset_index().melt(id_vars='Genre', value_name='Centrality')
+            for eigenvector in ['First', 'Second']}
+
+
+def legacy_plot_first(first_average, threshold):
+    import plotly.express as px, plotly.graph_objs as go
+    fig = px.line(first_average, x="Threshold", y="Centrality", title='First Eigenvector (Eigencentraility)', color='Genre',
+                  labels=dict(Centrality="Average Group Centrality", Threshold="Popularity Threshold"))
+    choice = first_average.set_index('Threshold').loc[threshold].sort_values('Centrality').iloc[-1]
+    return fig.add_trace(go.Scatter(x=[threshold], y=[choice.Centrality], marker={'size': 20},
+                                    hovertext=["Average Centrality of\nMost Central Group of\nArtists at threshold %d" % threshold],
+                                    showlegend=False))
+
+
+def bench_genre_averages(genres=6, artists=100):
+    from centrality import THRESHOLDS
+    from spotify import GenreAverages
+
+    rng = np.random.RandomState(0)
+    size = 2 * len(THRESHOLDS) * artists
+    rows = pd.DataFrame({'Eigenvector': np.repeat(['First', 'Second'], size // 2),
+                         'Genre': rng.choice(['genre %d' % i for i in range(genres)], size),
+                         'Threshold': np.tile(np.repeat(list(THRESHOLDS), artists), 2),
+                         'Centraility': rng.rand(size)})
+    print("Genre average plots (%d genres, %d thresholds, %d rows)" % (genres, len(THRESHOLDS), len(rows)))
+    # The old code needs every genre at every threshold, or groupby.apply returns a Series melt() mangles
+    before, old = timed(legacy_genre_averages, rows, repeat=3)
+    report("build: groupby.apply + melt", before)
+    after, new = timed(lambda: GenreAverages(rows[rows['Eigenvector'] == 'First'], 'First Eigenvector (Eigencentraility)',
+                                             "Average Centrality of\nMost Central Group of\nArtists at threshold %d"), repeat=3)
+    report("build: dense array, both eigenvectors", 2 * after, before)
+
+    thresholds = list(THRESHOLDS)
+    before, _ = timed(lambda: [legacy_plot_first(old['First'], t) for t in thresholds], repeat=1)
+    after, _ = timed(lambda: [new.figure(t) for t in thresholds], repeat=3)
+    report("callback: px.line + loc", before / len(thresholds))
+    report("callback: shared lines + marker", after / len(thresholds), before / len(thresholds))
+    before, _ = timed(lambda: [encode(legacy_plot_first(old['First'], t)) for t in thresholds], repeat=1)
+    after, _ = timed(lambda: [encode(new.figure(t)) for t in thresholds], repeat=3)
+    report("callback and JSON: px.line + loc", before / len(thresholds))
+    report("callback and JSON: shared lines + marker", after / len(thresholds), before / len(thresholds))
+    for t in thresholds:
+        choice = old['First'].set_index('Threshold').loc[t].dropna().sort_values('Centrality').iloc[-1]
+        assert np.isclose(new.figure(t)['data'][-1]['y'][0], choice.Centrality)
+
+
+# A link for turning response sizes into transfer times
+LINK_MBIT, ROUND_TRIP = 20, 0.04
+LABOUR_SLIDER = [i / 10 for i in range(11)]
+
+# Times assets/threshold.js over the labour slider on the store the layout sent
+THRESHOLD_JS = """
+global.window = {};
+require(process.argv[1]);
+var layout = JSON.parse(require('fs').readFileSync(process.argv[2]));
+var props = {};
+(function find(node) {
+    if (Array.isArray(node)) { node.forEach(find); return; }
+    if (node && typeof node === 'object') {
+        if (node.props && (node.props.id === 'labour-edges' || node.props.id === 'labour-nodes')) props[node.props.id] = node.props;
+        for (var key in node) find(node[key]);
+    }
+})(layout);
+var slider = JSON.parse(process.argv[3]), repeat = 200, edges = 0;
+var start = process.hrtime.bigint();
+for (var r = 0; r < repeat; r++) {
+    slider.forEach(function(value) {
+        edges += window.dash_clientside.networks.labour_figure(value, props["labour-edges"].data, null).data[0].x.length;
+    });
+}
+console.log(Number(process.hrtime.bigint() - start) / 1e6 / repeat / slider.length);
+"""
+
+
+def bench_clientside():
+    print("Labour edge slider: server callback vs clientside thresholding")
+    print("  perceived latency adds transfer over a %d Mbit/s link with a %d ms round trip" % (LINK_MBIT, 1000 * ROUND_TRIP))
+    for mode, name in [('0', 'server callback'), ('1', 'NETWORKS_CLIENTSIDE=1')]:
+        print(" %s" % name)
+        sys.stdout.flush()
+        env = dict(os.environ, NETWORKS_CLIENTSIDE=mode, NETWORKS_CACHE_MB='0')
+        subprocess.check_call([sys.executable, __file__, '_slider_requests'], env=env)
+
+
+def update_request(output, inputs, state=()):
+    """The body Dash posts to /_dash-update-component for one callback."""
+    def prop(item):
+        id, name, value = item
+        return {'id': id, 'property': name, 'value': value}
+    id, name = output.split('.')
+    return {'output': output, 'outputs': {'id': id, 'property': name}, 'changedPropIds': [],
+            'inputs': [prop(item) for item in inputs], 'state': [prop(item) for item in state]}
+
+
+def labour_move(value, color='unemployment', region='Australia', resolution=1.0):
+    """The request for the labour graph after its edge slider moved to `value`."""
+    return update_request('labour-graph.figure', [('color_choice', 'value', color),
+                                                  ('labour_edge_threshold', 'value', value),
+                                                  ('size_choice', 'value', 'total_pop'),
+                                                  ('region_choice', 'value', region),
+                                                  ('resolution_choice', 'value', resolution),
+                                                  ('labour-graph', 'relayoutData', None)])
+
+
+def slider_requests():
+    from app import app
+    from clientside import CLIENTSIDE
+
+    client = app.server.test_client()
+    start = time.perf_counter()
+    layout = client.get('/_dash-layout').data
+    print("  page layout: %8.1f KB in %6.2f ms" % (len(layout) / 1e3, 1000 * (time.perf_counter() - start)))
+
+    def post(body):
+        start = time.perf_counter()
+        response = client.post('/_dash-update-component', json=body)
+        return time.perf_counter() - start, len(response.data)
+
+    if not CLIENTSIDE:
+        moves = [labour_move(value) for value in LABOUR_SLIDER]
+        seconds, sizes = zip(*[post(body) for body in moves for _ in range(5)])
+        mean, size = np.mean(seconds), np.mean(sizes)
+        print("  slider move: 1 request, %8.1f KB, %6.2f ms server time (p95 %.2f ms), %.0f requests/s per worker"
+              % (size / 1e3, 1000 * mean, 1000 * np.percentile(seconds, 95), 1 / mean))
+        print("  perceived latency per move: %6.1f ms" % (1000 * (mean + ROUND_TRIP + 8 * size / (LINK_MBIT * 1e6))))
+        return
+
+    nodes = update_request('labour-nodes.data', [('color_choice', 'value', 'unemployment'), ('size_choice', 'value', 'total_pop'),
+                                                 ('region_choice', 'value', 'Australia'), ('resolution_choice', 'value', 1.0)])
+    seconds, size = post(nodes)
+    print("  colour or size change: 1 request, %8.1f KB, %6.2f ms server time" % (size / 1e3, 1000 * seconds))
+    print("  slider move: 0 requests, 0 KB, 0 ms server time")
+    with tempfile.NamedTemporaryFile(suffix='.json') as saved:
+        saved.write(layout)
+        saved.flush()
+        try:
+            output = subprocess.check_output(['node', '-e', THRESHOLD_JS, os.path.abspath('assets/threshold.js'),
+                                              saved.name, json.dumps(LABOUR_SLIDER)])
+        except OSError:
+            print("  (node is not installed, so the clientside callback was not timed)")
+            return
+    print("  perceived latency per move: %6.2f ms in threshold.js, before plotly draws" % float(output))
+
+
+def unlimited(build):
+    """`build()` without WebGL or the edge budget: SVG splines for every edge, as before."""
+    import edges
+    limits = edges.WEBGL_EDGES, edges.EDGE_BUDGET
+    edges.WEBGL_EDGES = edges.EDGE_BUDGET = float('inf')
+    try:
+        return build()
+    finally:
+        edges.WEBGL_EDGES, edges.EDGE_BUDGET = limits
+
+
+def renderer_figures():
+    """(name, figure drawn as before, as now, and zoomed into the middle quarter) for big networks."""
+    from explain import explain_make_network, graph_pool
+    from labour import labourNetwork
+    from spotify import spotify
+
+    G = labourNetwork.four_digit_G
+    x, y = np.asarray(G.vs['x']), np.asarray(G.vs['y'])
+    middle = ((np.percentile(x, 25), np.percentile(x, 75)), (np.percentile(y, 25), np.percentile(y, 75)))
+    build = lambda: labourNetwork.get_updated_graph('louvain community', 0, 'None')
+    yield ('labour, every edge', unlimited(build), build(),
+           labourNetwork.get_updated_graph('louvain community', 0, 'None', middle))
+
+    everyone = np.arange(len(spotify.x))
+    build = lambda: spotify.get_labour_figure(everyone, np.zeros(len(everyone)))
+    yield ('spotify core, every artist', unlimited(build), build(), None)
+
+    # The pool keeps a graph's edge trace, so each figure is made afresh
+    build = lambda: graph_pool.entries.clear() or explain_make_network(500, 0.3, 'Erdős–Rényi Random Graph', 'None', 0)
+    yield ('explain, 500 nodes, p = 0.3', unlimited(build), build(), None)
+
+
+def edge_count(figure):
+    x = figure['data'][0]['x']
+    return len(x) // 3
+
+
+def bench_renderer():
+    from edges import EDGE_BUDGET, WEBGL_EDGES
+
+    print("Network figures: SVG splines vs WebGL past %d edges, at most %d edges drawn" % (WEBGL_EDGES, EDGE_BUDGET))
+    for name, before, after, zoomed in renderer_figures():
+        print(" %s" % name)
+        for label, figure in [('SVG spline, every edge', before), ('renderer', after), ('renderer, zoomed to middle', zoomed)]:
+            if figure is None:
+                continue
+            seconds, response = timed(encode, figure, repeat=3)
+            print("  %-28s %-9s %6d edges %9.1f KB %8.2f ms to encode"
+                  % (label, figure['data'][0]['type'], edge_count(figure), len(response) / 1e3, 1000 * seconds))
+
+
+# Frame times can only be measured in a browser, with the plotly.js dash 1.1.1 ships
+FRAMES_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><script src="https://cdn.plot.ly/plotly-1.49.1.min.js"></script></head>
+<body><div id="graph" style="width: 900px; height: 600px"></div><pre id="out"></pre>
+<script>
+var figures = %s;
+function median(values) { values.sort(function(a, b) { return a - b; }); return values[values.length >> 1]; }
+function frame() { return new Promise(function(resolve) { requestAnimationFrame(function() { resolve(); }); }); }
+async function run() {
+    var out = document.getElementById('out');
+    for (var i = 0; i < figures.length; i++) {
+        var start = performance.now();
+        await Plotly.newPlot('graph', figures[i].figure.data, figures[i].figure.layout);
+        await frame();
+        var draw = performance.now() - start, frames = [];
+        var range = document.getElementById('graph')._fullLayout.xaxis.range.slice();
+        for (var step = 0; step < 30; step++) {
+            start = performance.now();
+            var shift = (range[1] - range[0]) * 0.01 * (step %% 2 ? -1 : 1);
+            await Plotly.relayout('graph', {'xaxis.range': [range[0] + shift, range[1] + shift]});
+            await frame();
+            frames.push(performance.now() - start);
+        }
+        out.textContent += figures[i].name + ': first draw ' + draw.toFixed(1) + ' ms, pan frame median ' +
+            median(frames).toFixed(1) + ' ms\\n';
+    }
+}
+run();
+</script></body></html>
+"""
+
+
+def bench_frames(path=os.path.join(tempfile.gettempdir(), 'frames.html')):
+    print("Writing %s: open it in a browser for first draw and pan frame times" % path)
+    figures = []
+    for name, before, after, zoomed in renderer_figures():
+        figures += [{'name': name + ', SVG spline', 'figure': before}, {'name': name + ', renderer', 'figure': after}]
+    with open(path, 'w') as page:
+        page.write(FRAMES_PAGE % encode(figures))
+    print("  %d figures, %.1f MB" % (len(figures), os.path.getsize(path) / 1e6))
+
+
+def edge_length_ratio(edgelist, positions):
+    """Mean edge length over mean distance between all nodes; lower means tighter clusters."""
+    edges = np.asarray(edgelist).reshape(-1, 2)
+    lengths = np.sqrt(((positions[edges[:, 0]] - positions[edges[:, 1]]) ** 2).sum(1))
+    pairs = np.sqrt(((positions[:, None] - positions[None]) ** 2).sum(-1))
+    return lengths.mean() / pairs[np.triu_indices(len(positions), 1)].mean()
+
+
+def seeded_graph(build, seed):
+    from graphlayout import seeded
+    with seeded(seed):
+        return build()
+
+
+def bench_graph_layout():
+    from explain import explain_generate
+    from graphlayout import ALGORITHMS, LayoutService, first_nodes
+
+    print("Explain tab layouts, per callback")
+    for name, p, style in [('Erdős–Rényi, 100 nodes, p = 0.5', 0.5, 'Erdős–Rényi Random Graph'),
+                           ('Barabási–Albert, 100 nodes, m = 5', 0.05, 'Barabási–Albert Random Graph'),
+                           ('Star, 100 nodes', 0, 'Star')]:
+        G = explain_generate(100, p, style, 0)
+        print(" %s (%d edges)" % (name, G.ecount()))
+        before, _ = timed(lambda: G.layout_fruchterman_reingold(), repeat=5)
+        report("igraph FR on every call", before)
+        service = LayoutService('fr')
+        cold, _ = timed(lambda: LayoutService('fr').layout(G.get_edgelist(), 100, seed=0), repeat=5)
+        report("layout service, first time", cold, before)
+        service.layout(G.get_edgelist(), 100, seed=0)
+        cached, _ = timed(lambda: service.layout(G.get_edgelist(), 100, seed=0), repeat=5)
+        report("layout service, cached", cached, before)
+
+        def warm():
+            # With its first 96 nodes laid out already, as scrubbing the slider leaves them
+            service = LayoutService('fr')
+            service.layout(first_nodes(G.get_edgelist(), 96), 96, seed=0)
+            start = time.perf_counter()
+            positions = service.layout(G.get_edgelist(), 100, seed=0, grown=True)
+            return time.perf_counter() - start, positions
+        warm_seconds = min(warm()[0] for _ in range(5))
+        report("warm start from 96 nodes", warm_seconds, before)
+        cold_positions = LayoutService('fr').layout(G.get_edgelist(), 100, seed=0)
+        print("  edge length ratio: cold %.3f, warm %.3f" % (edge_length_ratio(G.get_edgelist(), cold_positions),
+                                                            edge_length_ratio(G.get_edgelist(), warm()[1])))
+
+    G = ig.Graph.Read_Pickle('data/skill_scape_graph.pickle')
+    print("Labour skill graph new layout (%d nodes, %d weighted edges)" % (G.vcount(), G.ecount()))
+    for algorithm in ALGORITHMS:
+        for iterations in [500, 100]:
+            seconds, positions = timed(lambda: ALGORITHMS[algorithm](G.get_edgelist(), G.vcount(), G.es['weight'],
+                                                                    iterations=iterations, seed=0), repeat=1)
+            print("  %-6s %4d iterations %10.2f ms, edge length ratio %.3f"
+                  % (algorithm, iterations, 1000 * seconds, edge_length_ratio(G.get_edgelist(), positions)))
+
+
+# How explain_make_network made every figure before the graph pool
+def legacy_explain_network(n, p, style, color, seed):
+    G = seeded_graph(lambda: {'Erdős–Rényi Random Graph': lambda: ig.Graph.Erdos_Renyi(n, p),
+                              'Barabási–Albert Random Graph': lambda: ig.Graph.Barabasi(n, int(p * n)),
+                              'Star': lambda: ig.Graph.Star(n)}[style](), seed)
+    layout = np.array(G.layout_fruchterman_reingold().coords)
+    centrality = {'None': lambda: None, 'Eigencentraility': G.eigenvector_centrality,
+                  'betweenness': G.betweenness, 'closeness': G.closeness}[color]()
+    return edge_segments(G.get_edgelist(), layout[:, 0], layout[:, 1]), centrality
+
+
+def bench_graph_pool():
+    from explain import GraphPool
+    import explain
+
+    colours = ['None', 'Eigencentraility', 'betweenness', 'closeness']
+    print("Introduction tab: changing only the centrality dropdown, 100 nodes")
+    for style in ['Erdős–Rényi Random Graph', 'Barabási–Albert Random Graph', 'Star']:
+        print(" %s" % style)
+        before, _ = timed(lambda: [legacy_explain_network(100, 0.5, style, colour, 0) for colour in colours], repeat=3)
+        report("new graph, layout and centrality", before / len(colours))
+
+        def pooled():
+            explain.graph_pool = GraphPool()
+            explain.explain_make_network(100, 0.5, style, 'None', 0)
+            start = time.perf_counter()
+            for colour in colours[1:] + colours[:1]:
+                explain.explain_make_network(100, 0.5, style, colour, 0)
+            return time.perf_counter() - start
+        after = min(pooled() for _ in range(3))
+        report("pooled graph and layout", after / len(colours), before / len(colours))
+        a = explain.explain_make_network(100, 0.5, style, 'None', 0)
+        b = explain.explain_make_network(100, 0.5, style, 'betweenness', 0)
+        assert a['data'][0] is b['data'][0] and np.array_equal(a['data'][1]['x'], b['data'][1]['x'])
+
+
+def bench_path_centrality():
+    import scipy.stats as ss
+    from edges import csr_from_edges
+    from pathcentrality import exact_path_centrality, normalized_betweenness, path_centrality
+
+    def exact_igraph(G):
+        return np.array(G.betweenness()), np.array(G.closeness())
+
+    graphs = [('explain, Erdős–Rényi 100 nodes, p = 1', seeded_graph(lambda: ig.Graph.Erdos_Renyi(100, 1.0), 0)),
+              ('labour skill graph', ig.Graph.Read_Pickle('data/skill_scape_graph.pickle')),
+              ('synthetic Erdős–Rényi', seeded_graph(lambda: ig.Graph.Erdos_Renyi(n=5000, m=25000), 0))]
+    print("Betweenness and closeness (igraph vs batched Brandes searches)")
+    for name, G in graphs:
+        n = G.vcount()
+        print(" %s (%d nodes, %d edges)" % (name, n, G.ecount()))
+        csr = csr_from_edges(G.get_edgelist(), n)
+        before, (betweenness, closeness) = timed(exact_igraph, G, repeat=1 if n > 1000 else 3)
+        report("igraph, exact", before)
+        after, result = timed(path_centrality, *csr, repeat=1 if n > 1000 else 3)
+        assert np.allclose(result.betweenness, betweenness) and np.allclose(result.closeness, closeness, equal_nan=True)
+        report("batched searches, exact", after, before)
+        seconds, pooled = timed(lambda: exact_path_centrality(csr, processes=2), repeat=1)
+        assert np.allclose(pooled.betweenness, betweenness)
+        report("batched searches, exact, 2 processes", seconds, before)
+        if n < 1000:
+            continue
+
+        pairs = (n - 1) * (n - 2) / 2
+        distance = 1 / closeness
+        for budget in [0.25, 1, 4]:
+            estimate = path_centrality(*csr, budget=budget)
+            error = np.abs(normalized_betweenness(estimate) - betweenness / pairs).max()
+            distance_error = np.nanmax(np.abs(1 / estimate.closeness - distance))
+            print("  budget %5.2f s: %5d sources in %5.2f s, betweenness error %.5f (bound %.4f), "
+                  "mean distance error %.3f (bound %.3f), rank correlation %.3f"
+                  % (budget, estimate.sources, estimate.seconds, error, estimate.betweenness_error,
+                     distance_error, estimate.distance_error, ss.spearmanr(estimate.betweenness, betweenness)[0]))
+
+
+def bench_metrics():
+    print("Callback instrumentation: the same requests with NETWORKS_METRICS=0 and 1")
+    for mode in ['0', '1']:
+        sys.stdout.flush()
+        env = dict(os.environ, NETWORKS_METRICS=mode, NETWORKS_CLIENTSIDE='0')
+        subprocess.check_call([sys.executable, __file__, '_metrics_requests'], env=env)
+
+
+def metrics_requests(repeat=200):
+    from app import app, callback_metrics
+
+    client = app.server.test_client()
+    labels = [update_request('color_choice_output.children', [('color_choice', 'value', 'unemployment')])]
+    moves = [labour_move(value) for value in LABOUR_SLIDER]
+    print(" NETWORKS_METRICS=%d" % (callback_metrics is not None))
+    for name, bodies in [('cached label callback', labels), ('labour slider move', moves)]:
+        for body in bodies:
+            client.post('/_dash-update-component', json=body)
+        seconds = []
+        for _ in range(repeat // len(bodies)):
+            for body in bodies:
+                start = time.perf_counter()
+                client.post('/_dash-update-component', json=body)
+                seconds.append(time.perf_counter() - start)
+        print("  %-30s %8.3f ms mean, %8.3f ms median" % (name, 1000 * np.mean(seconds), 1000 * np.median(seconds)))
+
+    if callback_metrics is not None:
+        start = time.perf_counter()
+        text = client.get('/metrics').data.decode('utf-8')
+        print("  /metrics: %d lines, %.1f KB in %.2f ms, e.g." % (
+            text.count('\n'), len(text) / 1e3, 1000 * (time.perf_counter() - start)))
+        for line in text.splitlines():
+            if line.startswith(('networks_callback_seconds_sum', 'networks_callback_cpu_seconds_total',
+                                'networks_callback_response_bytes_sum', 'networks_callback_cache_total')):
+                print("    " + line)
+        remote = client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.5'}).status_code
+        print("  /metrics from a remote address: HTTP %d" % remote)
+
+
+# Browser sessions dragging the explain node slider from 10 to 100 at once,
+# a request per value every SCRUB_INTERVAL seconds, against a gthread worker
+SCRUB_SESSIONS = 4
+SCRUB_INTERVAL = 0.02
+SERVER_THREADS = 16
+
+
+def bench_scrub():
+    print("Explain node slider scrubbed by %d sessions at once, a request every %d ms each, %d server threads"
+          % (SCRUB_SESSIONS, 1000 * SCRUB_INTERVAL, SERVER_THREADS))
+    for workers, timeout, name in [('0', '2', 'in the request thread'), ('1', '2', 'job pool of 1'),
+                                   ('2', '2', 'job pool of 2'), ('2', '0.1', 'job pool of 2, 0.1 s timeout')]:
+        print(" %s" % name)
+        sys.stdout.flush()
+        env = dict(os.environ, NETWORKS_JOB_WORKERS=workers, NETWORKS_JOB_TIMEOUT=timeout)
+        subprocess.check_call([sys.executable, __file__, '_scrub_requests'], env=env)
+
+
+def scrub_requests():
+    from app import app, job_runner
+
+    def move(session, n):
+        body = update_request('explain_graph.figure', [('explain_edge_prob', 'value', 0.5),
+                                                       ('explain_number_of_nodes', 'value', n),
+                                                       ('explain_graph_type', 'value', 'Erdős–Rényi Random Graph'),
+                                                       ('explain_centrality', 'value', 'betweenness'),
+                                                       ('explain_seed', 'value', None)])
+        response = app.server.test_client(use_cookies=False).post(
+            '/_dash-update-component', json=body, headers={'Cookie': 'networks_session=%d' % session})
+        return response.status_code, time.perf_counter()
+
+    values = list(range(10, 101))
+    start = time.perf_counter()
+    requests = []
+    with ThreadPoolExecutor(SERVER_THREADS) as server:
+        for step, n in enumerate(values):
+            delay = start + step * SCRUB_INTERVAL - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            for session in range(SCRUB_SESSIONS):
+                requests.append((session, step, start + step * SCRUB_INTERVAL, server.submit(move, session, n)))
+    last = start + (len(values) - 1) * SCRUB_INTERVAL
+
+    latency = np.array([future.result()[1] - sent for _, _, sent, future in requests])
+    statuses = [future.result()[0] for _, _, _, future in requests]
+    settled = [future.result()[1] - last for session, step, _, future in requests if step == len(values) - 1]
+    print("  latency p50 %7.1f ms  p95 %7.1f ms  p99 %7.1f ms  max %7.1f ms" % tuple(
+        1000 * np.percentile(latency, [50, 95, 99, 100])))
+    print("  final figure %7.1f ms after the last move (worst session)" % (1000 * max(settled)))
+    print("  %d figures, %d answered with no update, total %.2f s" % (
+        statuses.count(200), statuses.count(204), time.perf_counter() - start))
+    if job_runner.pool is not None:
+        print("  jobs: %s" % job_runner.stats())
+
+
+def bench_compression():
+    print("Response compression for a browser sending Accept-Encoding: gzip, deflate, br")
+    for env, name in [({'NETWORKS_COMPRESS': '0'}, 'uncompressed'),
+                      ({'NETWORKS_COMPRESS_CACHE_MB': '0'}, 'compressed on every request, as Flask-Compress does'),
+                      ({}, 'compressed once, cached by content')]:
+        print(" %s" % name)
+        sys.stdout.flush()
+        subprocess.check_call([sys.executable, __file__, '_compressed_requests'], env=dict(os.environ, **env))
+
+
+def compressed_requests(repeat=5):
+    import gzip
+    from app import app, compressed_cache
+
+    client = app.server.test_client()
+    headers = {'Accept-Encoding': 'gzip, deflate, br'}
+    labour = [labour_move(value) for value in LABOUR_SLIDER]
+    spotify = [update_request('spotify-graph.figure', [('spotify_pop_threshold', 'value', threshold)])
+               for threshold in range(70)]
+
+    def post(body):
+        return client.post('/_dash-update-component', json=body, headers=headers)
+
+    for name, send in [('page layout', [lambda: client.get('/_dash-layout', headers=headers)]),
+                       ('labour slider, 11 positions', [lambda body=body: post(body) for body in labour]),
+                       ('spotify slider, 70 thresholds', [lambda body=body: post(body) for body in spotify])]:
+        for request in send:
+            response = request()
+        seconds, cpu, sizes = [], [], []
+        for _ in range(repeat):
+            for request in send:
+                start, start_cpu = time.perf_counter(), time.thread_time()
+                response = request()
+                seconds.append(time.perf_counter() - start)
+                cpu.append(time.thread_time() - start_cpu)
+                sizes.append(len(response.data))
+        if response.headers.get('Content-Encoding') == 'gzip':
+            json.loads(gzip.decompress(response.data))
+        print("  %-32s %9.1f KB sent, %7.2f ms, %7.2f ms CPU per request" % (
+            name, np.mean(sizes) / 1e3, 1000 * np.mean(seconds), 1000 * np.mean(cpu)))
+    if compressed_cache is not None:
+        print("  compressed cache: %s" % compressed_cache.stats())
+
+
+def synthetic_regional_employment(path, G, regions, seed=0):
+    """A regional_employment.csv of `regions` regions, each employed like the nation with noise and gaps."""
+    rng = np.random.RandomState(seed)
+    national = np.asarray(G.vs['total_pop'], dtype=float) * 1000
+    employment = rng.lognormal(0, 1, (regions, len(national))) * national / regions
+    employment[rng.uniform(size=employment.shape) < 0.3] = 0
+    region, job = np.nonzero(employment)
+    names = np.array(['Region %04d' % r for r in range(regions)])
+    pd.DataFrame({'region': names[region], 'occupation': np.asarray(G.vs['name'])[job],
+                  'employment': np.round(employment[region, job])}).to_csv(path, index=False)
+
+
+def legacy_embeddedness(G, shares):
+    # One job at a time over its neighbours, as a per-region script would
+    return np.array([sum(G.es[e]['weight'] * shares[G.es[e].target if G.es[e].source == j else G.es[e].source]
+                         for e in G.incident(j)) for j in range(G.vcount())])
+
+
+def bench_embeddedness():
+    from labour import labourNetwork
+    from regional import EmbeddednessEngine, load_employment, skill_adjacency
+
+    G = labourNetwork.four_digit_G
+    print("Regional embeddedness over the %d jobs of the labour graph" % G.vcount())
+    A = skill_adjacency(G.get_edgelist(), G.es['weight'], G.vcount())
+    with tempfile.TemporaryDirectory() as directory:
+        for regions in [100, 500, 2300]:
+            path = os.path.join(directory, 'regional_employment.csv')
+            synthetic_regional_employment(path, G, regions)
+            load_seconds, employment = timed(load_employment, G.vs['name'], G.vs['total_pop'], path, repeat=1)
+            engine = EmbeddednessEngine(A, employment)
+            seconds, _ = timed(engine.update, employment)
+            print(" %d regions, %d nonzero employment counts" % (regions, employment.matrix.nnz))
+            report("read regional_employment.csv", load_seconds)
+            report("every job in every region", seconds)
+            report("per region", seconds / len(engine.regions))
+
+    # The national region, checked against the job by job sum
+    ig_graph = ig.Graph(n=G.vcount(), edges=G.get_edgelist())
+    ig_graph.es['weight'] = list(G.es['weight'])
+    national = np.asarray(G.vs['total_pop'], dtype=float)
+    legacy_seconds, legacy = timed(legacy_embeddedness, ig_graph, national / national.sum(), repeat=1)
+    embeddedness, _ = labourNetwork.embeddedness.region('Australia')
+    assert np.allclose(embeddedness, legacy)
+    report("one region, job by job over igraph", legacy_seconds)
+
+    labourNetwork.embeddedness = engine
+    region = engine.regions[-1]
+    seconds, _ = timed(labourNetwork.get_updated_graph, 'embeddedness', 0.8, 'total_pop', None, region)
+    report("labour figure coloured by one of 2300 regions", seconds)
+    from app import app
+    client = app.server.test_client()
+    moves = [labour_move(0.2, 'embeddedness', name) for name in engine.regions[1:51]]
+    start = time.perf_counter()
+    for body in moves:
+        client.post('/_dash-update-component', json=body)
+    report("region dropdown request, uncached", (time.perf_counter() - start) / len(moves))
+
+
+def legacy_complementarity(G, employment):
+    # Job by job RCA, then every pair of states over every edge
+    E = employment.matrix[1:].toarray()
+    total, job_totals, region_totals = E.sum(), E.sum(0), E.sum(1)
+    characteristic = [set(j for j in range(E.shape[1]) if job_totals[j] and region_totals[r]
+                          and E[r, j] / job_totals[j] / (region_totals[r] / total) > 1)
+                      for r in range(E.shape[0])]
+    edges = list(zip(G.get_edgelist(), G.es['weight']))
+    scores = {}
+    for r in range(len(characteristic)):
+        for s in range(r + 1, len(characteristic)):
+            a, b = characteristic[r], characteristic[s]
+            linkage = sum(w * ((u in a and v in b) + (v in a and u in b)) for (u, v), w in edges)
+            overlap = len(a & b) / max(min(len(a), len(b)), 1)
+            scores[r + 1, s + 1] = linkage / max(len(a) * len(b), 1) * (1 - overlap)
+    return scores
+
+
+def bench_complementarity():
+    from labour import labourNetwork
+    from regional import ComplementarityEngine, load_employment, skill_adjacency
+
+    G = labourNetwork.four_digit_G
+    print("RCA and complementarity of every pair of regions over the %d jobs of the labour graph" % G.vcount())
+    A = skill_adjacency(G.get_edgelist(), G.es['weight'], G.vcount())
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'regional_employment.csv')
+        for regions in [8, 100, 500, 2300]:
+            synthetic_regional_employment(path, G, regions)
+            employment = load_employment(G.vs['name'], G.vs['total_pop'], path)
+            seconds, engine = timed(ComplementarityEngine, A, employment, repeat=3)
+            rank_seconds, best = timed(engine.ranked, repeat=3)
+            print(" %d regions, %d pairs" % (regions, regions * (regions - 1) // 2))
+            report("RCA and complementarity", seconds)
+            report("ranking the pairs", rank_seconds)
+            if regions == 8:
+                legacy_seconds, legacy = timed(legacy_complementarity, G, employment, repeat=1)
+                assert all(np.isclose(legacy[pair], engine.complementarity[pair], rtol=1e-5) for pair in legacy)
+                report("RCA and complementarity, pair by pair over the edges", legacy_seconds)
+
+    labourNetwork.complementarity = engine
+    from app import app
+    client = app.server.test_client()
+    moves = [labour_move(0.2, 'rca', name) for name in engine.regions[1:51]]
+    start = time.perf_counter()
+    for body in moves:
+        client.post('/_dash-update-component', json=body)
+    report("labour figure highlighting one of 2300 regions", (time.perf_counter() - start) / len(moves))
+    print("  best pair: %s and %s, %.3f" % best[0])
+
+
+def bench_communities():
+    import communities
+    from labour import labourNetwork
+
+    G = labourNetwork.four_digit_G
+    print("Leiden communities of the labour graph at %d resolutions" % len(communities.RESOLUTIONS))
+    for processes in sorted({1, 2, os.cpu_count() or 1}):
+        seconds, result = timed(communities.sweep, 'skill_scape_graph', communities.RESOLUTIONS, communities.KEEP,
+                                processes, repeat=1)
+        report("sweep, %d process%s" % (processes, 'es' if processes > 1 else ''), seconds)
+    seconds, _ = timed(communities.sweep, 'skill_scape_graph', communities.RESOLUTIONS, (1.0, 0.5, 0.2), 1, repeat=1)
+    report("sweep over 3 edge thresholds, 1 process", seconds)
+    print("  %d x %d int16 membership matrix, %d bytes" % (result.membership.shape + (result.membership.nbytes,)))
+
+    detect_seconds, _ = timed(communities.leiden, G.get_edgelist(), G.es['weight'], G.vcount(), 2.0)
+    report("detecting one partition", detect_seconds)
+    seconds, _ = timed(labourNetwork.community_marker, 2.0, repeat=100)
+    report("looking its colours up", seconds, baseline=detect_seconds)
+
+    from app import app
+    client = app.server.test_client()
+    moves = [labour_move(0.2, 'leiden', resolution=resolution) for resolution in communities.RESOLUTIONS]
+    start = time.perf_counter()
+    for body in moves:
+        client.post('/_dash-update-component', json=body)
+    report("labour figure at a new resolution", (time.perf_counter() - start) / len(moves))
+
+
+BENCHMARKS = {
+    'edges': bench_edges,
+    'spotify-cache': bench_spotify_cache,
+    'labour-concurrency': bench_labour_concurrency,
+    'threshold': bench_threshold,
+    'payload': bench_payload,
+    '_callback_payloads': callback_payloads,
+    'startup': bench_startup,
+    'layout': bench_layout,
+    'graphstore': bench_graphstore,
+    '_load_graph': load_graph_once,
+    'ingest': bench_ingest,
+    '_ingest': ingest_once,
+    'centrality': bench_centrality,
+    'sweep': bench_sweep,
+    'batch': bench_batch,
+    'genre-averages': bench_genre_averages,
+    'clientside': bench_clientside,
+    '_slider_requests': slider_requests,
+    'renderer': bench_renderer,
+    'frames': bench_frames,
+    'graph-layout': bench_graph_layout,
+    'graph-pool': bench_graph_pool,
+    'path-centrality': bench_path_centrality,
+    'metrics': bench_metrics,
+    '_metrics_requests': metrics_requests,
+    'scrub': bench_scrub,
+    '_scrub_requests': scrub_requests,
+    'compression': bench_compression,
+    '_compressed_requests': compressed_requests,
+    'embeddedness': bench_embeddedness,
+    'complementarity': bench_complementarity,
+    'communities': bench_communities,
+}
+
+
+if __name__ == '__main__':
+    # Names starting with _ are helpers the benchmarks run in a fresh interpreter
+    if sys.argv[1:] and sys.argv[1].startswith('_'):
+        BENCHMARKS[sys.argv[1]](*sys.argv[2:])
+    else:
+        for name in sys.argv[1:] or [name for name in BENCHMARKS if not name.startswith('_')]:
+            BENCHMARKS[name]()
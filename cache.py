@@ -0,0 +1,158 @@
+import hashlib, os, pickle, sqlite3, threading, time
+from collections import OrderedDict
+from functools import wraps
+
+
+class ResponseCache():
+    """Memoizes Dash callback responses by callback name and inputs.
+
+    Entries are kept in memory up to `max_bytes` (as measured by their pickled
+    size) and evicted least recently used first. When `path` is given, every
+    response is also written to a sqlite file there, so gunicorn workers
+    started from the same Procfile share warm entries with each other and
+    across restarts. The disk tier is bounded by `max_disk_bytes`. Keys start
+    with `version`, so entries of other code, data or settings are never
+    served and age out of the disk tier.
+    """
+    def __init__(self, max_bytes=256 * 2**20, path=None, max_disk_bytes=2**30, version=''):
+        self.max_bytes = max_bytes
+        self.version = version
+        self.max_disk_bytes = max_disk_bytes
+        self.path = path
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.hits, self.disk_hits, self.misses = {}, {}, {}
+
+    def connection(self):
+        # sqlite connections cannot be shared between threads or forked workers
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            os.makedirs(self.path, exist_ok=True)
+            db = sqlite3.connect(os.path.join(self.path, 'responses.sqlite'), timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB, size INTEGER, used REAL)")
+            self.local.db = db
+        return db
+
+    def count(self, counter, name, outcome):
+        # The outcome of this thread's last lookup, for metrics.py
+        self.local.outcome = outcome
+        with self.lock:
+            counter[name] = counter.get(name, 0) + 1
+
+    def get(self, name, key, count_miss=True):
+        """(True, value) for a cached response, otherwise (False, None)."""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits[name] = self.hits.get(name, 0) + 1
+                self.local.outcome = 'hit'
+                return True, self.entries[key][0]
+
+        if self.path is not None:
+            db = self.connection()
+            row = db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                with db:
+                    db.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+                value = pickle.loads(row[0])
+                self.remember(key, value, len(row[0]))
+                self.count(self.disk_hits, name, 'disk_hit')
+                return True, value
+
+        if count_miss:
+            self.count(self.misses, name, 'miss')
+        return False, None
+
+    def put(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.remember(key, value, len(data))
+        if self.path is not None:
+            db = self.connection()
+            with db:
+                db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+                total, = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+                if total > self.max_disk_bytes:
+                    db.execute("DELETE FROM responses WHERE key IN "
+                               "(SELECT key FROM responses ORDER BY used LIMIT (SELECT COUNT(*) / 4 + 1 FROM responses))")
+
+    def remember(self, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= self.entries.popitem(last=False)[1][1]
+
+    def stats(self):
+        """Hit, disk hit and miss counts for each callback name."""
+        with self.lock:
+            names = set(self.hits) | set(self.disk_hits) | set(self.misses)
+            return {name: {'hits': self.hits.get(name, 0),
+                           'disk_hits': self.disk_hits.get(name, 0),
+                           'misses': self.misses.get(name, 0)}
+                    for name in sorted(names)}
+
+    def key(self, callback, args):
+        return repr((self.version, callback, args))
+
+    def memoize(self, name=None, cacheable=None):
+        """Decorator caching a callback's response for each set of inputs.
+
+        `cacheable` is an optional predicate on the inputs; calls it rejects
+        are always passed through, e.g. graphs generated without a seed.
+        Cached responses are shared, so callers must not modify them.
+        The decorated function's `lookup(*args)` returns (True, response) if
+        the response is cached, without computing it otherwise.
+        """
+        def decorator(function):
+            callback = name or function.__name__
+
+            @wraps(function)
+            def wrapper(*args):
+                if cacheable is not None and not cacheable(*args):
+                    self.local.outcome = 'bypass'
+                    return function(*args)
+                key = self.key(callback, args)
+                found, value = self.get(callback, key)
+                if not found:
+                    value = function(*args)
+                    self.put(key, value)
+                return value
+
+            def lookup(*args):
+                if cacheable is not None and not cacheable(*args):
+                    return False, None
+                return self.get(callback, self.key(callback, args), count_miss=False)
+
+            wrapper.lookup = lookup
+            return wrapper
+        return decorator
+
+
+def version(code=os.path.dirname(os.path.abspath(__file__)), directories=('data', 'assets')):
+    """A digest of what responses are made from: the app's modules, the files under `directories` and the NETWORKS_ settings.
+
+    Data files are told apart by size and modification time, without reading them.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for name in sorted(os.listdir(code)):
+        if name.endswith('.py'):
+            with open(os.path.join(code, name), 'rb') as module:
+                digest.update(name.encode('utf-8') + module.read())
+    for directory in directories:
+        for folder, _, names in sorted(os.walk(directory)):
+            for name in sorted(names):
+                stat = os.stat(os.path.join(folder, name))
+                digest.update(repr((os.path.join(folder, name), stat.st_size, stat.st_mtime_ns)).encode('utf-8'))
+    digest.update(repr(sorted((name, value) for name, value in os.environ.items() if name.startswith('NETWORKS_'))).encode('utf-8'))
+    return digest.hexdigest()
+
+
+callback_cache = ResponseCache(max_bytes=int(os.environ.get('NETWORKS_CACHE_MB', 256)) * 2**20,
+                               path=os.environ.get('NETWORKS_CACHE_DIR'), version=version())
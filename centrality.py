@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Eigenvector centrality of the Spotify artist graph above popularity thresholds.
+#
+# The subgraph of the artists of popularity at least t is cut out of the CSR
+# adjacency and its two leading eigenvectors are found with ARPACK (or
+# LOBPCG), starting from the previous threshold's eigenvectors restricted to
+# the artists the two subgraphs share. For a whole range of thresholds
+# PopularitySweep instead grows one adjacency from the most popular artists
+# down. Running this file regenerates the tables spotify.py reads, writing
+# each threshold's rows as soon as it is solved. They go to a scratch
+# directory; the published tables in data/ are only replaced with --force:
+#
+#   python centrality.py                   centrality_tables/top100results.csv and, when the
+#                                          graph has genres, centrality_tables/centrality_artists_results.csv
+#   python centrality.py --out data --force
+#   python centrality.py --graph data/spotify_core_graph.graph --thresholds 0:70 --top 100
+#   python centrality.py --independent     solve every threshold's subgraph from scratch
+#   python centrality.py --processes 8 --graph a.graph b.graph --out tables
+#                                          in a process pool, one table directory per graph
+import argparse, os, sys, time
+from collections import namedtuple
+
+import numpy as np, pandas as pd
+import scipy.sparse as sp
+import scipy.sparse.linalg as sla
+
+from edges import csr_subgraph
+
+
+# The popularity slider's thresholds
+THRESHOLDS = range(0, 70)
+TOP = 100
+
+# Below this many vertices the eigenproblem is solved densely; ARPACK wins above it
+DENSE_SIZE = 20
+
+# Relative residual of the eigenpairs, a few significant figures more than the figures show
+TOLERANCE = 1e-8
+
+# The eigenvectors of one threshold subgraph, over the artist graph's `vertices`
+Eigenvectors = namedtuple('Eigenvectors', ['threshold', 'vertices', 'values', 'first', 'second'])
+
+
+def adjacency_matrix(indptr, indices):
+    n = len(indptr) - 1
+    return sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n, n))
+
+
+def leading_eigenvectors(A, k=2, start=None, method='arpack', tol=TOLERANCE):
+    """The `k` largest eigenvalues of the symmetric matrix `A`, descending, and their eigenvectors.
+
+    `start` is an (n, k) guess at the eigenvectors; ARPACK starts from their
+    sum, LOBPCG from the block itself. Fewer than `k` vertices give zero columns.
+    """
+    n = A.shape[0]
+    if A.nnz == 0:
+        # No collaborations: every artist is equally (un)central
+        vectors = np.zeros((n, k))
+        vectors[:, 0] = 1 / np.sqrt(n) if n else 0
+        return np.zeros(k), vectors
+    if n <= DENSE_SIZE or n <= 2 * k + 1:
+        values, vectors = np.linalg.eigh(A.toarray())
+        values, vectors = values[::-1][:k], vectors[:, ::-1][:, :k]
+    elif method == 'lobpcg':
+        # Two random guard vectors keep LOBPCG from settling on a lower eigenpair near the start
+        block = np.random.RandomState(0).rand(n, k + 2)
+        if start is not None:
+            block[:, :k] += start * (n / np.maximum(np.abs(start).sum(axis=0), 1e-300))
+        values, vectors = sla.lobpcg(A, block, largest=True, tol=tol, maxiter=500)
+        top = np.argsort(values)[::-1][:k]
+        values, vectors = values[top], vectors[:, top]
+        # Without a preconditioner it can also stall, and then ARPACK takes over
+        residual = np.linalg.norm(A @ vectors - vectors * values, axis=0)
+        if (residual > np.sqrt(tol) * np.abs(values).max()).any():
+            return leading_eigenvectors(A, k, start, 'arpack', tol)
+    else:
+        # A little of every artist, as the previous eigenvectors can vanish on the components the subgraph keeps
+        v0 = None if start is None else start.sum(axis=1) + (np.abs(start[:, 0]).mean() or 1)
+        values, vectors = sla.eigsh(A, k=k, which='LA', v0=v0, tol=tol)
+    order = np.argsort(values)[::-1]
+    values, vectors = values[order], vectors[:, order]
+    if vectors.shape[1] < k:
+        values = np.concatenate([values, np.zeros(k - len(values))])
+        vectors = np.hstack([vectors, np.zeros((n, k - vectors.shape[1]))])
+    return values, vectors
+
+
+def orient(vectors, start=None):
+    """The first two eigenvectors signed so centrality is positive and the second keeps the orientation of `start`."""
+    first, second = vectors[:, 0], vectors[:, 1]
+    if first.sum() < 0:
+        first = -first
+    if start is not None and np.dot(second, start[:, 1]) < 0:
+        second = -second
+    elif start is None and len(second) and second[np.argmax(np.abs(second))] < 0:
+        second = -second
+    return first, second
+
+
+class CentralityEngine():
+    """First and second eigenvectors of the subgraph above any popularity threshold.
+
+    Each solve is warm-started from the last one, so sliding through nearby
+    thresholds takes a few iterations each. Thresholds may be fractional;
+    a threshold selecting the same artists as the last solve reuses it.
+    """
+    def __init__(self, indptr, indices, popularity, method='arpack'):
+        self.indptr, self.indices = indptr, indices
+        self.popularity = np.asarray(popularity)
+        self.method = method
+        self.last = None
+
+    def vertices(self, threshold):
+        return np.flatnonzero(self.popularity >= threshold)
+
+    def solve(self, threshold, previous=None, warm=True):
+        """Eigenvectors at `threshold`, started from `previous` or the last solve."""
+        previous = (previous or self.last) if warm else None
+        vertices = self.vertices(threshold)
+        if previous is not None and np.array_equal(previous.vertices, vertices):
+            result = previous._replace(threshold=threshold)
+        else:
+            A = adjacency_matrix(*csr_subgraph(self.indptr, self.indices, vertices))
+            start = None if previous is None else self.restrict(previous, vertices)
+            values, vectors = leading_eigenvectors(A, 2, start, self.method)
+            result = Eigenvectors(threshold, vertices, values, *orient(vectors, start))
+        self.last = result
+        return result
+
+    def restrict(self, previous, vertices):
+        """The previous eigenvectors on `vertices`, with artists new to the subgraph given the mean centrality."""
+        position = np.full(len(self.popularity), -1, dtype=np.int64)
+        position[previous.vertices] = np.arange(len(previous.vertices))
+        shared = position[vertices]
+        known = shared >= 0
+        start = np.zeros((len(vertices), 2))
+        start[known, 0] = previous.first[shared[known]]
+        start[known, 1] = previous.second[shared[known]]
+        start[~known, 0] = np.abs(previous.first).mean() if len(previous.first) else 1
+        return start
+
+    def sweep(self, thresholds=THRESHOLDS, warm=True):
+        """Eigenvectors at each of `thresholds` in turn."""
+        previous = None
+        for threshold in thresholds:
+            previous = self.solve(threshold, previous, warm)
+            yield previous
+
+
+class TriangleOperator(sla.LinearOperator):
+    """The symmetric matrix L + L^T of a strictly lower triangular CSR matrix L, without forming it."""
+    def __init__(self, lower):
+        super().__init__(dtype=lower.dtype, shape=lower.shape)
+        self.lower = lower
+        self.nnz = 2 * lower.nnz
+
+    def _matvec(self, x):
+        return self.lower @ x + self.lower.T @ x
+
+    def _matmat(self, X):
+        return self.lower @ X + self.lower.T @ X
+
+    def toarray(self):
+        return (self.lower + self.lower.T).toarray()
+
+
+class PopularitySweep():
+    """Eigenvectors at many thresholds, walked from the most popular artists down.
+
+    With the artists ranked by decreasing popularity, the subgraph above any
+    threshold is the first k of them. Each collaboration is stored once, in
+    the row of its less popular artist, so the rows of a lower triangular CSR
+    matrix; the first k rows of it are the subgraph's adjacency, a view of the
+    same arrays. Lowering the threshold only appends artists and edges, and
+    each solve starts from the last eigenvectors padded with the new artists.
+    """
+    def __init__(self, indptr, indices, popularity, method='arpack'):
+        popularity = np.asarray(popularity)
+        n = len(popularity)
+        self.order = np.argsort(-popularity, kind='mergesort')
+        self.sorted_popularity = popularity[self.order]
+        self.method = method
+
+        rank = np.empty(n, dtype=np.int64)
+        rank[self.order] = np.arange(n)
+        rows = np.repeat(np.arange(n), np.diff(indptr))
+        # Each collaboration once, between the ranks of its artists
+        once = rows < indices
+        a, b = rank[rows[once]], rank[indices[once]]
+        last, other = np.maximum(a, b), np.minimum(a, b)
+        by_last = np.argsort(last, kind='mergesort')
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(last, minlength=n), out=self.indptr[1:])
+        self.indices = other[by_last].astype(np.int32)
+        self.data = np.ones(len(self.indices))
+
+    def size(self, threshold):
+        """Number of artists and collaborations in the subgraph above `threshold`."""
+        k = np.searchsorted(-self.sorted_popularity, -threshold, side='right')
+        return k, self.indptr[k]
+
+    def matrix(self, k):
+        m = self.indptr[k]
+        lower = sp.csr_matrix((self.data[:m], self.indices[:m], self.indptr[:k + 1]), shape=(k, k), copy=False)
+        return TriangleOperator(lower)
+
+    def sweep(self, thresholds=THRESHOLDS):
+        """Eigenvectors at each of `thresholds`, from the highest down, as each is solved."""
+        previous, size = None, None
+        for threshold in sorted(thresholds, reverse=True):
+            k = self.size(threshold)[0]
+            if k == size:
+                previous = previous._replace(threshold=threshold)
+                yield previous
+                continue
+            start = None
+            if previous is not None and len(previous.first):
+                start = np.zeros((k, 2))
+                start[:size, 0], start[:size, 1] = previous.first, previous.second
+                start[size:, 0] = np.abs(previous.first).mean()
+            values, vectors = leading_eigenvectors(self.matrix(k), 2, start, self.method)
+            previous, size = Eigenvectors(threshold, self.order[:k], values, *orient(vectors, start)), k
+            yield previous
+
+
+def top_vertices(values, count=TOP):
+    """Positions of the `count` largest of `values`, largest first."""
+    count = min(count, len(values))
+    top = np.argpartition(-values, count - 1)[:count] if count else np.zeros(0, dtype=np.int64)
+    return top[np.argsort(-values[top], kind='mergesort')]
+
+
+def threshold_label(threshold):
+    # Whole thresholds are written as integers, the way spotify.py looks them up
+    return int(threshold) if float(threshold).is_integer() else float(threshold)
+
+
+def top_rows(result, G, count=TOP):
+    """Rows of top100results.csv for one threshold: its most central artists by the first eigenvector."""
+    top = top_vertices(result.first, count)
+    vertices = result.vertices[top]
+    return pd.DataFrame({'Name': [G.vs['Artist'][int(v)] for v in vertices],
+                         'ID': [G.vs['name'][int(v)] for v in vertices],
+                         'Centraility': result.first[top],
+                         'Popularity': np.asarray(G.vs['Popularity'])[vertices],
+                         'Threshold': threshold_label(result.threshold)},
+                        columns=['Name', 'ID', 'Centraility', 'Popularity', 'Threshold'])
+
+
+def genre_rows(result, genres, count=TOP):
+    """Rows of centrality_artists_results.csv for one threshold: the genres of the `count` artists
+    highest on each eigenvector, with their values."""
+    frames = []
+    for eigenvector, values in [('First', result.first), ('Second', result.second)]:
+        top = top_vertices(values, count)
+        frames.append(pd.DataFrame({'Eigenvector': eigenvector,
+                                    'Genre': [genres[int(v)] for v in result.vertices[top]],
+                                    'Threshold': threshold_label(result.threshold), 'Centraility': values[top]},
+                                   columns=['Eigenvector', 'Genre', 'Threshold', 'Centraility']))
+    return pd.concat(frames, ignore_index=True)
+
+
+def genre_averages(rows):
+    """Average centrality of each genre in rows of centrality_artists_results.csv, the way spotify.py plots it."""
+    return rows.groupby(['Eigenvector', 'Genre', 'Threshold'])['Centraility'].mean().rename('Centrality').reset_index()
+
+
+def artist_graph_path(data='data'):
+    """The full artist graph written by ingest.py if there is one, else the core graph."""
+    full = os.path.join(data, 'spotify_full.graph')
+    return full if os.path.exists(full) else os.path.join(data, 'spotify_core_graph.graph')
+
+
+def overwritten(directories, data='data'):
+    """The published tables in `data` that writing to `directories` would replace."""
+    names = ['top100results.csv', 'centrality_artists_results.csv']
+    return [os.path.join(directory, name) for directory in directories for name in names
+            if os.path.abspath(directory) == os.path.abspath(data) and os.path.exists(os.path.join(directory, name))]
+
+
+def parse_thresholds(text):
+    """'0:70' or '0:70:0.5' as a range of thresholds, '10,20.5' as a list."""
+    if ':' in text:
+        return list(np.arange(*[float(part) for part in text.split(':')]))
+    return [float(part) for part in text.split(',')]
+
+
+def tables(result, G, count=TOP):
+    """The rows one threshold adds to top100results.csv and, if the graph has genres, centrality_artists_results.csv."""
+    genres = G.vs['Genre'] if 'Genre' in G.vs.attributes() else None
+    return (result.threshold, len(result.vertices), top_rows(result, G, count),
+            None if genres is None else genre_rows(result, genres, count))
+
+
+# The graphs a pool worker has opened, with an engine for each. Workers map
+# the .graph files themselves, so the adjacency reaches them through the OS
+# page cache rather than being pickled, and is shared between them.
+worker_graphs = {}
+
+
+def solve_in_worker(task):
+    from graphstore import ColumnarGraph
+    path, threshold, count, method, warm = task
+    if path not in worker_graphs:
+        G = ColumnarGraph(path)
+        worker_graphs[path] = G, CentralityEngine(*G.csr(), G.vs['Popularity'], method)
+    G, engine = worker_graphs[path]
+    return (path,) + tables(engine.solve(threshold, warm=warm), G, count)
+
+
+class TableWriter():
+    """Writes the two centrality tables into `directory` a threshold at a time."""
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, 'top100results.csv'), os.path.join(directory, 'centrality_artists_results.csv')]
+        self.files = [None, None]
+        self.start = time.perf_counter()
+
+    def write(self, threshold, vertices, top, artists):
+        line = "  threshold %-5g %8d artists %8.2f s" % (threshold, vertices, time.perf_counter() - self.start)
+        for i, rows in enumerate([top, artists]):
+            if rows is None:
+                continue
+            header = self.files[i] is None
+            if header:
+                self.files[i] = open(self.paths[i], 'w')
+            rows.to_csv(self.files[i], header=header, index=False)
+            self.files[i].flush()
+        if artists is not None:
+            averages = genre_averages(artists).sort_values('Centrality')
+            for eigenvector, group in averages.groupby('Eigenvector'):
+                line += "   %s: %s %.4f" % (eigenvector, group['Genre'].iloc[-1], group['Centrality'].iloc[-1])
+        print(line)
+        sys.stdout.flush()
+
+    def close(self):
+        for f in self.files:
+            if f is not None:
+                f.close()
+        return [path for path, f in zip(self.paths, self.files) if f is not None]
+
+
+def main(argv=None):
+    from graphstore import ColumnarGraph
+
+    parser = argparse.ArgumentParser(description="Regenerate the Spotify centrality tables.")
+    parser.add_argument('--graph', nargs='+', default=[artist_graph_path()],
+                        help="one or more .graph files, e.g. snapshots of the artist graph")
+    parser.add_argument('--thresholds', type=parse_thresholds, default=list(THRESHOLDS))
+    parser.add_argument('--top', type=int, default=TOP)
+    parser.add_argument('--method', choices=['arpack', 'lobpcg'], default='arpack')
+    parser.add_argument('--independent', action='store_true',
+                        help="solve each threshold's subgraph from scratch instead of from the last solve")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="solve the thresholds of all the graphs in this many worker processes")
+    parser.add_argument('--out', default='centrality_tables',
+                        help="directory for the tables, with a subdirectory per graph when there are several")
+    parser.add_argument('--force', action='store_true', help="replace the published tables in data/")
+    args = parser.parse_args(argv)
+
+    directories = [args.out if len(args.graph) == 1 else os.path.join(args.out, os.path.splitext(os.path.basename(path))[0])
+                   for path in args.graph]
+    if not args.force and overwritten(directories):
+        parser.error("would replace the published %s, which --force allows" % ', '.join(overwritten(directories)))
+
+    # Rows are written as each threshold is solved, so a long run can be followed and interrupted
+    start = time.perf_counter()
+    writers = {path: TableWriter(directory) for path, directory in zip(args.graph, directories)}
+    if args.processes > 1:
+        import multiprocessing
+        tasks = [(path, threshold, args.top, args.method, not args.independent)
+                 for path in args.graph for threshold in args.thresholds]
+        with multiprocessing.Pool(args.processes) as pool:
+            for path, *rows in pool.imap(solve_in_worker, tasks):
+                writers[path].write(*rows)
+    else:
+        for path in args.graph:
+            G = ColumnarGraph(path)
+            if args.independent:
+                results = CentralityEngine(*G.csr(), G.vs['Popularity'], args.method).sweep(args.thresholds, warm=False)
+            else:
+                results = PopularitySweep(*G.csr(), G.vs['Popularity'], args.method).sweep(args.thresholds)
+            for result in results:
+                writers[path].write(*tables(result, G, args.top))
+
+    for path, writer in writers.items():
+        print("%d thresholds of %s -> %s" % (len(args.thresholds), path, ', '.join(writer.close())))
+    print("%.2f s with %d process%s" % (time.perf_counter() - start, args.processes, 'es' if args.processes > 1 else ''))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
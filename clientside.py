@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import dash
+import dash_core_components as dcc
+from dash.exceptions import PreventUpdate
+
+from edges import EDGE_BUDGET, WEBGL_EDGES, edge_style
+from lazy import LAZY
+
+
+# Edge thresholding in the browser.
+#
+# With NETWORKS_CLIENTSIDE=1 a network's edges are sent once, in a dcc.Store
+# holding the vertex coordinates, every edge's vertex pair in ascending
+# percentile order and the percentile of each. Its threshold slider then
+# drives a clientside callback (assets/threshold.js) which draws the edges
+# above the threshold from that, so slider moves never reach the server.
+# The node markers, and any traces drawn over the edges, go in a second store,
+# which is all the server still updates.
+CLIENTSIDE = os.environ.get('NETWORKS_CLIENTSIDE', '0') == '1'
+
+
+def edge_store(edge_index, x, y, layout):
+    """The data of an edge store for an EdgeIndex over vertices at `x`, `y`, with the figure layout.
+
+    Vertex pairs and coordinates are much smaller than the segments the server
+    sends, and the arrays are plain JSON, never typed arrays, as the browser
+    indexes into them. The edge styles and limits are those of edges.py.
+    """
+    return {'svg': edge_style(0), 'webgl': edge_style(WEBGL_EDGES), 'webgl_edges': WEBGL_EDGES, 'budget': EDGE_BUDGET,
+            'x': np.asarray(x, dtype=float), 'y': np.asarray(y, dtype=float),
+            'edges': edge_index.edges.ravel(), 'percentile': edge_index.percentile, 'layout': layout}
+
+
+def edge_store_component(id, build):
+    """A dcc.Store of edge_store data, left empty when lazy for fill_edge_store to fill."""
+    return dcc.Store(id=id, data=None if LAZY else build())
+
+
+def threshold_callbacks(app, graph, slider, edges, nodes, build_edges, function='threshold_figure'):
+    """Wire a graph to a clientside threshold callback over the stores `edges` and `nodes`.
+
+    `build_edges` returns the edge store data; it is only called on the server
+    when the store was left empty at startup.
+    """
+    app.clientside_callback(
+        dash.dependencies.ClientsideFunction('networks', function),
+        dash.dependencies.Output(graph, 'figure'),
+        [dash.dependencies.Input(slider, 'value'),
+         dash.dependencies.Input(edges, 'data'),
+         dash.dependencies.Input(nodes, 'data')])
+
+    @app.callback(
+        dash.dependencies.Output(edges, 'data'),
+        [dash.dependencies.Input(edges, 'modified_timestamp')],
+        [dash.dependencies.State(edges, 'data')])
+    def fill_edge_store(modified_timestamp, data):
+        if data is not None:
+            raise PreventUpdate
+        return build_edges()
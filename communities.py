@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Communities of the labour network over a sweep of resolutions.
+#
+# The graph's "louvain community" attribute is a single partition. Running
+# this file partitions the skill graph with Leiden, maximising weighted
+# modularity, at every resolution of a sweep, and optionally again on only
+# the heaviest edges, as the edge slider keeps them. The runs are spread over
+# a process pool. Each partition is an int16 row of a membership matrix in
+# data/labour_communities.npz, its communities numbered after the ones of the
+# previous resolution they share most jobs with, so colours stay with their
+# communities as the resolution slider moves:
+#
+#   python communities.py
+#   python communities.py --resolutions 0.2:3:0.1 --keep 1,0.5,0.2 --processes 4
+#
+# labour.py only looks partitions up in the file; without it the resolution
+# colouring has the one baked partition.
+import argparse, os, random, sys, time, warnings
+from collections import namedtuple
+
+import numpy as np
+
+from edges import rank_percentile
+
+
+COMMUNITIES = os.path.join('data', 'labour_communities.npz')
+RESOLUTIONS = np.round(np.arange(0.2, 3.05, 0.1), 2)
+# Fractions of the heaviest edges partitioned, 1 being every edge
+KEEP = (1.0,)
+
+# Partitions of the graph's vertices: run i is the resolution resolutions[i]
+# on the keep[i] heaviest fraction of the edges, with membership[i] the
+# community of each vertex and modularity[i] its weighted modularity over all
+# the edges
+Communities = namedtuple('Communities', ['resolutions', 'keep', 'membership', 'modularity'])
+
+
+def kept_edges(weights, keep):
+    """Positions of the heaviest `keep` fraction of edges, as the edge slider at `keep` shows them."""
+    return np.flatnonzero(rank_percentile(weights) > 1 - keep) if keep < 1 else np.arange(len(weights))
+
+
+def by_size(membership):
+    """`membership` with its communities numbered from the largest down."""
+    sizes = np.bincount(membership)
+    labels = np.empty(len(sizes), dtype=np.intp)
+    labels[np.argsort(-sizes, kind='mergesort')] = np.arange(len(sizes))
+    return labels[membership]
+
+
+def leiden(edgelist, weights, n, resolution, keep=1.0, seed=0):
+    """The Leiden partition at `resolution` of the graph's `keep` heaviest edges, and its modularity over all of them."""
+    import igraph as ig
+    edges = np.asarray(edgelist, dtype=np.intp).reshape(-1, 2)
+    weights = np.asarray(weights, dtype=float)
+    kept = kept_edges(weights, keep)
+    G = ig.Graph(n=n, edges=edges[kept].tolist())
+    # igraph draws from Python's random module
+    random.seed(seed)
+    with warnings.catch_warnings():
+        # Renamed `resolution` after python-igraph 0.8
+        warnings.simplefilter('ignore', DeprecationWarning)
+        partition = G.community_leiden(objective_function='modularity', weights=weights[kept].tolist(),
+                                       resolution_parameter=resolution, n_iterations=-1)
+    membership = by_size(np.asarray(partition.membership, dtype=np.intp))
+    modularity = ig.Graph(n=n, edges=edges.tolist()).modularity(membership.tolist(), weights=weights.tolist())
+    return membership, modularity
+
+
+def align(membership, previous):
+    """`membership` renumbered to follow `previous`, a partition of the same vertices.
+
+    Communities take the number of the previous community they share most
+    vertices with, greedily from the largest overlap, and the rest the
+    numbers left free, largest community first.
+    """
+    count, before = membership.max() + 1, previous.max() + 1
+    overlap = np.zeros((count, before), dtype=np.intp)
+    np.add.at(overlap, (membership, previous), 1)
+    labels = np.full(count, -1, dtype=np.intp)
+    taken = np.zeros(max(count, before), dtype=bool)
+    for flat in np.argsort(-overlap, axis=None, kind='mergesort'):
+        community, label = divmod(flat, before)
+        if overlap[community, label] == 0:
+            break
+        if labels[community] < 0 and not taken[label]:
+            labels[community], taken[label] = label, True
+    rest = np.flatnonzero(labels < 0)
+    rest = rest[np.argsort(-np.bincount(membership, minlength=count)[rest], kind='mergesort')]
+    labels[rest] = np.flatnonzero(~taken)[:len(rest)]
+    return labels[membership]
+
+
+def aligned(resolutions, keep, membership):
+    """Every row of `membership` aligned to the one before it of the same keep, in order of resolution."""
+    membership = membership.copy()
+    for fraction in np.unique(keep):
+        runs = np.flatnonzero(keep == fraction)
+        runs = runs[np.argsort(resolutions[runs], kind='mergesort')]
+        for previous, run in zip(runs, runs[1:]):
+            membership[run] = align(membership[run], membership[previous])
+    return membership
+
+
+# The graph a pool worker has opened
+worker_graph = {}
+
+
+def detect_in_worker(task):
+    from graphstore import load_graph
+    name, resolution, keep, seed = task
+    if name not in worker_graph:
+        G = load_graph(name)
+        worker_graph[name] = G.get_edgelist(), G.es['weight'], G.vcount()
+    start = time.perf_counter()
+    membership, modularity = leiden(*worker_graph[name], resolution, keep, seed)
+    return resolution, keep, membership, modularity, time.perf_counter() - start
+
+
+def sweep(name='skill_scape_graph', resolutions=RESOLUTIONS, keep=KEEP, processes=1, seed=0, progress=None):
+    """Communities of the graph data/<name> at every resolution and keep, in `processes` worker processes.
+
+    `progress` is called with each run's resolution, keep, number of
+    communities, modularity and seconds as it finishes.
+    """
+    tasks = [(name, resolution, fraction, seed) for fraction in keep for resolution in resolutions]
+    pool = None
+    if processes > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+    runs = []
+    try:
+        for run in (pool.imap_unordered(detect_in_worker, tasks) if pool else map(detect_in_worker, tasks)):
+            runs.append(run)
+            if progress:
+                progress(run[0], run[1], run[2].max() + 1, run[3], run[4])
+    finally:
+        if pool:
+            pool.close()
+
+    runs.sort(key=lambda run: (-run[1], run[0]))
+    resolutions, keep = np.array([run[0] for run in runs], dtype=float), np.array([run[1] for run in runs], dtype=float)
+    membership = aligned(resolutions, keep, np.array([run[2] for run in runs], dtype=np.int16))
+    return Communities(resolutions, keep, membership, np.array([run[3] for run in runs]))
+
+
+def save_communities(communities, names, path=COMMUNITIES):
+    np.savez_compressed(path, names=np.asarray(names, dtype=str), **communities._asdict())
+
+
+def load_communities(names, path=COMMUNITIES):
+    """The Communities in `path`, or None without the file or when it is of a different graph than `names`."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as stored:
+        if stored['names'].tolist() != [str(name) for name in names]:
+            return None
+        return Communities(*(stored[field] for field in Communities._fields))
+
+
+def stored_resolutions(path=COMMUNITIES):
+    """The resolutions in `path`, read without the memberships."""
+    if not os.path.exists(path):
+        return np.array([1.0])
+    with np.load(path) as stored:
+        return np.unique(stored['resolutions'])
+
+
+def lookup(communities, resolution, keep=None):
+    """The run nearest `resolution` among those of the keep nearest `keep`, or of every edge without one."""
+    fractions = np.unique(communities.keep)
+    fraction = fractions[-1] if keep is None else fractions[np.argmin(np.abs(fractions - keep))]
+    runs = np.flatnonzero(communities.keep == fraction)
+    return runs[np.argmin(np.abs(communities.resolutions[runs] - resolution))]
+
+
+def parse_values(text):
+    """'0.2:3:0.1' as the range 0.2, 0.3, ... 3.0, or '1,0.5' as a list."""
+    if ':' in text:
+        start, stop, step = (float(part) for part in text.split(':'))
+        return np.round(np.arange(start, stop + step / 2, step), 6)
+    return np.array([float(part) for part in text.split(',')])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leiden communities of the labour network over a sweep of resolutions.")
+    parser.add_argument('--graph', default='skill_scape_graph', help="graph name under data/")
+    parser.add_argument('--resolutions', type=parse_values, default=RESOLUTIONS, help="start:stop:step or a comma separated list")
+    parser.add_argument('--keep', type=parse_values, default=np.array(KEEP),
+                        help="fractions of the heaviest edges to partition, comma separated")
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=COMMUNITIES)
+    args = parser.parse_args(argv)
+
+    def progress(resolution, keep, count, modularity, seconds):
+        print("  resolution %-5g keep %-4g %5d communities, modularity %.4f %8.1f ms"
+              % (resolution, keep, count, modularity, 1000 * seconds))
+        sys.stdout.flush()
+
+    from graphstore import load_graph
+    names = load_graph(args.graph).vs['name']
+    start = time.perf_counter()
+    communities = sweep(args.graph, args.resolutions, args.keep, args.processes, args.seed, progress)
+    seconds = time.perf_counter() - start
+    save_communities(communities, names, args.out)
+    print("%d partitions of %d vertices in %.2f s with %d process%s -> %s (%d KB)" % (
+        len(communities.resolutions), len(names), seconds, args.processes, 'es' if args.processes > 1 else '',
+        args.out, os.path.getsize(args.out) // 1024))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
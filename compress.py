@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Compressed responses.
+#
+# Callback responses, the page layout and Dash's script bundles are sent
+# with gzip, or brotli when the brotli package is installed and the browser
+# takes it. Responses smaller than NETWORKS_COMPRESS_MIN_BYTES go as they
+# are. Anything that comes out the same every time (the layout, scripts, and
+# callback responses the response cache holds, like the labour thresholds
+# and the Spotify slider) keeps its compressed bytes in a CompressedCache by
+# a hash of its content, so it is only ever compressed once per worker.
+#
+# This replaces the Flask-Compress that dash 1.x turns on by default, which
+# compresses every response again on every request.
+import hashlib, os, threading, zlib
+from collections import OrderedDict
+
+from cache import callback_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESS = os.environ.get('NETWORKS_COMPRESS', '1') == '1'
+MIN_BYTES = int(os.environ.get('NETWORKS_COMPRESS_MIN_BYTES', 1024))
+CACHE_MB = int(os.environ.get('NETWORKS_COMPRESS_CACHE_MB', 64))
+
+MIMETYPES = ('application/json', 'text/html', 'text/css', 'application/javascript', 'text/plain')
+UPDATE_PATH = '/_dash-update-component'
+# Paths whose responses only change with the code or files behind them
+STATIC_PATHS = ('/_dash-layout', '/_dash-dependencies', '/_dash-component-suites/', '/assets/')
+# Responses not worth caching are compressed faster and a little less
+GZIP_LEVELS = {'cached': 9, 'once': 6}
+BROTLI_QUALITIES = {'cached': 9, 'once': 5}
+
+
+def compress_bytes(data, encoding, cached=True):
+    effort = 'cached' if cached else 'once'
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITIES[effort])
+    # A gzip container, which zlib writes without a timestamp
+    compressor = zlib.compressobj(GZIP_LEVELS[effort], zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def accepted_encoding(accept_encodings):
+    """'br', 'gzip' or None, from a request's parsed Accept-Encoding."""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+class CompressedCache():
+    """Compressed bytes by content hash and encoding, up to `max_bytes` of them, least recently used evicted first."""
+    def __init__(self, max_bytes=CACHE_MB * 2**20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.hits, self.misses = 0, 0
+        self.original_bytes, self.sent_bytes = 0, 0
+
+    def compress(self, data, encoding):
+        key = (hashlib.blake2b(data, digest_size=16).digest(), encoding)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        compressed = compress_bytes(data, encoding)
+        if len(compressed) <= self.max_bytes:
+            with self.lock:
+                if key not in self.entries:
+                    self.entries[key] = compressed
+                    self.nbytes += len(compressed)
+                while self.nbytes > self.max_bytes:
+                    self.nbytes -= len(self.entries.popitem(last=False)[1])
+        return compressed
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries), 'bytes': self.nbytes}
+
+
+def deterministic(request):
+    """Whether a response to `request` will be sent again byte for byte, so is worth caching compressed."""
+    if request.path == UPDATE_PATH:
+        return getattr(callback_cache.local, 'outcome', 'none') in ('hit', 'disk_hit', 'miss')
+    # Anything else, like /metrics, may differ every time
+    return request.path.startswith(STATIC_PATHS)
+
+
+def add_compression(server, cache=None, min_bytes=MIN_BYTES):
+    """Compress the text responses of `server` for browsers that accept it.
+
+    Returns the CompressedCache, or None when NETWORKS_COMPRESS=0.
+    """
+    if not COMPRESS and cache is None:
+        return None
+    from flask import g, request
+
+    cache = cache or CompressedCache()
+
+    @server.before_request
+    def forget_cache_outcome():
+        # The response cache only records an outcome for memoized callbacks
+        callback_cache.local.outcome = 'none'
+
+    @server.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.status_code != 200 or 'Content-Encoding' in response.headers
+                or response.mimetype not in MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = accepted_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        # For metrics.py, whose hook runs after this one
+        g.uncompressed_bytes = len(data)
+
+        if cache.max_bytes > 0 and deterministic(request):
+            compressed = cache.compress(data, encoding)
+        else:
+            compressed = compress_bytes(data, encoding, cached=False)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body is a different entity, but the same content
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        with cache.lock:
+            cache.original_bytes += len(data)
+            cache.sent_bytes += len(compressed)
+        return response
+
+    return cache
@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+import scipy.stats as ss
+
+from payload import pack
+
+
+# Shared edge geometry for every network figure in the app.
+#
+# Plotly draws a set of edges as one line trace where each segment is
+# (x0, x1, gap). Building that with a Python loop over G.es costs four igraph
+# vertex lookups per edge, so here we gather the coordinates for all edges at
+# once and use NaN as the gap, which plotly treats exactly like None.
+
+def edge_segments(edgelist, x, y):
+    """Return a (2, 3*m) float array of NaN separated edge segments.
+
+    Row 0 holds x0, x1, nan for every edge and row 1 the matching y values,
+    in the same order as `edgelist`.
+    """
+    edges = np.asarray(edgelist, dtype=np.intp).reshape(-1, 2)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    segments = np.full((2, len(edges), 3), np.nan)
+    segments[0, :, :2] = x[edges]
+    segments[1, :, :2] = y[edges]
+    return segments.reshape(2, -1)
+
+
+def graph_segments(G):
+    """Edge segments for a graph with 'x' and 'y' vertex attributes."""
+    return edge_segments(G.get_edgelist(), G.vs['x'], G.vs['y'])
+
+
+# How a figure's traces are drawn.
+#
+# SVG traces with spline edges look best, but browsers slow down past a few
+# thousand of them, so from NETWORKS_WEBGL_EDGES edges on a figure is drawn
+# with WebGL (scattergl), in straight lines. Its nodes go to WebGL as well,
+# as plotly draws WebGL traces over SVG ones. No figure draws more than
+# NETWORKS_EDGE_BUDGET edges: past that the least important edges are left
+# out, and come back when zooming in leaves fewer edges in view.
+WEBGL_EDGES = int(os.environ.get('NETWORKS_WEBGL_EDGES', 3000))
+EDGE_BUDGET = int(os.environ.get('NETWORKS_EDGE_BUDGET', 50000))
+
+
+def edge_style(count):
+    """The edge trace attributes for drawing `count` edges, without x and y."""
+    if count >= WEBGL_EDGES:
+        return {'type': 'scattergl', 'mode': 'lines', 'line': {'width': 0.5}, 'opacity': 0.5, 'hoverinfo': 'none'}
+    return {'type': 'scatter', 'mode': 'lines', 'line': {'width': 0.2, 'shape': 'spline'}, 'opacity': 0.5, 'hoverinfo': 'none'}
+
+
+def edge_trace(segments):
+    """The line trace used to draw edges in all of our network figures.
+
+    This is a plain dict rather than go.Scatter so that the segment arrays
+    go into the figure as they are, without plotly validating and copying them.
+    """
+    return dict(edge_style(segments.shape[1] // 3), x=pack(segments[0]), y=pack(segments[1]))
+
+
+def same_renderer(trace, edges):
+    """`trace` drawn the way the edge trace `edges` is, SVG or WebGL."""
+    return trace if trace['type'] == edges['type'] else dict(trace, type=edges['type'])
+
+
+def viewport(relayout_data):
+    """((x0, x1), (y0, y1)) zoomed into in a graph's relayoutData, or None for the whole figure."""
+    keys = ['xaxis.range[0]', 'xaxis.range[1]', 'yaxis.range[0]', 'yaxis.range[1]']
+    if not relayout_data or not all(key in relayout_data for key in keys):
+        return None
+    x0, x1, y0, y1 = (float(relayout_data[key]) for key in keys)
+    return (min(x0, x1), max(x0, x1)), (min(y0, y1), max(y0, y1))
+
+
+def level_of_detail(segments, priority=None, view=None, budget=None):
+    """The segments of at most `budget` edges crossing `view`, those of highest `priority` first.
+
+    Without a `priority` the edges are taken to be in ascending order of
+    importance already, as an EdgeIndex keeps them. The kept edges stay in
+    their original order.
+    """
+    budget = EDGE_BUDGET if budget is None else budget
+    edges = segments.reshape(2, -1, 3)
+    m = edges.shape[1]
+    if view is None and m <= budget:
+        return segments
+    kept = np.arange(m)
+    if view is not None:
+        (x0, x1), (y0, y1) = view
+        xs, ys = edges[0, :, :2], edges[1, :, :2]
+        # Edges whose bounding box overlaps the view
+        kept = np.flatnonzero((xs.max(1) >= x0) & (xs.min(1) <= x1) & (ys.max(1) >= y0) & (ys.min(1) <= y1))
+    if len(kept) > budget:
+        if priority is None:
+            kept = kept[-budget:]
+        else:
+            kept = np.sort(kept[np.argsort(np.asarray(priority)[kept], kind='mergesort')[-budget:]])
+    return edges[:, kept].reshape(2, -1)
+
+
+def rank_percentile(weights):
+    """Rank of each weight over the largest rank, ties sharing their average rank."""
+    ranks = ss.rankdata(weights)
+    return ranks / max(ranks)
+
+
+class EdgeIndex():
+    """Edge segments sorted by weight percentile for thresholding by slicing.
+
+    The edges are stored once, in ascending percentile order, in one contiguous
+    (2, 3*m) array. The edges above any threshold are then a suffix of it.
+    self.edges holds the vertex pairs in the same order.
+    """
+    def __init__(self, edgelist, x, y, weights):
+        percentile = rank_percentile(weights)
+        self.order = np.argsort(percentile, kind='mergesort')
+        self.percentile = percentile[self.order]
+        self.edges = np.asarray(edgelist, dtype=np.intp).reshape(-1, 2)[self.order]
+        self.segments = np.ascontiguousarray(edge_segments(self.edges, x, y))
+
+    def start(self, threshold):
+        """Position in self.order of the first edge with percentile above `threshold`."""
+        return np.searchsorted(self.percentile, threshold, side='right')
+
+    def threshold(self, threshold):
+        """A view of the segments of every edge with percentile above `threshold`."""
+        return self.segments[:, 3 * self.start(threshold):]
+
+    def visible(self, threshold, view=None, budget=None):
+        """The segments to draw for `threshold`: those above it, cut to the budget for `view`."""
+        return level_of_detail(self.threshold(threshold), view=view, budget=budget)
+
+
+def induced_edges(edgelist, vertices, n):
+    """The rows of `edgelist` with both endpoints in `vertices`, out of n vertices."""
+    edges = np.asarray(edgelist, dtype=np.intp).reshape(-1, 2)
+    inside = np.zeros(n, dtype=bool)
+    inside[vertices] = True
+    return edges[inside[edges[:, 0]] & inside[edges[:, 1]]]
+
+
+def csr_from_edges(edgelist, n, directed=False):
+    """(indptr, indices) adjacency of an edge list, both directions unless `directed`."""
+    edges = np.asarray(edgelist, dtype=np.intp).reshape(-1, 2)
+    sources, targets = edges[:, 0], edges[:, 1]
+    if not directed:
+        sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+    order = np.argsort(sources, kind='mergesort')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+    return indptr, targets[order].astype(np.int32)
+
+
+def csr_subgraph(indptr, indices, vertices):
+    """The adjacency induced by the sorted array `vertices`, renumbered 0..len(vertices)-1."""
+    n = len(indptr) - 1
+    position = np.full(n, -1, dtype=np.int64)
+    position[vertices] = np.arange(len(vertices))
+
+    # Gather the neighbour lists of the kept rows in one go
+    starts, ends = indptr[vertices], indptr[np.asarray(vertices) + 1]
+    lengths = ends - starts
+    rows = np.repeat(np.arange(len(vertices)), lengths)
+    gather = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+    columns = position[indices[gather]]
+    keep = columns >= 0
+
+    sub_indptr = np.zeros(len(vertices) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows[keep], minlength=len(vertices)), out=sub_indptr[1:])
+    return sub_indptr, columns[keep].astype(np.int32)
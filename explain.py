@@ -1,6 +1,8 @@
 # About Networks Explanation
 
 import igraph as ig
+import threading
+from collections import OrderedDict
 import dash_core_components as dcc
 import dash_html_components as html
 import plotly.graph_objs as go
@@ -8,57 +10,134 @@ from textwrap import dedent as d
 
 import numpy as np
 
-# Python code to render networks and figures
-def explain_make_network(n, p, style = 'Erdős–Rényi Random Graph', color = "None"):
+from edges import csr_from_edges, edge_segments, edge_trace, level_of_detail, same_renderer
+from payload import pack
+from lazy import startup_figure
+from graphlayout import layout_service
+from pathcentrality import BUDGET, path_centrality
+
+CENTRALITY_TITLES = {'Eigencentraility': 'Eigenvector<br>Centrality',
+                     'betweenness': 'Betweenness<br>Centrality',
+                     'closeness': 'Closeness<br>Centrality'}
+
+def preferential_attachment(n, m, random):
+    """Edges of a Barabási–Albert graph, each new node linking to m earlier ones with odds of their degree + 1, as igraph's do."""
+    degree = np.zeros(n)
+    edges = []
+    for node in range(1, n):
+        weights = degree[:node] + 1
+        targets = random.choice(node, min(m, node), replace=False, p=weights / weights.sum())
+        degree[targets] += 1
+        edges.extend((node, target) for target in targets)
+    return edges
+
+
+def explain_generate(n, p, style, seed=None):
+    # Each graph draws from its own generator rather than igraph's global
+    # one, so graphs made at the same time cannot change each other. Nodes
+    # are added one at a time, linking only to earlier ones, so the same seed
+    # with fewer nodes gives the graph of the first nodes.
+    random = np.random.RandomState(seed)
     if style == 'Erdős–Rényi Random Graph':
-        G = ig.Graph.Erdos_Renyi(n, p)
+        node, earlier = np.tril_indices(n, -1)
+        kept = random.random_sample(len(node)) < p
+        return ig.Graph(n=n, edges=np.stack([earlier[kept], node[kept]], 1).tolist())
     elif style == 'Barabási–Albert Random Graph':
-        G = ig.Graph.Barabasi(n, int(p*n))
+        return ig.Graph(n=n, edges=preferential_attachment(n, int(p*n), random))
     elif style == 'Star':
-        G = ig.Graph.Star(n)
-
-    layout = np.array(G.layout_fruchterman_reingold().coords)
-    G.vs["x"] = [f.item() for f in layout[:,0]]
-    G.vs["y"] = [f.item() for f in layout[:,1]]
-
-    edge_x, edge_y =[],[]
-    for e in G.es:
-        n0, n1 = e.tuple
-        x0, y0 = G.vs[n0]['x'], G.vs[n0]['y']
-        x1, y1 = G.vs[n1]['x'], G.vs[n1]['y']
-        edge_x.extend([x0, x1, None])
-        edge_y.extend([y0, y1, None])
-    edge_trace = go.Scatter(x=edge_x, 
-                    y=edge_y,
-                    mode='lines',\
-                    line={'width': 0.2},\
-                    line_shape='spline',\
-                    opacity=0.5,\
-                    hoverinfo='none')
-       
-    if color == 'None':
-         node_trace = go.Scatter(x=G.vs['x'], y=G.vs['y'], hovertext=[], text=[], 
-                                mode='markers', textposition="bottom center", \
-                                hoverinfo="none", marker={'size': 10})
-    else:
-        if color == 'Eigencentraility':
-            G.vs['centrality'] = G.eigenvector_centrality()
-            title_text = 'Eigenvector<br>Centrality'
-        elif color == 'betweenness':
-            G.vs['centrality'] = G.betweenness()
-            title_text = 'Betweenness<br>Centrality'
-        elif color == 'closeness':
-            G.vs['centrality'] = G.closeness()
-            title_text = 'Closeness<br>Centrality'
-
-        node_trace = go.Scatter(x=G.vs['x'], y=G.vs['y'], hovertext=[], text=[], 
-            mode='markers', textposition="bottom center", hoverinfo="none", 
-            marker={'size': 10,
-                    'color':G.vs['centrality'], 'cauto':True, 'colorscale':'Bluered',
-                    'colorbar':{'thickness':20, 'title':title_text}
-                    })
+        return ig.Graph.Star(n)
+
+
+def explain_make_graph(n, p, style, seed=None):
+    G = explain_generate(n, p, style, seed)
+    # A seeded graph is laid out from where its first nodes were placed, so
+    # moving the node slider by a few nodes keeps them in place
+    layout = layout_service.layout(G.get_edgelist(), n, seed=seed, grown=seed is not None)
+    return G, layout
+
+
+class GeneratedGraph():
+    """A generated graph with its layout, edge trace and the centralities asked for so far.
+
+    It is shared between requests: the graph is never changed, and each
+    centrality is computed once and kept as an array.
+    """
+    def __init__(self, G, layout):
+        self.G = G
+        self.x, self.y = layout[:, 0], layout[:, 1]
+        # Past the edge budget, the edges between the best connected nodes are drawn
+        edgelist = np.array(G.get_edgelist(), dtype=np.intp).reshape(-1, 2)
+        degree = np.bincount(edgelist.ravel(), minlength=G.vcount())
+        self.edges = edge_trace(level_of_detail(edge_segments(edgelist, self.x, self.y), degree[edgelist].sum(1)))
+        self.centralities = {}
+        self.estimated = False
+
+    def centrality(self, color):
+        if color not in self.centralities:
+            if color == 'Eigencentraility':
+                self.centralities[color] = np.array(self.G.eigenvector_centrality(), dtype=float)
+            else:
+                # Both come out of the same searches, estimated if they take longer than the budget
+                result = path_centrality(*csr_from_edges(self.G.get_edgelist(), self.G.vcount()), budget=BUDGET)
+                self.estimated = not result.exact
+                self.centralities.update(betweenness=result.betweenness, closeness=result.closeness)
+        return self.centralities[color]
+
+    def title(self, color):
+        title = CENTRALITY_TITLES[color]
+        return title + '<br>(estimated)' if color != 'Eigencentraility' and self.estimated else title
+
+
+class GraphPool():
+    """Seeded generated graphs by (style, n, p, seed), up to `max_entries` of them, least recently used evicted first.
+
+    A graph without a seed is a new random graph on every request, so it is
+    never pooled.
+    """
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits, self.misses = 0, 0
+
+    def get(self, n, p, style, seed=None):
+        if seed is None:
+            return GeneratedGraph(*explain_make_graph(n, p, style))
+        # The star does not depend on p
+        key = (style, n, None if style == 'Star' else p, seed)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        graph = GeneratedGraph(*explain_make_graph(n, p, style, seed))
+
+        with self.lock:
+            # Should another request have made it meanwhile, keep the one others may be showing
+            graph = self.entries.setdefault(key, graph)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return graph
+
+
+graph_pool = GraphPool()
+
+# Python code to render networks and figures
+def explain_make_network(n, p, style = 'Erdős–Rényi Random Graph', color = "None", seed = None):
+    graph = graph_pool.get(n, p, style, seed)
+    edges = graph.edges
+
+    node_trace = {'type': 'scatter', 'x': pack(graph.x), 'y': pack(graph.y), 'hovertext': [], 'text': [],
+                  'mode': 'markers', 'textposition': "bottom center", 'hoverinfo': "none", 'marker': {'size': 10}}
+    if color != 'None':
+        node_trace['marker'] = {'size': 10,
+                                'color': pack(graph.centrality(color)), 'cauto':True, 'colorscale':'Bluered',
+                                'colorbar':{'thickness':20, 'title':graph.title(color)}
+                                }
     figure = {
-        "data": [edge_trace, node_trace] ,
+        "data": [edges, same_renderer(node_trace, edges)] ,
         "layout": go.Layout(title=style, showlegend=False, hovermode='closest',
                             margin={'b': 40, 'l': 40, 'r': 40, 't': 40},
                             xaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
@@ -69,6 +148,28 @@ def explain_make_network(n, p, style = 'Erdős–Rényi Random Graph', color = "
     return figure
 
 
+def explain_sketch_network(n, p, style = 'Erdős–Rényi Random Graph', color = "None", seed = None):
+    """A quick stand-in for explain_make_network: the nodes on a circle, coloured by degree."""
+    G = explain_generate(n, p, style, seed)
+    angle = 2 * np.pi * np.arange(n) / max(n, 1)
+    x, y = np.cos(angle), np.sin(angle)
+    edgelist = np.array(G.get_edgelist(), dtype=np.intp).reshape(-1, 2)
+    edges = edge_trace(level_of_detail(edge_segments(edgelist, x, y)))
+
+    node_trace = {'type': 'scatter', 'x': pack(x), 'y': pack(y), 'hovertext': [], 'text': [],
+                  'mode': 'markers', 'hoverinfo': "none", 'marker': {'size': 10}}
+    if color != 'None':
+        node_trace['marker'] = {'size': 10, 'color': pack(np.bincount(edgelist.ravel(), minlength=n)),
+                                'cauto': True, 'colorscale': 'Bluered',
+                                'colorbar': {'thickness': 20, 'title': 'Degree<br>(for now)'}}
+    return {"data": [edges, same_renderer(node_trace, edges)],
+            "layout": go.Layout(title=style + " (still laying out)", showlegend=False, hovermode='closest',
+                                margin={'b': 40, 'l': 40, 'r': 40, 't': 40},
+                                xaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
+                                yaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False, 'scaleanchor': 'x'},
+                                height=600)}
+
+
 # Define the tab html
 explain_tab = dcc.Tab(label='Introduction', children = [
     html.Div(
@@ -131,6 +232,12 @@ explain_tab = dcc.Tab(label='Introduction', children = [
                             ),
                             html.Div(id="explain_N_M_output"),
                             dcc.Markdown(d("""
+                            **Random seed**
+
+                            Leave empty for a new random graph every time, or pick a seed to get the same graph back.
+                            """)),
+                            dcc.Input(id='explain_seed', type='number', placeholder='Random', debounce=True, min=0, max=2**32 - 1, step=1),
+                            dcc.Markdown(d("""
                             ### Graph Type 
                             There are many different ways to generate a graph. Here is just a few. Have a play and see how they behave!
                             """)),
@@ -172,7 +279,7 @@ explain_tab = dcc.Tab(label='Introduction', children = [
             html.Div(
                 className="six columns",
                 children=[dcc.Graph(id="explain_graph",
-                                    figure=explain_make_network(10, 0.5))],
+                                    figure=startup_figure(lambda: explain_make_network(10, 0.5)))],
             ),
         ]
     )
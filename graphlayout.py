@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Node positions for the network figures.
+#
+# Layouts are computed by one of three engines and cached by a fingerprint
+# of the graph, so the same graph is only ever laid out once per worker:
+#
+#   fr      igraph's Fruchterman-Reingold, as the app always used
+#   drl     igraph's DrL, multilevel, for graphs of many thousands of nodes
+#   numpy   a vectorized Fruchterman-Reingold in numpy
+#
+# NETWORKS_LAYOUT picks the engine and NETWORKS_LAYOUT_ITERATIONS its
+# iteration budget. A graph grown node by node, each node only linking to
+# earlier ones like the explain tab's generated graphs, holds the graph it was
+# at fewer nodes in its first nodes. Its layout starts from that graph's at
+# the nearest multiple of WARM_GRID nodes below, when that is at most
+# WARM_CHANGE of them fewer, and then only needs a fraction of the
+# iterations. That graph is always laid out cold, so a layout only depends on
+# its own graph, never on which graphs were laid out before it.
+import hashlib, os, random, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+ALGORITHM = os.environ.get('NETWORKS_LAYOUT', 'fr')
+ITERATIONS = int(os.environ.get('NETWORKS_LAYOUT_ITERATIONS', 500))
+WARM_CHANGE = 0.2
+WARM_ITERATIONS = 0.2
+WARM_GRID = 8
+# Default DrL iterations of each stage, which a budget scales
+DRL_STAGES = {'liquid_iterations': 200, 'expansion_iterations': 200, 'cooldown_iterations': 200,
+              'crunch_iterations': 50, 'simmer_iterations': 100}
+BLOCK = 512
+
+
+class ThreadRandom(threading.local):
+    """igraph's random number generator: Python's random module, or the generator seeded() gave this thread."""
+    generator = random
+
+    def getrandbits(self, bits):
+        return self.generator.getrandbits(bits)
+
+    def randint(self, low, high):
+        return self.generator.randint(low, high)
+
+    def random(self):
+        return self.generator.random()
+
+    def gauss(self, mu, sigma):
+        return self.generator.gauss(mu, sigma)
+
+    def seed(self, seed=None):
+        self.generator.seed(seed)
+
+
+thread_random = ThreadRandom()
+
+
+@contextmanager
+def seeded(seed):
+    """igraph draws from a random.Random(seed) of this thread's own in the block, other threads as before."""
+    import igraph as ig
+    # igraph keeps one generator for the process, which looks up each thread's
+    ig.set_random_number_generator(thread_random)
+    previous = thread_random.generator
+    thread_random.generator = random.Random(seed)
+    try:
+        yield
+    finally:
+        thread_random.generator = previous
+
+
+def as_graph(edgelist, n):
+    import igraph as ig
+    edges = np.asarray(edgelist, dtype=np.intp).reshape(-1, 2)
+    return ig.Graph(n=n, edges=edges.tolist())
+
+
+def as_list(weights):
+    return None if weights is None else np.asarray(weights, dtype=float).tolist()
+
+
+def random_start(n, seed=None):
+    return np.random.RandomState(seed).uniform(-np.sqrt(n) / 2, np.sqrt(n) / 2, (n, 2))
+
+
+def fruchterman_reingold(edgelist, n, weights=None, iterations=ITERATIONS, start=None, seed=None):
+    """igraph's Fruchterman-Reingold layout, from `start` or random positions drawn from `seed`."""
+    G = as_graph(edgelist, n)
+    options = {'niter': iterations, 'seed': random_start(n, seed).tolist()}
+    if start is not None:
+        # Refine rather than shake up a layout that is nearly right
+        options.update(seed=start.tolist(), start_temp=np.sqrt(n) / 40)
+    # igraph also nudges nodes at random as it goes
+    with seeded(seed):
+        return np.array(G.layout_fruchterman_reingold(weights=as_list(weights), **options).coords).reshape(-1, 2)
+
+
+def drl(edgelist, n, weights=None, iterations=ITERATIONS, start=None, seed=None):
+    """igraph's DrL layout, with each stage's iterations scaled to the budget."""
+    G = as_graph(edgelist, n)
+    scale = iterations / sum(DRL_STAGES.values())
+    options = {stage: max(1, int(round(count * scale))) for stage, count in DRL_STAGES.items()}
+    start = random_start(n, seed) if start is None else start
+    with seeded(seed):
+        return np.array(G.layout_drl(weights=as_list(weights), seed=start.tolist(), options=options).coords).reshape(-1, 2)
+
+
+def force_directed(edgelist, n, weights=None, iterations=ITERATIONS, start=None, seed=None):
+    """Fruchterman-Reingold in numpy: all pairs repel, edges attract, moves capped by a cooling temperature.
+
+    The repulsion is summed over blocks of BLOCK nodes, so memory stays
+    O(BLOCK * n) while every step is vectorized.
+    """
+    edges = np.asarray(edgelist, dtype=np.intp).reshape(-1, 2)
+    weights = np.ones(len(edges)) if weights is None else np.asarray(weights, dtype=float)
+    if start is None:
+        positions = random_start(n, seed)
+        temperature = np.sqrt(n) / 10
+    else:
+        positions = np.array(start, dtype=float)
+        temperature = np.sqrt(n) / 40
+    if n < 2:
+        return positions
+
+    for step in range(iterations):
+        displacement = np.zeros((n, 2))
+        x, y = positions[:, 0], positions[:, 1]
+        for block in range(0, n, BLOCK):
+            # x and y apart: (BLOCK, n) arrays are much faster than (BLOCK, n, 2) ones
+            dx, dy = x[block:block + BLOCK, None] - x[None, :], y[block:block + BLOCK, None] - y[None, :]
+            inverse = 1 / np.maximum(dx * dx + dy * dy, 1e-9)
+            displacement[block:block + BLOCK, 0] = (dx * inverse).sum(1)
+            displacement[block:block + BLOCK, 1] = (dy * inverse).sum(1)
+        delta = positions[edges[:, 0]] - positions[edges[:, 1]]
+        pull = delta * (np.sqrt((delta ** 2).sum(1)) * weights)[:, None]
+        displacement -= np.stack([np.bincount(edges[:, 0], pull[:, i], n) - np.bincount(edges[:, 1], pull[:, i], n)
+                                  for i in range(2)], axis=1)
+
+        length = np.maximum(np.sqrt((displacement ** 2).sum(1)), 1e-9)
+        limit = temperature * (1 - step / iterations)
+        positions += displacement * (np.minimum(length, limit) / length)[:, None]
+    return positions
+
+
+ALGORITHMS = {'fr': fruchterman_reingold, 'drl': drl, 'numpy': force_directed}
+
+
+def fingerprint(edgelist, n, weights=None, *options):
+    """A digest of a graph's edges, node count, weights and layout options."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((n, options)).encode('utf-8'))
+    digest.update(np.ascontiguousarray(edgelist, dtype='<i8').tobytes())
+    if weights is not None:
+        digest.update(np.ascontiguousarray(weights, dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def warm_start(previous, edgelist, n, seed=None):
+    """Starting positions for n nodes from a layout of the first few of them.
+
+    Nodes the previous layout had keep their place; new nodes start at the
+    mean of their placed neighbours, or at random within the layout if they
+    have none.
+    """
+    kept = min(n, len(previous))
+    start = np.empty((n, 2))
+    start[:kept] = previous[:kept]
+    if kept < n:
+        edges = np.asarray(edgelist, dtype=np.intp).reshape(-1, 2)
+        edges = np.concatenate([edges, edges[:, ::-1]])
+        edges = edges[(edges[:, 0] >= kept) & (edges[:, 1] < kept)]
+        counts = np.bincount(edges[:, 0], minlength=n)[kept:]
+        sums = np.stack([np.bincount(edges[:, 0], previous[edges[:, 1], i], n)[kept:] for i in range(2)], axis=1)
+        low, high = start[:kept].min(0), start[:kept].max(0)
+        random = np.random.RandomState(seed).uniform(low, high, (n - kept, 2))
+        start[kept:] = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], random)
+    return start
+
+
+def aligned(positions, start, m):
+    """`positions` turned, mirrored and moved to best fit `start` over the first m nodes.
+
+    igraph may hand a layout back rotated or mirrored from where it started,
+    which would throw the nodes of a warm start across the figure.
+    """
+    centre, start_centre = positions[:m].mean(0), start[:m].mean(0)
+    u, _, vt = np.linalg.svd((positions[:m] - centre).T.dot(start[:m] - start_centre))
+    return (positions - centre).dot(u.dot(vt)) + start_centre
+
+
+def first_nodes(edgelist, m):
+    """The edges of `edgelist` between its first m nodes."""
+    edges = np.asarray(edgelist, dtype=np.intp).reshape(-1, 2)
+    return edges[(edges < m).all(1)]
+
+
+def anchor_size(n):
+    """The node count of the graph a layout of n nodes warm-starts from, or None to lay it out cold."""
+    m = n - n % WARM_GRID
+    return m if 0 < m < n and n - m <= WARM_CHANGE * n else None
+
+
+class LayoutService():
+    """Computes and caches layouts.
+
+    Up to `max_entries` layouts are kept, least recently used evicted first.
+    Cached layouts are shared, so callers must not modify them.
+    """
+    def __init__(self, algorithm=ALGORITHM, iterations=ITERATIONS, max_entries=256):
+        if algorithm not in ALGORITHMS:
+            raise ValueError("unknown layout algorithm %r, expected one of %s" % (algorithm, ', '.join(ALGORITHMS)))
+        self.algorithm = algorithm
+        self.iterations = iterations
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits, self.warm, self.misses = 0, 0, 0
+
+    def layout(self, edgelist, n, weights=None, seed=None, grown=False, algorithm=None, iterations=None):
+        """An (n, 2) array of node positions for the graph, from the cache if it was laid out before.
+
+        A `grown` graph may warm-start from the layout of the unweighted
+        graph of its first nodes.
+        """
+        algorithm = algorithm or self.algorithm
+        iterations = iterations or self.iterations
+        m = anchor_size(n) if grown else None
+        anchor = None if m is None else first_nodes(edgelist, m)
+        key = fingerprint(edgelist, n, weights, algorithm, iterations, seed, m)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        start = None
+        if anchor is not None:
+            start = warm_start(self.layout(anchor, m, seed=seed, algorithm=algorithm, iterations=iterations),
+                               edgelist, n, seed)
+            iterations = max(1, int(iterations * WARM_ITERATIONS))
+        positions = ALGORITHMS[algorithm](edgelist, n, weights, iterations=iterations, start=start, seed=seed)
+        if start is not None:
+            positions = aligned(positions, start, m)
+        positions.setflags(write=False)
+
+        with self.lock:
+            self.entries[key] = positions
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            if start is None:
+                self.misses += 1
+            else:
+                self.warm += 1
+        return positions
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'warm': self.warm, 'misses': self.misses, 'entries': len(self.entries)}
+
+
+layout_service = LayoutService()
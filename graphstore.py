@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# A compact columnar file format for the app's graphs.
+#
+# igraph pickles unpickle every vertex and edge attribute into Python
+# objects, separately in every gunicorn worker. A .graph file instead holds
+# flat little endian arrays which are memory-mapped, so loading is close to
+# free and all workers share the same pages of the OS file cache.
+#
+#   8 bytes      b'NETGRAPH'
+#   8 bytes      length of the JSON header, uint64
+#   header       {"directed", "vcount", "ecount", "arrays": {name: [dtype, shape, offset]},
+#                 "vertex_attributes": {name: kind}, "edge_attributes": {name: kind},
+#                 "source": {"bytes", "blake2b"} of the pickle it was converted from}
+#   arrays       from the first 64 byte boundary after the header, each at
+#                its offset from there, which is also a multiple of 64
+#
+# The edge list is int32, floats are float64, so that weights threshold
+# exactly as the pickle's do, integers int32 or int64, and a string
+# attribute is a uint8 blob of UTF-8 plus int64 offsets into it. A .graph
+# file converted from a pickle is only loaded while the pickle is unchanged.
+#
+#   python graphstore.py data/*.pickle     writes data/<name>.graph for each
+import hashlib, json, os, struct, sys, warnings
+
+import numpy as np
+
+
+MAGIC = b'NETGRAPH'
+ALIGNMENT = 64
+WRITE_BLOCK = 2**22
+
+
+class StringColumn():
+    """A string attribute stored as one UTF-8 blob and offsets into it."""
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+        return np.array([self[j] for j in np.arange(len(self))[i]], dtype=object)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def tolist(self):
+        return list(self)
+
+    def to_bytes(self):
+        """The strings as a numpy array of fixed width byte strings, without decoding each."""
+        lengths = np.diff(self.offsets)
+        width = max(int(lengths.max()) if len(lengths) else 0, 1)
+        padded = np.zeros((len(lengths), width), dtype=np.uint8)
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        columns = np.arange(len(rows)) - np.repeat(self.offsets[:-1] - self.offsets[0], lengths)
+        padded[rows, columns] = self.data[self.offsets[0]:self.offsets[-1]]
+        return padded.view('S%d' % width).ravel()
+
+
+class AttributeColumns():
+    """Attribute lookup by name, as igraph's G.vs / G.es do it."""
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def attributes(self):
+        return list(self.columns)
+
+
+class ColumnarGraph():
+    """A graph read from a .graph file.
+
+    It offers the parts of the igraph API the app uses: G.vs[name],
+    G.es[name], get_edgelist(), vcount(), ecount() and is_directed().
+    Attributes are numpy arrays (or StringColumns) backed by the mapped file.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            magic, header_length = struct.unpack('<8sQ', f.read(16))
+            if magic != MAGIC:
+                raise ValueError("%s is not a .graph file" % path)
+            header = json.loads(f.read(header_length).decode('utf-8'))
+
+        mapped = np.memmap(path, dtype=np.uint8, mode='r')
+        start = aligned(16 + header_length)
+        self.arrays = {}
+        for name, (dtype, shape, offset) in header['arrays'].items():
+            dtype = np.dtype(dtype)
+            size = dtype.itemsize * int(np.prod(shape))
+            self.arrays[name] = mapped[start + offset:start + offset + size].view(dtype).reshape(shape)
+
+        self.directed = header['directed']
+        self.source = header.get('source')
+        self.n, self.m = header['vcount'], header['ecount']
+        self.vs = AttributeColumns({name: self.column('v', name, kind) for name, kind in header['vertex_attributes'].items()})
+        self.es = AttributeColumns({name: self.column('e', name, kind) for name, kind in header['edge_attributes'].items()})
+
+    def column(self, prefix, name, kind):
+        key = '%s/%s' % (prefix, name)
+        if kind == 'string':
+            return StringColumn(self.arrays[key + '/data'], self.arrays[key + '/offsets'])
+        return self.arrays[key]
+
+    def vcount(self):
+        return self.n
+
+    def ecount(self):
+        return self.m
+
+    def is_directed(self):
+        return self.directed
+
+    def get_edgelist(self):
+        return self.arrays['edges']
+
+    def csr(self):
+        """(indptr, indices) adjacency, stored in the file or built from the edges."""
+        if 'csr/indptr' in self.arrays:
+            return self.arrays['csr/indptr'], self.arrays['csr/indices']
+        from edges import csr_from_edges
+        return csr_from_edges(self.get_edgelist(), self.n, self.directed)
+
+    def to_igraph(self):
+        """An igraph.Graph copy, for the algorithms only igraph has."""
+        import igraph as ig
+        G = ig.Graph(n=self.n, edges=self.get_edgelist().tolist(), directed=self.directed)
+        for name in self.vs.attributes():
+            G.vs[name] = self.vs[name].tolist()
+        for name in self.es.attributes():
+            G.es[name] = self.es[name].tolist()
+        return G
+
+
+def encode_column(values):
+    """Arrays to store for one attribute, and its kind."""
+    if isinstance(values, StringColumn):
+        return {'/data': values.data, '/offsets': values.offsets}, 'string'
+    if not isinstance(values, np.ndarray) and all(isinstance(value, str) for value in values):
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+        offsets[1:] = np.cumsum([len(value) for value in encoded])
+        return {'/data': np.frombuffer(b''.join(encoded), dtype=np.uint8), '/offsets': offsets}, 'string'
+
+    array = np.asarray(values)
+    if array.dtype.kind == 'f':
+        array = array.astype('<f8')
+    elif array.dtype.kind in 'iu':
+        small = array.size == 0 or (array.min() >= np.iinfo(np.int32).min and array.max() <= np.iinfo(np.int32).max)
+        array = array.astype('<i4' if small else '<i8')
+    elif array.dtype.kind != 'b':
+        raise TypeError("cannot store attribute values of type %s" % array.dtype)
+    return {'': array}, 'numeric'
+
+
+def write_graph(path, edges, n, directed=False, vertex_attributes={}, edge_attributes={}, arrays={}, source=None):
+    """Write a .graph file from an edge list and attribute sequences.
+
+    `arrays` are stored as they are, e.g. a CSR adjacency next to the edges.
+    `source` is the source_digest() of the file the graph was converted from.
+    """
+    stored = {'edges': np.asarray(edges, dtype='<i4').reshape(-1, 2)}
+    header = {'directed': bool(directed), 'vcount': int(n), 'ecount': len(stored['edges']),
+              'vertex_attributes': {}, 'edge_attributes': {}, 'source': source}
+    for prefix, attributes, kinds in [('v', vertex_attributes, header['vertex_attributes']),
+                                      ('e', edge_attributes, header['edge_attributes'])]:
+        for name, values in attributes.items():
+            columns, kinds[name] = encode_column(values)
+            for suffix, array in columns.items():
+                stored['%s/%s%s' % (prefix, name, suffix)] = array
+    for name, array in arrays.items():
+        stored[name] = np.asarray(array)
+
+    # Offsets are relative to the end of the header, rounded up to ALIGNMENT
+    layout, offset = {}, 0
+    for name, array in stored.items():
+        layout[name] = [array.dtype.newbyteorder('<').str, list(array.shape), offset]
+        offset = aligned(offset + array.nbytes)
+    header['arrays'] = layout
+    encoded = json.dumps(header).encode('utf-8')
+    start = aligned(16 + len(encoded))
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<8sQ', MAGIC, len(encoded)))
+        f.write(encoded)
+        for name, array in stored.items():
+            f.seek(start + layout[name][2])
+            # In blocks, so that arrays mapped from temporary files never sit in memory whole
+            flat = array.reshape(-1)
+            for block in range(0, len(flat), WRITE_BLOCK):
+                f.write(np.ascontiguousarray(flat[block:block + WRITE_BLOCK], dtype=layout[name][0]).tobytes())
+        f.truncate(start + offset)
+
+
+def aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def source_digest(path):
+    """The size and hash of a file a graph is converted from."""
+    with open(path, 'rb') as f:
+        contents = f.read()
+    return {'bytes': len(contents), 'blake2b': hashlib.blake2b(contents, digest_size=16).hexdigest()}
+
+
+def convert(G, path, source=None):
+    """Write an igraph.Graph, with all of its attributes, to a .graph file, converted from the file `source`."""
+    write_graph(path, G.get_edgelist(), G.vcount(), G.is_directed(),
+                {name: G.vs[name] for name in G.vs.attributes()},
+                {name: G.es[name] for name in G.es.attributes()},
+                source=None if source is None else source_digest(source))
+
+
+def load_graph(name, data='data'):
+    """The graph data/<name>, from its .graph file if there is one converted from the current pickle, else the pickle."""
+    path, pickle_path = os.path.join(data, name + '.graph'), os.path.join(data, name + '.pickle')
+    if os.path.exists(path):
+        G = ColumnarGraph(path)
+        if not os.path.exists(pickle_path):
+            return G
+        # Checking the size first, the pickle is only hashed when it could still match
+        if G.source is not None and G.source['bytes'] == os.path.getsize(pickle_path) \
+                and G.source == source_digest(pickle_path):
+            return G
+        warnings.warn("%s was not converted from the current %s, which is loaded instead; "
+                      "rewrite it with python graphstore.py %s" % (path, pickle_path, pickle_path))
+    import igraph as ig
+    return ig.Graph.Read_Pickle(pickle_path)
+
+
+if __name__ == '__main__':
+    import igraph as ig
+    for pickle_path in sys.argv[1:]:
+        path = os.path.splitext(pickle_path)[0] + '.graph'
+        convert(ig.Graph.Read_Pickle(pickle_path), path, pickle_path)
+        print("%s (%d KB) -> %s (%d KB)" % (pickle_path, os.path.getsize(pickle_path) // 1024,
+                                           path, os.path.getsize(path) // 1024))
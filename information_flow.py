@@ -9,74 +9,48 @@ import dash_html_components as html
 import plotly.graph_objs as go
 from textwrap import dedent as d
 
-import scipy.stats as ss
+from edges import EdgeIndex, edge_trace, same_renderer
+from payload import pack
+from graphstore import load_graph
+from clientside import CLIENTSIDE, edge_store
+from lazy import EMPTY_FIGURE
+
 class InformationFlow():
     def __init__(self):
-        self.information_flow_graph = ig.Graph.Read_Pickle("data/information_flow_graph.pickle")
-        self.edge_weights = self.get_edge_weights()
-        self.edge_data = self.make_edge_data()
+        self.information_flow_graph = load_graph("information_flow_graph")
+        G = self.information_flow_graph
+        self.edge_index = EdgeIndex(G.get_edgelist(), G.vs['x'], G.vs['y'], G.es['weight'])
         self.figure = self.make_inital_graph()
         
         
-    def threshold_edges(self, threshold):
-        
-        edge_data = self.edge_data[self.edge_weights > threshold, :]
-        
-        edge_trace = go.Scatter(x=list(edge_data[:,:3].flatten()), 
-                        y=list(edge_data[:,3:].flatten()),
-                        mode='lines',\
-                        line={'width': 0.2},\
-                        line_shape='spline',\
-                        opacity=0.5,\
-                        hoverinfo='none')
-        self.figure['data'][0] = edge_trace
-        return self.figure
-    
-    def make_edge_data(self):
+    def threshold_edges(self, threshold, view=None):
+        edges = edge_trace(self.edge_index.visible(threshold, view))
+        return dict(self.figure, data=[edges, same_renderer(self.figure['data'][1], edges)])
+
+    def edge_store(self):
         G = self.information_flow_graph
-        edge_data = []
-        for e in G.es:
-            n0, n1 = e.tuple
-            x0, y0 = G.vs[n0]['x'], G.vs[n0]['y']
-            x1, y1 = G.vs[n1]['x'], G.vs[n1]['y']
-            edge_data += [(x0, x1, None, y0, y1, None)]
-        edge_data = np.array(edge_data)
-        
-        return edge_data
-    
-    def get_edge_weights(self):
-        edge_weights = np.array(self.information_flow_graph.es['weight'])
-        weigths_rank = ss.rankdata(edge_weights)
-        weigths_percentile = weigths_rank / max(weigths_rank)
-        return weigths_percentile
+        return edge_store(self.edge_index, G.vs['x'], G.vs['y'], self.figure['layout'])
     
         
     def make_inital_graph(self):
         
         G = self.information_flow_graph
         
-        edge_trace = go.Scatter(x=list(self.edge_data[:,:3].flatten()), 
-                        y=list(self.edge_data[:,3:].flatten()),
-                        mode='lines',\
-                        line={'width': 0.2},\
-                        line_shape='spline',\
-                        opacity=0.5,\
-                        hoverinfo='none')
-
         hovertext = ["%s<br>Bias: %s" % items for items in zip(G.vs['name'], G.vs['bias'])]
         
-        node_trace = go.Scatter(x=G.vs['x'], y=G.vs['y'], 
-                                hovertext=hovertext, text=[], mode='markers+text', textposition="bottom center", \
-                                hoverinfo="text", marker={'size': 10, 'color':G.vs['hex_color']})
+        node_trace = {'type': 'scatter', 'x': pack(G.vs['x']), 'y': pack(G.vs['y']),
+                      'hovertext': hovertext, 'text': [], 'mode': 'markers+text', 'textposition': "bottom center",
+                      'hoverinfo': "text", 'marker': {'size': 10, 'color': list(G.vs['hex_color'])}}
 
         figure = {
-            "data": [edge_trace, node_trace] ,
+            "data": [edge_trace(self.edge_index.visible(0)), node_trace] ,
             "layout": go.Layout(title='News Flow Visualization', showlegend=True, hovermode='closest',
                                 margin={'b': 40, 'l': 40, 'r': 40, 't': 40},
                                 xaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
                                 yaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
                                 height=600,
                                 clickmode='event+select',
+                                uirevision=True,
                                 )}
         return figure
 
@@ -122,7 +96,10 @@ information_flow_tab = dcc.Tab(label='Information Flow', children = [
             html.Div(
                 className="eight columns",
                 children=[dcc.Graph(id="information_flow-graph",
-                                    figure=information_flow.threshold_edges(0.5))],
+                                    figure=EMPTY_FIGURE if CLIENTSIDE else information_flow.threshold_edges(0.5))]
+                         + ([dcc.Store(id='information_flow-edges', data=information_flow.edge_store()),
+                             dcc.Store(id='information_flow-nodes', data=information_flow.figure['data'][1])]
+                            if CLIENTSIDE else []),
             ),
         ]
     )
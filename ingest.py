@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Streaming ingest of the full Spotify artist collaboration graph.
+#
+# The artist metadata and the edge list are read in chunks of CHUNK_ROWS
+# rows and go straight into a CSR adjacency, without an igraph.Graph or a
+# Python object per artist or edge, so peak memory stays a small multiple of
+# the finished arrays. The result is a .graph file (see graphstore.py) with
+# the CSR stored next to the edges, which Spotify uses to extract the
+# subgraph above any popularity threshold on demand.
+#
+#   python ingest.py artists.csv edges.csv [data/spotify_full.graph]
+#
+# Both inputs may be CSV or JSON lines (.jsonl). Artists have the columns
+# id, name, popularity, followers and optionally genre; edges have source and
+# target, which are artist ids. Edges to unknown artists and self loops are
+# dropped.
+import os, sys, tempfile, time
+
+import numpy as np, pandas as pd
+
+from graphstore import StringColumn, write_graph
+
+
+CHUNK_ROWS = 2**19
+ARTIST_COLUMNS = ['id', 'name', 'popularity', 'followers']
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """DataFrames of up to `chunk_rows` rows of a CSV or JSON lines file, with strings kept as strings."""
+    if path.endswith('.jsonl') or path.endswith('.json'):
+        return pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False)
+    return pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False)
+
+
+class StringColumnBuilder():
+    """Appends chunks of strings to a StringColumn's blob and offsets."""
+    def __init__(self):
+        self.blobs, self.lengths = [], []
+
+    def append(self, values):
+        encoded = [value.encode('utf-8') for value in pd.Series(values).astype(str).tolist()]
+        self.blobs.append(b''.join(encoded))
+        self.lengths.append(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+
+    def build(self):
+        lengths = np.concatenate(self.lengths) if self.lengths else np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype='<i8')
+        np.cumsum(lengths, out=offsets[1:])
+        return StringColumn(np.frombuffer(b''.join(self.blobs), dtype=np.uint8), offsets)
+
+
+def id_hashes(ids):
+    """64 bit hashes of byte string ids, from their bytes in 8 byte words."""
+    words = -(-max(ids.dtype.itemsize, 1) // 8)
+    packed = np.ascontiguousarray(ids, dtype='S%d' % (8 * words)).view('<u8').reshape(len(ids), words)
+    hashes = np.zeros(len(ids), dtype=np.uint64)
+    for word in range(words):
+        hashes = (hashes ^ packed[:, word]) * np.uint64(0x9E3779B97F4A7C15)
+        hashes ^= hashes >> np.uint64(29)
+    return hashes
+
+
+class ArtistIndex():
+    """Maps artist ids to vertex numbers.
+
+    The ids are searched by their 64 bit hashes, which is much faster than
+    comparing byte strings; a match is then confirmed against the id itself.
+    Should two ids share a hash, the byte strings are searched instead.
+    """
+    def __init__(self, ids):
+        sorted_ids = np.sort(ids)
+        duplicated = sorted_ids[1:] == sorted_ids[:-1]
+        if duplicated.any():
+            raise ValueError("artist id %r appears more than once" % sorted_ids[1:][duplicated][0].decode())
+        self.ids = ids
+        self.keys = id_hashes(ids)
+        if len(np.unique(self.keys)) < len(ids):
+            self.keys = ids
+        self.order = np.argsort(self.keys, kind='mergesort')
+        self.sorted_keys = self.keys[self.order]
+
+    def lookup(self, ids):
+        """Vertex numbers of `ids`, and a mask of the ids that are known."""
+        ids = np.asarray(ids, dtype='S')
+        keys = ids if self.keys is self.ids else id_hashes(ids)
+        found = np.searchsorted(self.sorted_keys, keys)
+        found[found == len(self.sorted_keys)] = 0
+        vertices = self.order[found]
+        return vertices, self.ids[vertices] == ids
+
+
+def ingest_artists(path):
+    """Vertex attributes and the ArtistIndex of the artist metadata at `path`."""
+    ids, popularity, followers = [], [], []
+    columns = {name: StringColumnBuilder() for name in ['name', 'id', 'genre']}
+    for chunk in read_chunks(path):
+        missing = [name for name in ARTIST_COLUMNS if name not in chunk]
+        if missing:
+            raise ValueError("%s has no %s column" % (path, ', '.join(missing)))
+        chunk_ids = chunk['id'].astype(str)
+        ids.append(chunk_ids.values.astype('S'))
+        columns['id'].append(chunk_ids)
+        columns['name'].append(chunk['name'])
+        if 'genre' in chunk:
+            columns['genre'].append(chunk['genre'])
+        popularity.append(pd.to_numeric(chunk['popularity']).values.astype(np.int32))
+        followers.append(pd.to_numeric(chunk['followers']).values.astype(np.int64))
+
+    index = ArtistIndex(np.concatenate(ids))
+    # The same names as spotify_core_graph: name is the Spotify id, Artist the display name
+    attributes = {'name': columns['id'].build(), 'Artist': columns['name'].build(),
+                  'Popularity': np.concatenate(popularity), 'Followers': np.concatenate(followers)}
+    if columns['genre'].lengths:
+        attributes['Genre'] = columns['genre'].build()
+    return attributes, index
+
+
+def ingest_edges(path, index, n, scratch):
+    """Edge list and CSR adjacency of the edges at `path`, as arrays mapped from files in `scratch`.
+
+    The first pass writes the known edges as int32 pairs and counts degrees,
+    the second places each chunk's neighbours at their rows' fill positions.
+    """
+    degree = np.zeros(n, dtype=np.int64)
+    m, dropped = 0, 0
+    pairs_path = os.path.join(scratch, 'edges')
+    with open(pairs_path, 'wb') as pairs:
+        for chunk in read_chunks(path):
+            sources, known_sources = index.lookup(chunk['source'].astype(str).values)
+            targets, known_targets = index.lookup(chunk['target'].astype(str).values)
+            keep = known_sources & known_targets & (sources != targets)
+            dropped += len(keep) - int(keep.sum())
+            edges = np.stack([sources[keep], targets[keep]], axis=1).astype('<i4')
+            pairs.write(edges.tobytes())
+            degree += np.bincount(edges.ravel(), minlength=n)
+            m += len(edges)
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(degree, out=indptr[1:])
+    if m == 0:
+        return np.zeros((0, 2), dtype='<i4'), indptr, np.zeros(0, dtype='<i4'), dropped
+
+    edges = np.memmap(pairs_path, dtype='<i4', mode='r', shape=(m, 2))
+    indices = np.memmap(os.path.join(scratch, 'indices'), dtype='<i4', mode='w+', shape=(2 * m,))
+    fill = indptr[:-1].copy()
+    for start in range(0, m, CHUNK_ROWS):
+        block = np.asarray(edges[start:start + CHUNK_ROWS])
+        rows = np.concatenate([block[:, 0], block[:, 1]])
+        columns = np.concatenate([block[:, 1], block[:, 0]])
+        order = np.argsort(rows, kind='mergesort')
+        rows, columns = rows[order], columns[order]
+        counts = np.bincount(rows, minlength=n)
+        # Rank of each entry within its row in this chunk
+        rank = np.arange(len(rows)) - (np.cumsum(counts) - counts)[rows]
+        indices[fill[rows] + rank] = columns
+        fill += counts
+    indices.flush()
+    return edges, indptr, indices, dropped
+
+
+def ingest(artists_path, edges_path, path='data/spotify_full.graph'):
+    """Write the graph of `artists_path` and `edges_path` to `path`, and return counts and timings."""
+    start = time.perf_counter()
+    attributes, index = ingest_artists(artists_path)
+    n = len(attributes['Popularity'])
+    artists_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as scratch:
+        edges, indptr, indices, dropped = ingest_edges(edges_path, index, n, scratch)
+        edges_seconds = time.perf_counter() - start - artists_seconds
+        write_graph(path, edges, n, False, attributes, arrays={'csr/indptr': indptr, 'csr/indices': indices})
+        m = len(edges)
+        del edges, indices
+
+    return {'vcount': n, 'ecount': m, 'dropped': dropped, 'artists_seconds': artists_seconds,
+            'edges_seconds': edges_seconds, 'seconds': time.perf_counter() - start}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (3, 4):
+        sys.exit("usage: python ingest.py artists.csv edges.csv [data/spotify_full.graph]")
+    stats = ingest(*sys.argv[1:])
+    print("%(vcount)d artists, %(ecount)d edges (%(dropped)d dropped) in %(seconds).1f s" % stats)
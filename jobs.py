@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# A job layer for the expensive callbacks.
+#
+# Dragging a slider sends a request for every value it passes, but only the
+# last one matters. Callbacks decorated with `background` run in a bounded
+# thread pool instead of the request thread, and every browser session keeps
+# a generation count per callback, bumped by each new request:
+#
+#   - a job still queued when a newer request from its session arrives is
+#     dropped without running
+#   - a job that finishes after a newer request arrived answers with no update
+#   - a job that takes longer than NETWORKS_JOB_TIMEOUT seconds answers with
+#     the callback's cheaper fallback figure, and finishes into the response
+#     cache for the next request
+#
+# Threads cannot be stopped, so a job already running when it is superseded
+# runs to the end, and its result is still cached. Requests from one session
+# only overlap when the server runs several threads per worker, as the
+# Procfile's gthread workers do; each worker keeps its own counts. Requests
+# without the session cookie the page sets are never dropped, as browsers
+# behind one proxy would otherwise drop each other's.
+import os, secrets, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import wraps
+
+from dash.exceptions import PreventUpdate
+
+from cache import callback_cache
+
+
+JOB_WORKERS = int(os.environ.get('NETWORKS_JOB_WORKERS', os.cpu_count() or 1))
+JOB_TIMEOUT = float(os.environ.get('NETWORKS_JOB_TIMEOUT', 2))
+SESSION_COOKIE = 'networks_session'
+MAX_SESSIONS = 10000
+
+SUPERSEDED = object()
+
+# CPU seconds of the jobs run for the request thread, which metrics.py adds to the thread's own
+job_time = threading.local()
+
+
+class JobRunner():
+    """Runs callbacks in a pool of `workers` threads, dropping those superseded by a newer request."""
+    def __init__(self, workers=JOB_WORKERS, timeout=JOB_TIMEOUT, max_sessions=MAX_SESSIONS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job') if workers > 0 else None
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.generations = OrderedDict()
+        self.lock = threading.Lock()
+        self.completed, self.dropped, self.stale, self.fallbacks = 0, 0, 0, 0
+
+    def start(self, key):
+        """A new generation for `key`, superseding the running ones."""
+        with self.lock:
+            generation = self.generations.get(key, 0) + 1
+            self.generations[key] = generation
+            self.generations.move_to_end(key)
+            while len(self.generations) > self.max_sessions:
+                self.generations.popitem(last=False)
+            return generation
+
+    def current(self, key, generation):
+        if key is None:
+            return True
+        with self.lock:
+            return self.generations.get(key) == generation
+
+    def count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def run(self, key, function, args, fallback=None):
+        """The value of function(*args), run in the pool, for the newest request of `key`.
+
+        Raises PreventUpdate when a newer request supersedes this one. A
+        `key` of None is never superseded.
+        """
+        generation = None if key is None else self.start(key)
+
+        def job():
+            if not self.current(key, generation):
+                return SUPERSEDED, None, 0.0
+            start = time.thread_time()
+            value = function(*args)
+            return value, getattr(callback_cache.local, 'outcome', None), time.thread_time() - start
+
+        future = self.pool.submit(job)
+        try:
+            value, outcome, cpu_seconds = future.result(None if fallback is None else self.timeout)
+        except TimeoutError:
+            if not self.current(key, generation):
+                self.count('stale')
+                raise PreventUpdate
+            self.count('fallbacks')
+            return fallback(*args)
+
+        job_time.cpu_seconds = getattr(job_time, 'cpu_seconds', 0.0) + cpu_seconds
+        if value is SUPERSEDED:
+            self.count('dropped')
+            raise PreventUpdate
+        if not self.current(key, generation):
+            self.count('stale')
+            raise PreventUpdate
+        # For metrics.py, which reads the request thread's cache outcome
+        if outcome is not None:
+            callback_cache.local.outcome = outcome
+        self.count('completed')
+        return value
+
+    def stats(self):
+        with self.lock:
+            return {'completed': self.completed, 'dropped': self.dropped, 'stale': self.stale,
+                    'fallbacks': self.fallbacks, 'sessions': len(self.generations)}
+
+    def background(self, fallback=None, name=None):
+        """Decorator running a callback as a job, for callbacks above a memoize() decorator.
+
+        Responses already cached are answered in the request thread. `fallback`
+        takes the callback's inputs and returns a figure quickly; without one
+        the request waits for its job however long it takes. Called outside a
+        request, or with NETWORKS_JOB_WORKERS=0, the callback just runs.
+        """
+        def decorator(function):
+            if self.pool is None:
+                return function
+
+            callback = name or function.__name__
+
+            @wraps(function)
+            def wrapper(*args):
+                from flask import has_request_context, request
+                if not has_request_context():
+                    return function(*args)
+                lookup = getattr(function, 'lookup', None)
+                if lookup is not None:
+                    found, value = lookup(*args)
+                    if found:
+                        return value
+                # Without its cookie a browser cannot be told apart from others behind the same address
+                session = request.cookies.get(SESSION_COOKIE)
+                return self.run(None if session is None else (session, callback), function, args, fallback)
+            return wrapper
+        return decorator
+
+
+def add_session_cookie(server):
+    """Give every browser a session cookie, which the job generations are counted by."""
+    @server.after_request
+    def set_session_cookie(response):
+        from flask import request
+        # Not on the publicly cached static files
+        if SESSION_COOKIE not in request.cookies and not request.path.startswith(('/assets/', '/_dash-component-suites/')):
+            response.set_cookie(SESSION_COOKIE, secrets.token_hex(16), httponly=True, samesite='Lax')
+        return response
+    return set_session_cookie
+
+
+job_runner = JobRunner()
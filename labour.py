@@ -1,101 +1,162 @@
-import igraph as ig, numpy as np
+import numpy as np
 
 import plotly
 import dash_core_components as dcc
 import dash_html_components as html
 from textwrap import dedent as d
 import plotly.graph_objs as go
-import base64 # For rendering images
 
+from edges import EdgeIndex, edge_segments, edge_trace, level_of_detail, same_renderer
+from payload import pack
+from graphstore import load_graph
+from lazy import EMPTY_FIGURE, Lazy, startup_figure
+from static import image
+from graphlayout import layout_service
+from clientside import CLIENTSIDE, edge_store, edge_store_component
+from regional import ComplementarityEngine, EmbeddednessEngine, load_employment, region_names, skill_adjacency
+from communities import Communities, load_communities, lookup, stored_resolutions
 
 
-def setup_edges(G):
-    edge_data = []
-    for e in G.es:
-        n0, n1 = e.tuple
-        x0, y0 = G.vs[n0]['x'], G.vs[n0]['y']
-        x1, y1 = G.vs[n1]['x'], G.vs[n1]['y']
-        edge_data += [(x0, x1, None, y0, y1, None)]
-    return np.array(edge_data)
+COMMUNITY_COLORS = plotly.colors.qualitative.Dark24
+
+
+def community_colors(membership):
+    """A colour for each job by its community, grey for jobs in a community of their own."""
+    colors = np.array(COMMUNITY_COLORS, dtype=object)[membership % len(COMMUNITY_COLORS)]
+    colors[np.bincount(membership)[membership] == 1] = 'lightgrey'
+    return colors.tolist()
 
 
 class LabourNetwork():
-    def __init__(self):
-        self.four_digit_G = ig.Graph.Read_Pickle("data/skill_scape_graph.pickle")
-        self.edge_data = setup_edges(self.four_digit_G)
-        self.edge_weights = np.array(self.four_digit_G.es['weight'])
-        self.edge_weights = np.argsort(self.edge_weights) / len(self.edge_weights)
-
-        self.current_threshold = 0
-        self.main_figure = self.get_labour_figure()
-        self.edge_trace = self.update_threshold(0.2)
-
-        self.current_color_choice = "louvain community"
-        self.current_size_choice = 'None'
-        self.louvain_marker = self.main_figure['data'][1]['marker']
-        self.unemployment_marker = {'size':10, 'color':self.four_digit_G.vs['unemployment'], 'cauto':True, 'colorscale':'RdBu', 
-                                       'colorbar':{'thickness':20, 'title':'Percentage<br>Employment<br>Change'}}
-
-    def update_threshold(self, threshold):
-        if self.current_threshold != threshold:
-            ed = self.edge_data[self.edge_weights > threshold,:]
-            self.edge_trace = go.Scatter(x=list(ed[:,:3].flatten()), 
-                        y=list(ed[:,3:].flatten()),
-                        mode='lines',\
-                        line={'width': 0.2},\
-                        line_shape='spline',\
-                        opacity=0.5,\
-                        hoverinfo='none')
-            self.current_threshold = threshold
-            self.main_figure['data'][0] = self.edge_trace
-
-    def update_colors(self, color_choice):
-        if self.current_color_choice != color_choice:
-            if color_choice == "louvain community":
-                self.main_figure['data'][1]['marker'] = self.louvain_marker 
-            elif color_choice == "unemployment":
-                self.main_figure['data'][1]['marker'] = self.unemployment_marker
-            self.current_color_choice = color_choice
-            self.update_size(self.current_size_choice)
-
-    def update_size(self, size_choice):
-        if size_choice == 'None':
-            self.main_figure['data'][1]['marker']['size'] = 0
-        elif size_choice == "total_pop":
-            sizes = np.log(np.array(self.four_digit_G.vs['total_pop'])+1)
-            sizes = list(30*sizes / np.max(sizes))
-            self.main_figure['data'][1]['marker']['size'] = sizes
-        self.current_size_choice = size_choice
-
-
-    def get_updated_graph(self, color_choice, threshold, size_choice):
-        self.update_threshold(threshold)
-        self.update_colors(color_choice)
-        self.update_size(size_choice)
-        return self.main_figure
-
-
-    def get_labour_figure(self, colour_by = "louvain community", new_layout = False, edge_trace = None, size = 10):
+    """The skill network behind the labour tab.
 
+    Everything is built once in __init__ and never changed afterwards, so one
+    instance can serve concurrent requests. get_updated_graph puts a new figure
+    together from the shared edge index and markers on every call.
+    """
+    def __init__(self):
+        self.four_digit_G = load_graph("skill_scape_graph")
         G = self.four_digit_G
+        self.edge_index = EdgeIndex(G.get_edgelist(), G.vs['x'], G.vs['y'], G.es['weight'])
+        self.edgelist = np.array(G.get_edgelist(), dtype=np.intp).reshape(-1, 2)
+        self.weights = np.array(G.es['weight'], dtype=float)
+        adjacency = skill_adjacency(self.edgelist, self.weights, G.vcount())
+        employment = load_employment(G.vs['name'], G.vs['total_pop'])
+        self.embeddedness = EmbeddednessEngine(adjacency, employment)
+        self.complementarity = ComplementarityEngine(adjacency, employment)
+        # Partitions at every resolution communities.py swept, or only the baked one
+        self.communities = load_communities(G.vs['name']) or Communities(
+            np.array([1.0]), np.array([1.0]), np.array([G.vs['louvain community']], dtype=np.int16), np.array([np.nan]))
+        self.community_colors = [community_colors(membership) for membership in self.communities.membership]
+
+        self.hovertext = ["%s<br>Employed in Aus (1000's): %.2f<br>Percentage Females: %.3f" % items for items in 
+                    zip(G.vs['title'], G.vs['total_pop'], np.array(G.vs['Females']) / (np.array(G.vs['Males']) + np.array(G.vs['Females'])))]
+        self.node_trace = {'type': 'scatter', 'x': pack(G.vs['x']), 'y': pack(G.vs['y']), 'hovertext': self.hovertext, 'text': [],
+                           'mode': 'markers+text', 'textposition': "bottom center", 'hoverinfo': "text", 'showlegend': True}
+
+        self.markers = {
+            "louvain community": {'color': [plotly.colors.diverging.Portland[c] for c in G.vs["louvain community"]]},
+            "unemployment": {'color': pack(G.vs['unemployment']), 'cauto':True, 'colorscale':'RdBu', 
+                             'colorbar':{'thickness':20, 'title':'Percentage<br>Employment<br>Change'}},
+        }
+        total_pop = np.log(np.array(G.vs['total_pop'])+1)
+        self.sizes = {
+            'None': 10,
+            "total_pop": pack(30*total_pop / np.max(total_pop)),
+        }
+        self.layout = go.Layout(title='Labour Network Visualization', showlegend=False, hovermode='closest',
+                                margin={'b': 40, 'l': 40, 'r': 40, 't': 40},
+                                xaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
+                                yaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
+                                height=600,
+                                clickmode='event+select',
+                                uirevision=True,
+                                )
+
+        self.main_figure = self.get_updated_graph("louvain community", 0.8, 'None')
+
+    def threshold_trace(self, threshold, view=None):
+        return edge_trace(self.edge_index.visible(threshold, view))
+
+    def embeddedness_marker(self, region):
+        embeddedness, resilience = self.embeddedness.region(region)
+        return {'color': pack(embeddedness), 'cauto': True, 'colorscale': 'Viridis',
+                'colorbar': {'thickness': 20, 'title': 'Embeddedness<br>%s<br>e<sub>total</sub> = %.3g' % (region, resilience)}}
+
+    def advantage_marker(self, region):
+        # Characteristic jobs, with an RCA above 1, come out red
+        rca = self.complementarity.rca[self.complementarity.index.get(region, 0)]
+        return {'color': pack(np.log2(np.clip(rca, 0.25, 4))), 'cmin': -2, 'cmax': 2, 'colorscale': 'RdBu', 'reversescale': True,
+                'colorbar': {'thickness': 20, 'title': 'log<sub>2</sub> RCA<br>%s' % region}}
+
+    def community_marker(self, resolution, keep=None):
+        return {'color': self.community_colors[lookup(self.communities, resolution, keep)]}
+
+    def highlight_traces(self, color_choice, region=None, view=None):
+        """Traces drawn between the edges and the nodes: the edges between a region's characteristic jobs."""
+        if color_choice != 'rca':
+            return []
+        characteristic = np.zeros(self.four_digit_G.vcount(), dtype=bool)
+        characteristic[self.complementarity.jobs(region)] = True
+        kept = characteristic[self.edgelist[:, 0]] & characteristic[self.edgelist[:, 1]]
+        if not kept.any():
+            return []
+        G = self.four_digit_G
+        trace = edge_trace(level_of_detail(edge_segments(self.edgelist[kept], G.vs['x'], G.vs['y']), self.weights[kept], view))
+        return [dict(trace, line=dict(trace['line'], width=1, color='firebrick'), opacity=0.6)]
+
+    def colored_node_trace(self, color_choice, size_choice, region=None, resolution=1.0, keep=None):
+        if color_choice == 'leiden':
+            marker = dict(self.community_marker(resolution, keep), size=self.sizes[size_choice])
+        elif color_choice == 'embeddedness':
+            marker = dict(self.embeddedness_marker(region), size=self.sizes[size_choice])
+        elif color_choice == 'rca':
+            marker = dict(self.advantage_marker(region), size=self.sizes[size_choice])
+        else:
+            marker = dict(self.markers[color_choice], size=self.sizes[size_choice])
+        return dict(self.node_trace, marker=marker)
+
+    def get_updated_graph(self, color_choice, threshold, size_choice, view=None, region=None, resolution=1.0):
+        """A new figure for the given dropdown and slider values, zoomed into `view`.
+
+        The traces, arrays and layout in it are shared with other figures and
+        must not be modified by the caller.
+        """
+        edges = self.threshold_trace(threshold, view)
+        traces = (self.highlight_traces(color_choice, region, view)
+                  + [self.colored_node_trace(color_choice, size_choice, region, resolution, 1 - threshold)])
+        return {"data": [edges] + [same_renderer(trace, edges) for trace in traces],
+                "layout": self.layout}
+
+    def region_summary(self, color_choice, region, resolution=1.0):
+        """A line about what the colouring shows: the region's resilience or best partners, or the communities."""
+        if color_choice == 'leiden':
+            i = lookup(self.communities, resolution)
+            line = "%d communities at resolution %g" % (self.communities.membership[i].max() + 1, self.communities.resolutions[i])
+            if np.isfinite(self.communities.modularity[i]):
+                line += ", modularity %.3f" % self.communities.modularity[i]
+            return line + "."
+        if color_choice == 'embeddedness':
+            _, resilience = self.embeddedness.region(region)
+            rank = int((self.embeddedness.resilience > resilience).sum()) + 1
+            return "Total resilience of %s: %.3g, %d of %d regions." % (region, resilience, rank, len(self.embeddedness.regions))
+        if color_choice == 'rca':
+            partners = self.complementarity.partners(region)
+            if not partners:
+                return "%s has no characteristic occupations to complement." % region
+            return "%s complements best with %s." % (region, ', '.join("%s (%.3f)" % partner for partner in partners))
+        return ""
+
+
+    def get_labour_figure(self, colour_by = "louvain community", new_layout = False, size = 10):
 
-        self.edge_trace = go.Scatter(x=list(self.edge_data[:,:3].flatten()), 
-                        y=list(self.edge_data[:,3:].flatten()),
-                        mode='lines',\
-                        line={'width': 0.2},\
-                        line_shape='spline',\
-                        opacity=0.5,\
-                        hoverinfo='none')
+        G = self.four_digit_G
+        x, y = G.vs['x'], G.vs['y']
 
+        # A new layout is drawn in this figure only, the graph is shared and never changed
         if new_layout:
-            layout = np.array(G.layout_fruchterman_reingold(weights=field).coords)
-            G.vs["x"] = [f.item() for f in layout[:,0]]
-            G.vs["y"] = [f.item() for f in layout[:,1]]
-
-        node_x = G.vs['x']
-        node_y = G.vs['y']
-        node_hovertext = ["%s<br>Employed in Aus (1000's): %.2f<br>Percentage Females: %.3f" % items for items in 
-                    zip(G.vs['title'], G.vs['total_pop'], np.array(G.vs['Females']) / (np.array(G.vs['Males']) + np.array(G.vs['Females'])))]
+            layout = layout_service.layout(G.get_edgelist(), G.vcount(), weights=G.es['weight'])
+            x, y = layout[:, 0], layout[:, 1]
 
         color = [plotly.colors.diverging.Portland[c] for c in G.vs[colour_by]]
         if type(size) == int:
@@ -103,24 +164,38 @@ class LabourNetwork():
         else:
             sizes =  G.vs[size]
             sizes = np.log(np.array(sizes)+1)
-            sizes = list(20*sizes / np.max(sizes))
+            sizes = pack(20*sizes / np.max(sizes))
 
-        node_trace = go.Scatter(x=node_x, y=node_y, hovertext=node_hovertext, text=[], mode='markers+text', textposition="bottom center", \
-                                hoverinfo="text", marker={'size': sizes, 'color':color}, showlegend=True)
+        node_trace = dict(self.node_trace, x=pack(x), y=pack(y), marker={'size': sizes, 'color':color})
+        edges = edge_trace(level_of_detail(edge_segments(G.get_edgelist(), x, y), G.es['weight']))
 
         figure = {
-                "data": [self.edge_trace, node_trace] ,
-                "layout": go.Layout(title='Labour Network Visualization', showlegend=False, hovermode='closest',
-                                    margin={'b': 40, 'l': 40, 'r': 40, 't': 40},
-                                    xaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
-                                    yaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
-                                    height=600,
-                                    clickmode='event+select',
-                                    )}
+                "data": [edges, same_renderer(node_trace, edges)] ,
+                "layout": self.layout}
         return figure
 
 
-labourNetwork = LabourNetwork()
+labourNetwork = Lazy(LabourNetwork)
+
+
+def labour_edge_store():
+    G = labourNetwork.four_digit_G
+    return edge_store(labourNetwork.edge_index, G.vs['x'], G.vs['y'], labourNetwork.layout)
+
+
+# The regions the embeddedness colouring can be shown for
+regions = region_names()
+# And the resolutions the community colouring can
+resolutions = stored_resolutions().tolist()
+# The colourings of one region, offered when there is more than Australia as a whole
+REGIONAL_COLORS = ['embeddedness', 'rca'] if len(regions) > 1 else []
+
+
+def control_styles(color_choice):
+    """Styles of the region dropdown and the resolution slider, hidden unless `color_choice` uses them."""
+    def shown(used):
+        return {} if used else {'display': 'none'}
+    return shown(color_choice in REGIONAL_COLORS), shown(color_choice == 'leiden' and len(resolutions) > 1)
 
 
 # Define the tab html
@@ -159,9 +234,22 @@ labour_tab = dcc.Tab(label='Labour Networks', children = [
                             """)),
                             dcc.Dropdown(id="color_choice", value="louvain community", options=[
                                 {'label':"Cognitive Community", 'value': "louvain community"},
+                                {'label':"Communities by Resolution", 'value': "leiden"},
                                 {'label':"Unemployment", 'value': "unemployment"},
                                 # {'label':"Detailed Occupation (6-digit)", 'value': 6}
-                                ]),
+                                ] + [{'label': label, 'value': value} for label, value in
+                                     [("Regional Embeddedness", "embeddedness"), ("Comparative Advantage", "rca")]
+                                     if value in REGIONAL_COLORS]),
+                            html.Div(id="region_box", style=control_styles("louvain community")[0], children=[
+                                dcc.Dropdown(id="region_choice", value=regions[0], clearable=False,
+                                             options=[{'label': region, 'value': region} for region in regions])]),
+                            html.Div(id="resolution_box", style=control_styles("louvain community")[1], children=[
+                                dcc.Slider(id="resolution_choice", min=resolutions[0], max=resolutions[-1],
+                                           step=round(min(np.diff(resolutions)), 6) if len(resolutions) > 1 else None,
+                                           value=min(resolutions, key=lambda resolution: abs(resolution - 1)),
+                                           marks={resolution: '%g' % resolution for resolution in resolutions
+                                                  if resolution == round(resolution)})]),
+                            html.Div(id="region_output"),
                             html.Div(id="color_choice_output")
                         ],
                         # style={'height': '300px'}
@@ -206,8 +294,11 @@ labour_tab = dcc.Tab(label='Labour Networks', children = [
             ),
             html.Div(
                 className="eight columns",
+                # With the edges sent to the browser, the clientside callback draws the first figure
                 children=[dcc.Graph(id="labour-graph",
-                                    figure=labourNetwork.main_figure)],
+                                    figure=EMPTY_FIGURE if CLIENTSIDE else startup_figure(lambda: labourNetwork.main_figure))]
+                         + ([edge_store_component('labour-edges', labour_edge_store), dcc.Store(id='labour-nodes')]
+                            if CLIENTSIDE else []),
             ),
         ]
     ),
@@ -241,8 +332,7 @@ labour_tab = dcc.Tab(label='Labour Networks', children = [
                         """
                     )),
                     html.Div([
-                        html.Img(src='data:image/png;base64,{}'.format(base64.b64encode(
-                            open('assets/April Total Employment Losses.png', 'rb').read()).decode()), style={'width': '100%'})
+                        image('April Total Employment Losses.png', style={'width': '100%'})
                     ])
                 ]
             ),
@@ -271,8 +361,7 @@ labour_tab = dcc.Tab(label='Labour Networks', children = [
                         """
                     )),
                     html.Div([
-                        html.Img(src='data:image/png;base64,{}'.format(base64.b64encode(
-                            open('assets/RCA_States_Overlap.png', 'rb').read()).decode()), style={'width': '100%'})
+                        image('RCA_States_Overlap.png', style={'width': '100%'})
                     ])
                     
                 ]
@@ -308,6 +397,32 @@ color_choice_output_dict = {
             and the road to economic recovery.
             """
         )),
+    'leiden':
+        dcc.Markdown(d(
+            """
+            Communities of occupations found with the Leiden algorithm, which maximises the modularity of the skill network. 
+            The slider sets its resolution: low resolutions give a few large communities, like the cognitive and physical 
+            split, and higher ones break them into smaller, more tightly connected groups of occupations. 
+            Occupations left in a community of their own are grey.
+            """
+        )),
+    'embeddedness':
+        dcc.Markdown(d(
+            """
+            The embeddedness of each occupation in the region picked above: how strongly its skills connect 
+            to the occupations the region's workers do, $e\_j^r = \sum\_k s\_k^r A\_{k,j}$ for the share $s\_k^r$ 
+            of the region's workforce in occupation $k$. Well embedded occupations have somewhere to go when 
+            a shock hits them, and the region's total resilience $e\_{total}^r$ is shown on the colour bar.
+            """
+        )),
+    'rca':
+        dcc.Markdown(d(
+            """
+            The revealed comparative advantage of the region picked above in each occupation. 
+            Its characteristic occupations, with an RCA above 1, are red, and the skill edges between them are highlighted. 
+            Two regions complement each other when their characteristic occupations differ but share skills.
+            """
+        )),
 }
 
 size_choice_output_dict = {
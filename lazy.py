@@ -0,0 +1,61 @@
+import os, threading
+
+
+# When each tab's data and figures are built.
+#
+#   NETWORKS_LAZY=0           at import, in every gunicorn worker (the default)
+#   NETWORKS_LAZY=1           the first time a callback needs them
+#   NETWORKS_LAZY=background  in a warm-up thread started once the app is set up
+LOADING = os.environ.get('NETWORKS_LAZY', '0')
+LAZY = LOADING in ('1', 'background')
+
+EMPTY_FIGURE = {'data': [], 'layout': {}}
+
+
+class Lazy():
+    """A value built by `factory` the first time it is needed.
+
+    Attribute access goes through to the value, so a Lazy can stand in for
+    the object it builds, e.g. `labourNetwork.get_updated_graph(...)`.
+    """
+    instances = []
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.built = False
+        self.value = None
+        Lazy.instances.append(self)
+        if not LAZY:
+            self.get()
+
+    def get(self):
+        if not self.built:
+            with self.lock:
+                if not self.built:
+                    self.value = self.factory()
+                    self.built = True
+        return self.value
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+def startup_figure(build):
+    """The figure a dcc.Graph starts with: built now, or left empty when lazy.
+
+    Dash runs every callback when the page loads, so a lazy graph is filled
+    in by its callback.
+    """
+    return EMPTY_FIGURE if LAZY else build()
+
+
+def warm_up():
+    """Build every Lazy in a background thread if NETWORKS_LAZY=background."""
+    if LOADING != 'background':
+        return None
+    thread = threading.Thread(target=lambda: [lazy.get() for lazy in Lazy.instances], daemon=True)
+    thread.start()
+    return thread
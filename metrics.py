@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Latency and payload metrics for the Dash callbacks.
+#
+# Every POST to /_dash-update-component is timed by Flask before and after
+# request hooks, so the numbers include Dash serializing the response:
+# wall time, CPU time of the worker thread and of the jobs it waited on,
+# serialized response bytes, before compression, and whether the response
+# cache had it, per callback and per set of input values. They are served in
+# the Prometheus text format at /metrics, to local clients only, and are
+# counted separately in each gunicorn worker.
+#
+# With NETWORKS_PROFILE_RATE above 0 that fraction of callback requests is
+# also run under cProfile, and each profile written to NETWORKS_PROFILE_DIR:
+#
+#   python -m pstats profiles/update_main_labour_output-1234-1718000000000.prof
+import cProfile, os, random, re, threading, time
+
+from cache import callback_cache
+from jobs import job_time
+
+
+METRICS = os.environ.get('NETWORKS_METRICS', '1') == '1'
+PROFILE_RATE = float(os.environ.get('NETWORKS_PROFILE_RATE', 0))
+PROFILE_DIR = os.environ.get('NETWORKS_PROFILE_DIR', 'profiles')
+
+UPDATE_PATH = '/_dash-update-component'
+LOCAL_ADDRESSES = ('127.0.0.1', '::1', 'localhost')
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+# Distinct input values kept per callback; any more are counted under "other"
+MAX_INPUT_SERIES = 100
+MAX_INPUT_LABEL = 120
+
+
+class Histogram():
+    """Cumulative bucket counts, sum and count of observations, as Prometheus histograms are."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class CallbackMetrics():
+    """Per callback and per input value totals of the callback requests seen by this process."""
+    def __init__(self, max_input_series=MAX_INPUT_SERIES):
+        self.max_input_series = max_input_series
+        self.lock = threading.Lock()
+        self.seconds, self.bytes = {}, {}
+        self.cpu_seconds, self.requests, self.cache = {}, {}, {}
+        self.inputs = {}
+
+    def record(self, callback, inputs, status, seconds, cpu_seconds, nbytes, cache):
+        with self.lock:
+            if callback not in self.seconds:
+                self.seconds[callback] = Histogram(SECONDS_BUCKETS)
+                self.bytes[callback] = Histogram(BYTES_BUCKETS)
+                self.inputs[callback] = {}
+            self.seconds[callback].observe(seconds)
+            self.bytes[callback].observe(nbytes)
+            self.cpu_seconds[callback] = self.cpu_seconds.get(callback, 0.0) + cpu_seconds
+            key = (callback, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            key = (callback, cache)
+            self.cache[key] = self.cache.get(key, 0) + 1
+
+            series = self.inputs[callback]
+            if inputs not in series and len(series) >= self.max_input_series:
+                inputs = 'other'
+            totals = series.setdefault(inputs, [0, 0.0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += cpu_seconds
+            totals[3] += nbytes
+
+    def exposition(self):
+        """The metrics in the Prometheus text format."""
+        lines = []
+
+        def family(name, kind, help):
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+
+        def sample(name, labels, value):
+            lines.append('%s{%s} %s' % (name, ','.join('%s="%s"' % (label, escape(value))
+                                                       for label, value in labels), repr(float(value))))
+
+        with self.lock:
+            for name, histograms, help in [
+                    ('networks_callback_seconds', self.seconds, "Wall time of a callback request, serializing included."),
+                    ('networks_callback_response_bytes', self.bytes, "Size of a callback response body as serialized, before compression.")]:
+                family(name, 'histogram', help)
+                for callback, histogram in sorted(histograms.items()):
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        sample(name + '_bucket', [('callback', callback), ('le', repr(float(bound)))], count)
+                    sample(name + '_bucket', [('callback', callback), ('le', '+Inf')], histogram.count)
+                    sample(name + '_sum', [('callback', callback)], histogram.sum)
+                    sample(name + '_count', [('callback', callback)], histogram.count)
+
+            family('networks_callback_cpu_seconds_total', 'counter', "CPU time of the request and job threads serving a callback.")
+            for callback, seconds in sorted(self.cpu_seconds.items()):
+                sample('networks_callback_cpu_seconds_total', [('callback', callback)], seconds)
+
+            family('networks_callback_requests_total', 'counter', "Callback requests by HTTP status.")
+            for (callback, status), count in sorted(self.requests.items()):
+                sample('networks_callback_requests_total', [('callback', callback), ('status', status)], count)
+
+            family('networks_callback_cache_total', 'counter',
+                   "Callback requests by response cache result: hit, disk_hit, miss, bypass or none.")
+            for (callback, result), count in sorted(self.cache.items()):
+                sample('networks_callback_cache_total', [('callback', callback), ('result', result)], count)
+
+            for index, (suffix, help) in enumerate([
+                    ('requests_total', "Callback requests for each set of input values."),
+                    ('seconds_total', "Wall time of the callback requests for each set of input values."),
+                    ('cpu_seconds_total', "CPU time of the callback requests for each set of input values."),
+                    ('response_bytes_total', "Response bytes of the callback requests for each set of input values.")]):
+                name = 'networks_callback_input_' + suffix
+                family(name, 'counter', help)
+                for callback, series in sorted(self.inputs.items()):
+                    for inputs, totals in sorted(series.items()):
+                        sample(name, [('callback', callback), ('inputs', inputs)], totals[index])
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def input_label(body):
+    """The input values of a callback request as one short label."""
+    values = [item.get('value') if isinstance(item, dict) else item for item in body.get('inputs', [])]
+    label = ', '.join(repr(value) for value in values)
+    if len(label) > MAX_INPUT_LABEL:
+        label = label[:MAX_INPUT_LABEL - 3] + '...'
+    return label
+
+
+def callback_name(app, output):
+    """The name of the function behind a callback, or its output id for callbacks without one."""
+    function = app.callback_map.get(output, {}).get('callback')
+    return getattr(function, '__name__', None) or output
+
+
+def profile_path(directory, callback):
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', callback).strip('_.')
+    return os.path.join(directory, '%s-%d-%d.prof' % (name, os.getpid(), int(1000 * time.time())))
+
+
+def instrument(app, metrics=None, profile_rate=PROFILE_RATE, profile_dir=PROFILE_DIR):
+    """Record CallbackMetrics for every callback request to `app` and serve them at /metrics.
+
+    Returns the CallbackMetrics, or None when NETWORKS_METRICS=0.
+    """
+    if not METRICS and metrics is None:
+        return None
+    from flask import Response, abort, g, request
+
+    metrics = metrics or CallbackMetrics()
+    server = app.server
+
+    @server.before_request
+    def start_callback_timer():
+        if request.path != UPDATE_PATH or request.method != 'POST':
+            return
+        callback_cache.local.outcome = 'none'
+        job_time.cpu_seconds = 0.0
+        g.callback_profile = None
+        if profile_rate > 0 and random.random() < profile_rate:
+            g.callback_profile = cProfile.Profile()
+            g.callback_profile.enable()
+        g.callback_start = time.perf_counter(), time.thread_time()
+
+    @server.after_request
+    def record_callback(response):
+        start = getattr(g, 'callback_start', None)
+        if start is None:
+            return response
+        seconds = time.perf_counter() - start[0]
+        # Callbacks run as jobs spend their CPU time in the job threads
+        cpu_seconds = time.thread_time() - start[1] + getattr(job_time, 'cpu_seconds', 0.0)
+        body = request.get_json(silent=True) or {}
+        callback = callback_name(app, body.get('output', ''))
+        if g.callback_profile is not None:
+            g.callback_profile.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            g.callback_profile.dump_stats(profile_path(profile_dir, callback))
+        # The serialized figure, before compress.py compressed it
+        nbytes = getattr(g, 'uncompressed_bytes', None)
+        if nbytes is None:
+            nbytes = 0 if response.direct_passthrough else len(response.get_data())
+        metrics.record(callback, input_label(body), response.status_code, seconds, cpu_seconds, nbytes,
+                       getattr(callback_cache.local, 'outcome', 'none'))
+        return response
+
+    @server.route('/metrics')
+    def serve_metrics():
+        # Behind a proxy every request looks local, so forwarded ones are refused too
+        if request.remote_addr not in LOCAL_ADDRESSES or 'X-Forwarded-For' in request.headers:
+            abort(404)
+        return Response(metrics.exposition(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Betweenness and closeness centrality, exact or from sampled sources.
+#
+# Both come out of Brandes' algorithm: a breadth first search from each
+# source counts shortest paths, and walking back up its levels accumulates
+# every vertex's share of them. Here a batch of sources is searched at once,
+# each level being one sparse adjacency times dense (n, batch) product, so
+# there is no Python loop over vertices or edges.
+#
+# Searching from every vertex gives the exact values, which can be spread
+# over a process pool. Within a time budget, the sources are a random sample
+# of vertices instead, and the result carries bounds on its error.
+# Edge weights are ignored, as igraph's betweenness() and closeness() do by
+# default.
+#
+#   python pathcentrality.py data/skill_scape_graph.graph --exact --processes 4
+#   python pathcentrality.py data/spotify_full.graph --budget 60 --out spotify_paths.csv
+import argparse, os, sys, time
+from collections import namedtuple
+
+import numpy as np
+
+from centrality import adjacency_matrix
+
+
+# Seconds the app may spend on a graph's betweenness and closeness
+BUDGET = float(os.environ.get('NETWORKS_CENTRALITY_SECONDS', 0.25))
+
+# Entries of one batch's (n, batch) arrays, which bounds the batch size on big graphs
+BATCH_ENTRIES = 2**22
+MAX_BATCH = 64
+CONFIDENCE = 0.95
+
+# betweenness counts each unordered pair once, as igraph does, and closeness
+# is over the vertices each vertex reaches. When `exact` is False they are
+# estimates from `sources` sampled sources: with probability `confidence`
+# every vertex's betweenness over the number of pairs of other vertices,
+# and its mean distance to the vertices it reaches, are within
+# betweenness_error and distance_error of the exact values.
+PathCentrality = namedtuple('PathCentrality', ['betweenness', 'closeness', 'sources', 'exact', 'confidence',
+                                               'betweenness_error', 'distance_error', 'seconds'])
+
+
+def batch_size(n):
+    return int(max(1, min(MAX_BATCH, BATCH_ENTRIES // max(n, 1))))
+
+
+def search(A, sources):
+    """Brandes' forward and backward passes from a batch of sources.
+
+    Returns a (5, n) array of sums over the sources for each vertex: of its
+    dependency and its square, of its distance and its square to the sources
+    that reach it (the graph is undirected), and of how many sources do;
+    and the largest distance found.
+    """
+    n, b = A.shape[0], len(sources)
+    columns = np.arange(b)
+    distance = np.full((n, b), -1, dtype=np.int32)
+    distance[sources, columns] = 0
+    paths = np.zeros((n, b))
+    paths[sources, columns] = 1
+
+    # Forward: each level's path counts are the next level's sums of them
+    frontier, level = paths.copy(), 0
+    while True:
+        reached = A @ frontier
+        new = (distance < 0) & (reached > 0)
+        if not new.any():
+            break
+        level += 1
+        distance[new] = level
+        paths[new] = reached[new]
+        frontier = np.where(new, paths, 0)
+
+    # Backward: vertices pass their share of the paths through them one level up
+    dependency = np.zeros((n, b))
+    for depth in range(level, 0, -1):
+        share = np.where(distance == depth, (1 + dependency) / np.maximum(paths, 1), 0)
+        dependency += np.where(distance == depth - 1, paths * (A @ share), 0)
+
+    dependency[sources, columns] = 0
+    reachable = distance > 0
+    distance = np.where(reachable, distance, 0).astype(float)
+    sums = np.stack([dependency.sum(1), (dependency ** 2).sum(1), distance.sum(1), (distance ** 2).sum(1), reachable.sum(1)])
+    return sums, level
+
+
+def accumulate(A, sources, batch=None):
+    """The sums of search() over `sources`, in batches, and the largest distance."""
+    n = A.shape[0]
+    batch = batch or batch_size(n)
+    sums, diameter = np.zeros((5, n)), 0
+    for start in range(0, len(sources), batch):
+        found, level = search(A, sources[start:start + batch])
+        sums += found
+        diameter = max(diameter, level)
+    return sums, diameter
+
+
+def closeness_from(sums):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(sums[4] > 0, sums[4] / sums[2], np.nan)
+
+
+def exact(sums, seconds):
+    n = sums.shape[1]
+    return PathCentrality(sums[0] / 2, closeness_from(sums), n, True, 1.0, 0.0, 0.0, seconds)
+
+
+def path_centrality(indptr, indices, budget=None, confidence=CONFIDENCE, seed=0, batch=None):
+    """Betweenness and closeness of every vertex, from as many sources as `budget` seconds allow.
+
+    Without a budget, or when every source fits in it, the result is exact.
+    Otherwise sources are taken in a random order, batch by batch, until the
+    budget is spent, and the sums are scaled up from the sample.
+    """
+    start = time.perf_counter()
+    A = adjacency_matrix(indptr, indices)
+    n = A.shape[0]
+    batch = batch or batch_size(n)
+    order = np.random.RandomState(seed).permutation(n)
+    sums, diameter, sampled = np.zeros((5, n)), 0, 0
+    while sampled < n:
+        found, level = search(A, order[sampled:sampled + batch])
+        sums += found
+        diameter = max(diameter, level)
+        sampled = min(sampled + batch, n)
+        if budget is not None and time.perf_counter() - start > budget:
+            break
+
+    if sampled == n:
+        return exact(sums, time.perf_counter() - start)
+    return estimate(sums, sampled, diameter, confidence, time.perf_counter() - start)
+
+
+def error_bound(total, squares, count, spread, log_term):
+    """Bound on the error of the mean of `count` draws within a range of `spread`.
+
+    The smaller of Hoeffding's bound and Maurer and Pontil's empirical
+    Bernstein bound, which is much tighter once the sample's variance is small.
+    """
+    count = np.maximum(count, 2)
+    mean = total / count
+    variance = np.maximum(squares - count * mean ** 2, 0) / (count - 1)
+    hoeffding = spread * np.sqrt(log_term / (2 * count))
+    bernstein = np.sqrt(2 * variance * log_term / count) + 7 * spread * log_term / (3 * (count - 1))
+    return np.minimum(hoeffding, bernstein)
+
+
+def estimate(sums, sampled, diameter, confidence, seconds):
+    """Scale sums over `sampled` sources up to the whole graph, with bounds on the error of that."""
+    n = sums.shape[1]
+    # Both sides of both bounds, for all n vertices at once
+    log_term = np.log(8 * n / (1 - confidence))
+    # A vertex's betweenness over the pairs of other vertices is the mean of
+    # n / (n - 1) dependency / (n - 2) over the sources, each within [0, n / (n - 1)]
+    scale = n / max(n - 1, 1) / max(n - 2, 1)
+    betweenness_error = error_bound(scale * sums[0], scale ** 2 * sums[1], sampled, n / max(n - 1, 1), log_term).max()
+    # Distances are at most twice the deepest search, which bounds the diameter
+    reached = sums[4] > 0
+    distance_error = error_bound(sums[2][reached], sums[3][reached], sums[4][reached], 2 * diameter, log_term).max() \
+        if reached.any() else 0.0
+    # The mean distance to the sampled sources a vertex reaches estimates its mean distance
+    return PathCentrality(sums[0] * n / sampled / 2, closeness_from(sums), sampled, False, confidence,
+                          betweenness_error, distance_error, seconds)
+
+
+def normalized_betweenness(result):
+    """Betweenness over the number of pairs of other vertices, the scale betweenness_error is on."""
+    n = len(result.betweenness)
+    pairs = max((n - 1) * (n - 2) / 2, 1)
+    return result.betweenness / pairs
+
+
+# The adjacency a pool worker searches, from a .graph file it maps itself or from arrays
+worker_adjacency = {}
+
+
+def init_worker(graph):
+    if isinstance(graph, str):
+        from graphstore import ColumnarGraph
+        graph = ColumnarGraph(graph).csr()
+    worker_adjacency['A'] = adjacency_matrix(*graph)
+
+
+def accumulate_in_worker(sources):
+    return accumulate(worker_adjacency['A'], sources)
+
+
+def exact_path_centrality(graph, processes=1, batch=None):
+    """Exact betweenness and closeness with the sources split over `processes` processes.
+
+    `graph` is a .graph file path, which the workers map rather than being
+    sent the adjacency, or an (indptr, indices) pair.
+    """
+    start = time.perf_counter()
+    if isinstance(graph, str):
+        from graphstore import ColumnarGraph
+        indptr, indices = ColumnarGraph(graph).csr()
+    else:
+        indptr, indices = graph
+    n = len(indptr) - 1
+    if processes <= 1:
+        return path_centrality(indptr, indices, batch=batch)
+
+    import multiprocessing
+    batch = batch or batch_size(n)
+    # Several chunks per process, so one slow chunk does not hold up the rest
+    chunks = [chunk for chunk in np.array_split(np.arange(n), max(1, min(n // batch, 4 * processes))) if len(chunk)]
+    sums = np.zeros((5, n))
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(graph,)) as pool:
+        for found, _ in pool.imap_unordered(accumulate_in_worker, chunks):
+            sums += found
+    return exact(sums, time.perf_counter() - start)
+
+
+def load_csr(path):
+    """(indptr, indices) and vertex names of a .graph file or igraph pickle."""
+    if path.endswith('.graph'):
+        from graphstore import ColumnarGraph
+        G = ColumnarGraph(path)
+        return G.csr(), G.vs['name'] if 'name' in G.vs.attributes() else None
+    import igraph as ig
+    from edges import csr_from_edges
+    G = ig.Graph.Read_Pickle(path)
+    return csr_from_edges(G.get_edgelist(), G.vcount()), G.vs['name'] if 'name' in G.vs.attributes() else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Betweenness and closeness centrality of a graph.")
+    parser.add_argument('graph', help=".graph file or igraph pickle")
+    parser.add_argument('--budget', type=float, default=None,
+                        help="seconds to spend; sources are sampled once every vertex no longer fits")
+    parser.add_argument('--exact', action='store_true', help="search from every vertex, ignoring --budget")
+    parser.add_argument('--processes', type=int, default=1, help="worker processes for --exact")
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE)
+    parser.add_argument('--out', default=None, help="CSV file for the name, betweenness and closeness of every vertex")
+    args = parser.parse_args(argv)
+
+    (indptr, indices), names = load_csr(args.graph)
+    if args.exact:
+        graph = args.graph if args.graph.endswith('.graph') else (indptr, indices)
+        result = exact_path_centrality(graph, args.processes)
+    else:
+        result = path_centrality(indptr, indices, args.budget, args.confidence)
+
+    print("%d vertices, %d edges: %s from %d sources in %.2f s" % (
+        len(indptr) - 1, len(indices) // 2, 'exact' if result.exact else 'estimated', result.sources, result.seconds))
+    if not result.exact:
+        print("with probability %.2f, normalized betweenness within %.4f and mean distances within %.3f of exact"
+              % (result.confidence, result.betweenness_error, result.distance_error))
+    if args.out:
+        import pandas as pd
+        pd.DataFrame({'name': list(names) if names is not None else np.arange(len(indptr) - 1),
+                      'betweenness': result.betweenness, 'closeness': result.closeness}).to_csv(args.out, index=False)
+        print("-> %s" % args.out)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
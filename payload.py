@@ -0,0 +1,40 @@
+import base64, os
+
+import numpy as np
+
+
+# How numeric arrays are put into figures.
+#
+# By default arrays stay as numpy and Dash writes them out as JSON text.
+# With NETWORKS_BINARY_PAYLOADS=1 they are sent as plotly typed arrays
+# instead, {'dtype': 'f4', 'bdata': <base64>}, which are several times smaller
+# and much cheaper to encode for the big edge traces. plotly.js only reads
+# typed arrays from version 2.28 (dash 2.15 and later), so this stays off
+# for the dash pinned in requirements.txt.
+BINARY_PAYLOADS = os.environ.get('NETWORKS_BINARY_PAYLOADS', '0') == '1'
+
+
+def typed_array(values, dtype='f4'):
+    """`values` as a plotly typed array spec of little endian `dtype`."""
+    array = np.ascontiguousarray(values, dtype='<' + dtype)
+    return {'dtype': dtype, 'bdata': base64.b64encode(array).decode('ascii')}
+
+
+def pack(values, dtype='f4'):
+    """A numeric array the way it should go into a figure."""
+    if BINARY_PAYLOADS:
+        return typed_array(values, dtype)
+    return np.asarray(values)
+
+
+def nbytes(value):
+    """Bytes of the arrays and strings in a figure or part of one, as kept in memory."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(item) for item in value)
+    return 0
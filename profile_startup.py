@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Time and memory of each step of starting the app, in a fresh interpreter.
+#
+#   python profile_startup.py                      as gunicorn workers start it
+#   NETWORKS_LAZY=1 python profile_startup.py      with lazy tab loading
+#
+# Each data file is loaded on its own first, then the app modules are
+# imported in dependency order, so a module's row shows what it costs on
+# top of the ones above it (its data files are then warm in the OS cache).
+import importlib, os, resource, sys, time
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        # Peak rather than current RSS, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def step(name, run, results=[]):
+    before, start = rss_mb(), time.perf_counter()
+    results.append(run())
+    print("  %-45s %9.1f ms %+9.1f MB" % (name, 1000 * (time.perf_counter() - start), rss_mb() - before))
+    sys.stdout.flush()
+
+
+LIBRARIES = ['numpy', 'scipy.stats', 'pandas', 'igraph', 'plotly.graph_objs', 'plotly.express',
+             'dash', 'dash_core_components', 'dash_html_components']
+
+DATA_FILES = ['data/skill_scape_graph.graph', 'data/spotify_core_graph.graph',
+              'data/information_flow_graph.graph', 'data/top100results.csv',
+              'data/centrality_artists_results.csv']
+
+MODULES = ['payload', 'edges', 'graphstore', 'lazy', 'cache', 'static', 'metrics', 'compress', 'jobs', 'clientside', 'regional', 'centrality', 'graphlayout', 'pathcentrality', 'explain', 'labour', 'spotify', 'app']
+
+
+def load(path):
+    import igraph as ig, pandas as pd
+    from graphstore import ColumnarGraph
+    if path.endswith('.pickle'):
+        return ig.Graph.Read_Pickle(path)
+    if path.endswith('.graph'):
+        return ColumnarGraph(path)
+    return pd.read_csv(path)
+
+
+def main():
+    start = time.perf_counter()
+    print("Startup profile (NETWORKS_LAZY=%s), starting at %.1f MB RSS" % (os.environ.get('NETWORKS_LAZY', '0'), rss_mb()))
+    for library in LIBRARIES:
+        step('import ' + library, lambda: importlib.import_module(library))
+    for path in DATA_FILES:
+        if os.path.exists(path):
+            step('load ' + path, lambda: load(path))
+    for module in MODULES:
+        step('import ' + module, lambda: importlib.import_module(module))
+    print("  %-45s %9.1f ms %9.1f MB" % ('app ready', 1000 * (time.perf_counter() - start), rss_mb()))
+
+    from lazy import Lazy
+    for lazy in Lazy.instances:
+        if not lazy.built:
+            step('first use of ' + lazy.factory.__name__, lazy.get)
+
+
+if __name__ == '__main__':
+    main()
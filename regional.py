@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Embeddedness, resilience and comparative advantage of every job in every
+# region of the labour network, and how well each pair of regions complement
+# each other.
+#
+# A job is embedded in a region by the strength of its skill similarity to
+# the jobs the region's workers do. With S the region x job matrix of each
+# region's employment shares and A the skill similarity adjacency,
+#
+#   e[r, j] = (S A)[r, j] = sum_k S[r, k] A[k, j]
+#   e_total[r] = sum_j e[r, j]^2 / sum_{a,b} A[a, b]
+#
+# so every job in every region comes out of one matrix product: sparse for
+# sparse skill graphs, dense through BLAS for ones like the labour graph,
+# where a third of all job pairs are similar enough to be linked.
+#
+# Regional employment is read from data/regional_employment.csv, with a row
+# for each region and occupation:
+#
+#   region,occupation,employment
+#   Adelaide - Central and Hills,2611,1250
+#
+# The revealed comparative advantage of region r in job j is its share of
+# the job's employment over its share of all employment,
+#
+#   RCA[r, j] = (E[r, j] / sum_r E[r, j]) / (sum_j E[r, j] / sum_{r,j} E[r, j])
+#
+# and the jobs with RCA above 1 are the region's characteristic jobs, X[r].
+# Two regions complement each other when their characteristic jobs are
+# different but similar in skills:
+#
+#   linkage[r, s] = (X A X^T)[r, s] / (|X[r]| |X[s]|)     mean similarity of their jobs
+#   overlap[r, s] = (X X^T)[r, s] / min(|X[r]|, |X[s]|)   share of those jobs they have in common
+#   complementarity[r, s] = linkage[r, s] (1 - overlap[r, s])
+#
+# where occupation is the 4-digit ANZSCO code the labour graph names its
+# vertices by. Without the file there is one region, Australia, employed as
+# the graph's total_pop.
+import os, time
+from collections import namedtuple
+
+import numpy as np, pandas as pd
+import scipy.sparse as sp
+
+
+REGIONAL_EMPLOYMENT = os.path.join('data', 'regional_employment.csv')
+NATIONAL = 'Australia'
+# Adjacencies with more of their entries nonzero than this are multiplied as dense arrays
+DENSE_FRACTION = 0.05
+
+# Regions, and a region x job sparse matrix of their employment
+Employment = namedtuple('Employment', ['regions', 'matrix'])
+
+
+def skill_adjacency(edgelist, weights, n):
+    """The symmetric weighted adjacency of an undirected edge list, as CSR."""
+    edges = np.asarray(edgelist, dtype=np.intp).reshape(-1, 2)
+    weights = np.asarray(weights, dtype=float)
+    rows, columns = np.concatenate([edges[:, 0], edges[:, 1]]), np.concatenate([edges[:, 1], edges[:, 0]])
+    return sp.csr_matrix((np.concatenate([weights, weights]), (rows, columns)), shape=(n, n))
+
+
+def region_names(path=REGIONAL_EMPLOYMENT):
+    """The regions load_employment() gives, read without the rest of the file."""
+    if not os.path.exists(path):
+        return [NATIONAL]
+    regions = pd.read_csv(path, usecols=['region'])['region'].astype(str).unique()
+    return [NATIONAL] + sorted(region for region in regions if region != NATIONAL)
+
+
+def load_employment(occupations, national, path=REGIONAL_EMPLOYMENT):
+    """Employment of each region in the jobs named `occupations`.
+
+    The first region is always Australia: the sum of the regions in the
+    file, or `national` when there is no file. Occupations the graph does not
+    have are left out.
+    """
+    jobs = len(occupations)
+    if not os.path.exists(path):
+        return Employment([NATIONAL], sp.csr_matrix(np.asarray(national, dtype=float).reshape(1, jobs)))
+
+    # As categories, each distinct region and occupation is only looked up once
+    table = pd.read_csv(path, dtype={'region': 'category', 'occupation': 'category'})
+    position = pd.Series(np.arange(jobs), index=pd.Index(occupations).astype(str))
+    job = position.reindex(table['occupation'].cat.categories.astype(str)).fillna(-1).to_numpy(dtype=np.intp)
+    job = np.where(table['occupation'].cat.codes.to_numpy() >= 0, job[table['occupation'].cat.codes.to_numpy()], -1)
+
+    names = np.asarray(table['region'].cat.categories.astype(str))
+    regions = np.array(sorted(name for name in names if name != NATIONAL))
+    region = np.append(np.searchsorted(regions, names), -1)[table['region'].cat.codes.to_numpy()]
+    region[np.append(names == NATIONAL, True)[table['region'].cat.codes.to_numpy()]] = -1
+    kept = (job >= 0) & (region >= 0)
+    by_region = sp.coo_matrix((table['employment'].to_numpy(dtype=float)[kept], (region[kept], job[kept])),
+                              shape=(len(regions), jobs)).tocsr()
+    matrix = sp.vstack([sp.csr_matrix(by_region.sum(0)), by_region]).tocsr()
+    return Employment([NATIONAL] + regions.tolist(), matrix)
+
+
+def operator(adjacency):
+    """`adjacency` in the form it multiplies fastest: CSR, or a dense array once dense enough."""
+    adjacency = sp.csr_matrix(adjacency, dtype=float)
+    n = adjacency.shape[0]
+    return adjacency.toarray() if adjacency.nnz > DENSE_FRACTION * n * n else adjacency
+
+
+def times(rows, adjacency):
+    """The sparse `rows` times an operator() adjacency, as a dense array."""
+    if isinstance(adjacency, np.ndarray):
+        return rows.toarray() @ adjacency
+    return np.asarray((rows @ adjacency).todense())
+
+
+class EmbeddednessEngine():
+    """Embeddedness of every job and total resilience of every region.
+
+    Everything is computed in __init__ and by update(), so looking a region
+    up is indexing one row.
+    """
+    def __init__(self, adjacency, employment):
+        self.adjacency = operator(adjacency)
+        self.total_weight = self.adjacency.sum()
+        self.update(employment)
+
+    def update(self, employment):
+        """Recompute everything for new regional employment."""
+        start = time.perf_counter()
+        self.regions = list(employment.regions)
+        self.index = {region: r for r, region in enumerate(self.regions)}
+        matrix = sp.csr_matrix(employment.matrix, dtype=float)
+        totals = np.asarray(matrix.sum(1)).ravel()
+        shares = sp.diags(1 / np.where(totals > 0, totals, 1)) @ matrix
+        self.embeddedness = times(shares, self.adjacency)
+        self.resilience = (self.embeddedness ** 2).sum(1) / self.total_weight
+        self.seconds = time.perf_counter() - start
+
+    def region(self, name):
+        """Embeddedness of every job in the region `name`, and the region's total resilience."""
+        r = self.index.get(name, 0)
+        return self.embeddedness[r], self.resilience[r]
+
+
+def revealed_comparative_advantage(employment):
+    """RCA of every region (row) in every job (column) of a dense employment array, 0 where undefined."""
+    employment = np.asarray(employment, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        job_share = employment / employment.sum(0, keepdims=True)
+        region_share = employment.sum(1, keepdims=True) / employment.sum()
+        rca = job_share / region_share
+    return np.where(np.isfinite(rca), rca, 0)
+
+
+class ComplementarityEngine():
+    """Comparative advantage of every region and complementarity of every pair of regions.
+
+    Australia, the sum of the regions, has an RCA of 1 in every job, so it
+    has no characteristic jobs and complements nothing.
+    """
+    def __init__(self, adjacency, employment):
+        start = time.perf_counter()
+        self.regions = list(employment.regions)
+        self.index = {region: r for r, region in enumerate(self.regions)}
+        matrix = sp.csr_matrix(employment.matrix, dtype=float)
+        # Australia, the first region, is the sum of the rest, so is left out of theirs
+        self.rca = np.ones(matrix.shape)
+        self.rca[1:] = revealed_comparative_advantage(matrix[1:].toarray())
+        self.characteristic = sp.csr_matrix(self.rca > 1, dtype=float)
+
+        X = self.characteristic
+        XA = times(X, operator(adjacency))
+        # Regions mostly have a third or so of the jobs characteristic, where
+        # single precision BLAS beats sparse products by far
+        if X.nnz > DENSE_FRACTION * np.prod(X.shape):
+            dense = X.toarray().astype(np.float32)
+            linkage, overlap = XA.astype(np.float32) @ dense.T, dense @ dense.T
+        else:
+            linkage, overlap = np.asarray(X @ XA.T), (X @ X.T).toarray()
+        counts = np.asarray(X.sum(1)).ravel()
+        linkage /= np.maximum(np.outer(counts, counts), 1)
+        overlap /= np.maximum(np.minimum.outer(counts, counts), 1)
+        self.complementarity = (linkage * (1 - overlap)).astype(np.float32)
+        np.fill_diagonal(self.complementarity, 0)
+        self.seconds = time.perf_counter() - start
+
+    def jobs(self, name):
+        """The characteristic jobs of the region `name`."""
+        r = self.index.get(name, 0)
+        return self.characteristic.indices[self.characteristic.indptr[r]:self.characteristic.indptr[r + 1]]
+
+    def partners(self, name, count=5):
+        """The `count` regions complementing `name` best, with their complementarity."""
+        row = self.complementarity[self.index.get(name, 0)]
+        best = np.argsort(-row, kind='mergesort')[:count]
+        return [(self.regions[s], float(row[s])) for s in best if row[s] > 0]
+
+    def ranked(self, count=20):
+        """The `count` most complementary pairs of regions, best first, with their complementarity."""
+        first, second = np.triu_indices(len(self.regions), 1)
+        scores = self.complementarity[first, second]
+        count = min(count, len(scores))
+        best = np.argpartition(-scores, count - 1)[:count] if count else np.array([], dtype=np.intp)
+        best = best[np.argsort(-scores[best], kind='mergesort')]
+        return [(self.regions[first[p]], self.regions[second[p]], float(scores[p])) for p in best]
@@ -1,4 +1,6 @@
 import pandas as pd, igraph as ig, numpy as np
+import os, time
+from collections import namedtuple
 
 import dash_core_components as dcc
 import dash_html_components as html
@@ -6,106 +8,197 @@ from textwrap import dedent as d
 
 import plotly.graph_objs as go
 import plotly.express as px
-import base64 # For rendering images
 
+from centrality import CentralityEngine, THRESHOLDS, TOP, top_vertices
+from edges import csr_from_edges, edge_segments, edge_trace, induced_edges, level_of_detail, same_renderer
+from payload import nbytes, pack
+from graphstore import load_graph
+from lazy import Lazy, startup_figure
+from static import image
 
 
+# What the threshold cache keeps for each value of the popularity slider
+SpotifyThreshold = namedtuple('SpotifyThreshold', ['vertices', 'centrality', 'figure'])
+
 
 class Spotify():
 	def __init__(self):
-		self.top_centrality = pd.read_csv('data/top100results.csv')
-		self.centrality_lookup = self.top_centrality.groupby('Threshold').apply(lambda x: x.set_index('ID')['Centraility'].to_dict()).to_dict()
-		self.spotify_core_graph = ig.Graph.Read_Pickle("data/spotify_core_graph.pickle")
-
-	def update_figure(self, threshold):
-		subgraph = self.threshold_spotify(threshold)
-		return self.get_labour_figure(subgraph)
-
-	def threshold_spotify(self, threshold):
-		subgraph = self.spotify_core_graph.subgraph(self.centrality_lookup[threshold].keys())
-		subgraph.vs['centrality'] = [self.centrality_lookup[threshold][v] for v in subgraph.vs['name']]
-		return subgraph
-
-	def get_labour_figure(self, G):
-		edge_data = []
-		for e in G.es:
-		    n0, n1 = e.tuple
-		    x0, y0 = G.vs[n0]['x'], G.vs[n0]['y']
-		    x1, y1 = G.vs[n1]['x'], G.vs[n1]['y']
-		    edge_data += [(x0, x1, None, y0, y1, None)]
-		edge_data = np.array(edge_data)
-		edge_trace = go.Scatter(x=list(edge_data[:,:3].flatten()), 
-						y=list(edge_data[:,3:].flatten()),
-						mode='lines',\
-						line={'width': 0.2},\
-						line_shape='spline',\
-						opacity=0.5,\
-						hoverinfo='none')
-
-
-		sizes =  np.array(G.vs['Popularity']) / 3
-
-		hovertext = ["Name: %s<br>Popularity: %d<br>Followers: %d" % (artist, pop, followers) for artist, pop, followers in zip(G.vs['Artist'], G.vs['Popularity'], G.vs['Followers'])]
-
-		node_trace = go.Scatter(x=G.vs['x'], y=G.vs['y'], hovertext=hovertext, text=[], mode='markers+text', textposition="bottom center", \
-								hoverinfo="text", marker={'size': sizes, 'color':G.vs['centrality'], 'cauto':True, 'colorscale':'Bluered',
-								'colorbar':{'thickness':20, 'title':'Network<br>Centrality'}})
-
-		figure = {
-			"data": [edge_trace, node_trace] ,
-			"layout": go.Layout(title='Spotify Most Central Core', showlegend=False, hovermode='closest',
+		# Published centrality where centrality.py has written it, computed live everywhere else
+		self.centrality_lookup = {}
+		if os.path.exists('data/top100results.csv'):
+			self.top_centrality = pd.read_csv('data/top100results.csv')
+			self.centrality_lookup = self.top_centrality.groupby('Threshold').apply(lambda x: x.set_index('ID')['Centraility'].to_dict()).to_dict()
+		self.spotify_core_graph = load_graph("spotify_core_graph")
+		# The full artist graph written by ingest.py, or the core when it has not been built
+		self.artist_graph = load_graph("spotify_full") if os.path.exists('data/spotify_full.graph') else self.spotify_core_graph
+		self.artist_popularity = np.asarray(self.artist_graph.vs['Popularity'])
+		if hasattr(self.artist_graph, 'csr'):
+			self.adjacency = self.artist_graph.csr()
+		else:
+			self.adjacency = csr_from_edges(self.artist_graph.get_edgelist(), self.artist_graph.vcount())
+		self.engine = CentralityEngine(*self.adjacency, self.artist_popularity)
+
+		G = self.spotify_core_graph
+		self.vertex_index = {name: i for i, name in enumerate(G.vs['name'])}
+		self.edgelist = np.array(G.get_edgelist(), dtype=np.intp).reshape(-1, 2)
+		self.x, self.y = np.array(G.vs['x']), np.array(G.vs['y'])
+		self.popularity = np.array(G.vs['Popularity'])
+		self.hovertext = np.array(["Name: %s<br>Popularity: %d<br>Followers: %d" % items
+								   for items in zip(G.vs['Artist'], G.vs['Popularity'], G.vs['Followers'])])
+
+		# Core graph vertex of each artist graph vertex, or -1 for artists the core layout does not place
+		if self.artist_graph is G:
+			self.core_vertex = np.arange(G.vcount())
+		else:
+			from ingest import ArtistIndex
+			core_vertex, placed = ArtistIndex(np.array(G.vs['name'], dtype='S')).lookup(self.artist_graph.vs['name'].to_bytes())
+			self.core_vertex = np.where(placed, core_vertex, -1)
+
+		self.layout = go.Layout(title='Spotify Most Central Core', showlegend=False, hovermode='closest',
 								margin={'b': 40, 'l': 40, 'r': 40, 't': 40},
 								xaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
 								yaxis={'showgrid': False, 'zeroline': False, 'showticklabels': False},
 								height=600,
 								clickmode='event+select',
-								)}
-		return figure
-
+								).to_plotly_json()
+		self.precompute()
+
+	def precompute(self):
+		"""Build the subgraph and figure for every threshold on the slider.
+
+		Each threshold keeps its vertex index array, centrality vector and
+		figure, whose numpy arrays Dash encodes when it is sent, so the slider
+		callback is a lookup. The figures share one layout.
+		"""
+		start = time.perf_counter()
+		self.cache = {}
+		for threshold in sorted(self.centrality_lookup) or THRESHOLDS:
+			vertices, centrality = self.threshold_spotify(threshold)
+			self.cache[threshold] = SpotifyThreshold(vertices, centrality, self.get_labour_figure(vertices, centrality))
+		self.cache_build_seconds = time.perf_counter() - start
+
+	def cache_nbytes(self):
+		"""Bytes held by the arrays and strings of the threshold cache, the shared layout counted once."""
+		return nbytes(self.layout) + sum(entry.vertices.nbytes + entry.centrality.nbytes + nbytes(entry.figure['data'])
+										  for entry in self.cache.values())
 
+	def update_figure(self, threshold):
+		if threshold in self.cache:
+			return self.cache[threshold].figure
+		return self.get_labour_figure(*self.threshold_spotify(threshold))
 
-centrality_artists_results = pd.read_csv('data/centrality_artists_results.csv')
-
-grouped = centrality_artists_results.groupby('Eigenvector')
-first = grouped.get_group('First')
-second = grouped.get_group('Second')
-
-first_average = first.groupby('Genre').apply(
-    lambda x: x.groupby('Threshold')['Centraility'].mean()).reset_index().melt(id_vars = 'Genre', value_name='Centrality')
+	def nearest_figure(self, threshold):
+		"""The precomputed figure of the slider threshold nearest `threshold`, a quick stand-in for update_figure."""
+		return self.cache[min(self.cache, key=lambda cached: (abs(cached - threshold), cached))].figure
 
-second_average = second.groupby('Genre').apply(
-    lambda x: x.groupby('Threshold')['Centraility'].mean()).reset_index().melt(id_vars = 'Genre', value_name='Centrality')
+	def threshold_spotify(self, threshold):
+		if threshold not in self.centrality_lookup:
+			return self.live_threshold(threshold)
+		lookup = self.centrality_lookup[threshold]
+		vertices = np.sort([self.vertex_index[name] for name in lookup])
+		names = self.spotify_core_graph.vs['name']
+		centrality = np.array([lookup[names[v]] for v in vertices])
+		return vertices, centrality
+
+	def live_threshold(self, threshold):
+		"""The most central artists the core layout places, from the eigenvector solved now."""
+		result = self.engine.solve(threshold)
+		core = self.core_vertex[result.vertices]
+		placed = np.flatnonzero(core >= 0)
+		top = placed[top_vertices(result.first[placed], TOP)]
+		order = np.argsort(core[top])
+		return core[top][order], result.first[top][order]
+
+	def get_labour_figure(self, vertices, centrality):
+		edges = induced_edges(self.edgelist, vertices, len(self.x))
+		sizes = self.popularity[vertices] / 3
+
+		node_trace = {'type': 'scatter', 'x': pack(self.x[vertices]), 'y': pack(self.y[vertices]), 'hovertext': self.hovertext[vertices], 'text': [],
+					  'mode': 'markers+text', 'textposition': "bottom center", 'hoverinfo': "text",
+					  'marker': {'size': pack(sizes), 'color': pack(centrality), 'cauto':True, 'colorscale':'Bluered',
+								 'colorbar':{'thickness':20, 'title':'Network<br>Centrality'}}}
+
+		# Past the edge budget, the edges between the most popular artists are drawn
+		popularity = np.minimum(self.popularity[edges[:, 0]], self.popularity[edges[:, 1]])
+		edge_lines = edge_trace(level_of_detail(edge_segments(edges, self.x, self.y), popularity))
+		return {"data": [edge_lines, same_renderer(node_trace, edge_lines)], "layout": self.layout}
+
+
+
+class GenreAverages():
+	"""Average centrality of each genre at each threshold, for one eigenvector.
+
+	The averages are a dense genres x thresholds array, NaN where a genre has
+	no artists, with the leading genre of each threshold found once. The line
+	traces and layout are built here and shared by every figure, so a slider
+	move only makes the highlighted marker.
+	"""
+	def __init__(self, rows, title, hovertext):
+		genres, genre_index = np.unique(rows['Genre'].values.astype(str), return_inverse=True)
+		thresholds, threshold_index = np.unique(rows['Threshold'].values, return_inverse=True)
+		cells = genre_index * len(thresholds) + threshold_index
+		sums = np.bincount(cells, weights=rows['Centraility'].values, minlength=len(genres) * len(thresholds))
+		counts = np.bincount(cells, minlength=len(genres) * len(thresholds))
+		with np.errstate(invalid='ignore'):
+			self.values = (sums / counts).reshape(len(genres), len(thresholds))
+		self.genres, self.thresholds = genres, thresholds
+		self.leader = np.nanargmax(np.where(np.isnan(self.values), -np.inf, self.values), axis=0)
+		self.leading_values = self.values[self.leader, np.arange(len(thresholds))]
+		self.hovertext = hovertext
+
+		colors = px.colors.qualitative.Plotly
+		self.lines = tuple({'type': 'scatter', 'mode': 'lines', 'name': genre, 'legendgroup': genre,
+							'x': pack(thresholds), 'y': pack(self.values[i]), 'line': {'color': colors[i % len(colors)]},
+							'hovertemplate': 'Genre=%s<br>Popularity Threshold=%%{x}<br>Average Group Centrality=%%{y}<extra></extra>' % genre}
+						   for i, genre in enumerate(genres))
+		self.layout = {'title': {'text': title},
+					   'xaxis': {'title': {'text': 'Popularity Threshold'}},
+					   'yaxis': {'title': {'text': 'Average Group Centrality'}}}
+
+	def figure(self, threshold):
+		"""The shared lines with a marker on the leading genre at the stored threshold nearest `threshold`."""
+		i = int(np.abs(self.thresholds - threshold).argmin())
+		marker = {'type': 'scatter', 'x': [self.thresholds[i].item()], 'y': [self.leading_values[i].item()], 'marker': {'size': 20},
+				  'hovertext': [self.hovertext % threshold], 'showlegend': False}
+		return {'data': self.lines + (marker,), 'layout': self.layout}
+
+
+def eigenvector_averages():
+	"""GenreAverages of the First and Second eigenvectors.
+
+	Both are None until centrality.py has written the table, which needs an artist graph with genres.
+	"""
+	if not os.path.exists('data/centrality_artists_results.csv'):
+		return {'First': None, 'Second': None}
+	centrality_artists_results = pd.read_csv('data/centrality_artists_results.csv')
+	eigenvector = centrality_artists_results['Eigenvector'].values
+	return {'First': GenreAverages(centrality_artists_results[eigenvector == 'First'], 'First Eigenvector (Eigencentraility)',
+								   "Average Centrality of\nMost Central Group of\nArtists at threshold %d"),
+			'Second': GenreAverages(centrality_artists_results[eigenvector == 'Second'], 'Second Eigenvector',
+									"Average Second Eigenvector Value\n of group at threshold %d")}
+
+averages = Lazy(eigenvector_averages)
+
+
+def missing_averages_figure(title):
+	return go.Figure(layout=go.Layout(title=title, xaxis={'visible': False}, yaxis={'visible': False},
+									  annotations=[{'text': "No genre centrality table yet: run python centrality.py --out data --force on an artist graph with genres",
+													'showarrow': False, 'xref': 'paper', 'yref': 'paper', 'x': 0.5, 'y': 0.5}]))
 
 
 def plot_first_eigencentraility(threshold):
-	fig = px.line(first_average, x="Threshold", y="Centrality", 
-              title='First Eigenvector (Eigencentraility)', color='Genre',
-              labels = dict(Centrality = "Average Group Centrality",
-          					Threshold = "Popularity Threshold"))
-	choice = first_average.set_index('Threshold').loc[threshold].sort_values('Centrality').iloc[-1]
-	fig = fig.add_trace(
-	    go.Scatter(x = [threshold], y = [choice.Centrality], 
-	               marker = {'size':20},
-	               hovertext = ["Average Centrality of\nMost Central Group of\nArtists at threshold %d" % threshold], 
-	               showlegend = False)
-	)
-	return fig
+	first_average = averages.get()['First']
+	if first_average is None:
+		return missing_averages_figure('First Eigenvector (Eigencentraility)')
+	return first_average.figure(threshold)
 
 def plot_second_eigencentraility(threshold):
-	fig = px.line(second_average, x="Threshold", y="Centrality", 
-              title='Second Eigenvector', color='Genre',
-              labels = dict(Centrality = "Average Group Centrality",
-              				Threshold = "Popularity Threshold"))
-	choice = second_average.set_index('Threshold').loc[threshold].sort_values('Centrality').iloc[-1]
-	fig = fig.add_trace(
-	    go.Scatter(x = [threshold], y = [choice.Centrality], 
-	               marker = {'size':20},
-	               hovertext = ["Average Second Eigenvector Value\n of group at threshold %d" % threshold], 
-	               showlegend = False)
-	)
-	return fig
-
-spotify = Spotify()
+	second_average = averages.get()['Second']
+	if second_average is None:
+		return missing_averages_figure('Second Eigenvector')
+	return second_average.figure(threshold)
+
+spotify = Lazy(Spotify)
 
 
 # Define the tab html
@@ -166,7 +259,7 @@ spotify_tab = dcc.Tab(label='Spotify Collaboration', children = [
                     html.Div(
 		                className="twelve columns",
 		                children=[dcc.Graph(id="spotify-graph",
-		                                    figure=spotify.update_figure(0) )],
+		                                    figure=startup_figure(lambda: spotify.update_figure(0)) )],
 		            ),
                 ]
             ),
@@ -178,12 +271,12 @@ spotify_tab = dcc.Tab(label='Spotify Collaboration', children = [
 		            html.Div(
 		                className="twelve columns",
 		                children=[dcc.Graph(id="spotify_first_eigenvector_graph",
-		                                    figure=plot_first_eigencentraility(0))],
+		                                    figure=startup_figure(lambda: plot_first_eigencentraility(0)))],
 		            ),
 		             html.Div(
 		                className="twelve columns",
 		                children=[dcc.Graph(id="spotify_second_eigenvector_graph",
-		                                    figure=plot_second_eigencentraility(0))],
+		                                    figure=startup_figure(lambda: plot_second_eigencentraility(0)))],
 		            ),
                 ]
             )
@@ -211,21 +304,18 @@ spotify_tab = dcc.Tab(label='Spotify Collaboration', children = [
     	children = [
 		       	html.Div(className= "four columns", children = [
 		       		html.Div(className='container', children = [
-				        html.Img(src='data:image/png;base64,{}'.format(base64.b64encode(
-				            open('assets/PopDegreeSuper.png', 'rb').read()).decode()), style={'width': '100%'}),
+				        image('PopDegreeSuper.png', style={'width': '100%'}),
 				        html.Div(style = {'height':'20px'}),
 				        html.Div(children = ["Popularity and Degree in Spotify Data"])
     			])]),
 		       	html.Div(className= "four columns", children = [
 		       		html.Div(className='container', children = [
-				        html.Img(src='data:image/png;base64,{}'.format(base64.b64encode(
-				            open('assets/leaders_vs_celebrities_threshold1.png', 'rb').read()).decode()), style={'width': '90%'}),
+				        image('leaders_vs_celebrities_threshold1.png', style={'width': '90%'}),
 				        html.Div(children = ["Initial Social Group Centrality Model"])
     			])]),
 		       	html.Div(className= "four columns", children = [
 		       		html.Div(className='container', children = [
-				        html.Img(src='data:image/png;base64,{}'.format(base64.b64encode(
-				            open('assets/leaders_vs_celebrities_threshold2.png', 'rb').read()).decode()), style={'width': '90%'}),
+				        image('leaders_vs_celebrities_threshold2.png', style={'width': '90%'}),
 				        html.Div(children = ["Model After Popularity Threshold is Applied"])
 
     			])])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Images for the tab layouts, served from assets/ by Dash.
+#
+# The layouts link to the files rather than inlining them as base64, so the
+# browser fetches and caches each image separately from the layout.
+# Running this file writes downscaled copies into assets/variants/, which
+# image() then offers to the browser through srcset:
+#
+#   python static.py
+import os, struct
+from urllib.parse import quote
+
+import dash_html_components as html
+
+
+ASSETS = 'assets'
+VARIANT_WIDTHS = [640, 1280]
+
+# Image URLs carry the file's modification time, as Dash's own asset URLs do,
+# so a replaced image is fetched anew and browsers may keep each URL a week
+ASSET_MAX_AGE = int(os.environ.get('NETWORKS_ASSET_MAX_AGE', 7 * 24 * 3600))
+
+
+def asset_url(name):
+    path = os.path.join(ASSETS, name)
+    if not os.path.exists(path):
+        return '/assets/' + quote(name)
+    return '/assets/%s?m=%d' % (quote(name), os.path.getmtime(path))
+
+
+def variant_name(name, width):
+    root, extension = os.path.splitext(name)
+    return 'variants/%s-%dw%s' % (root, width, extension)
+
+
+def png_width(path):
+    # The width is the first field of the IHDR chunk, right after the signature
+    with open(path, 'rb') as png:
+        return struct.unpack('>I', png.read(24)[16:20])[0]
+
+
+def image(name, **kwargs):
+    """An html.Img of assets/`name`, with a srcset of any downscaled variants."""
+    widths = [width for width in VARIANT_WIDTHS
+              if os.path.exists(os.path.join(ASSETS, variant_name(name, width)))]
+    if widths:
+        sources = ['%s %dw' % (asset_url(variant_name(name, width)), width) for width in widths]
+        sources.append('%s %dw' % (asset_url(name), png_width(os.path.join(ASSETS, name))))
+        kwargs.setdefault('srcSet', ', '.join(sources))
+    return html.Img(src=asset_url(name), **kwargs)
+
+
+def add_cache_headers(server, max_age=ASSET_MAX_AGE):
+    """Send Cache-Control and ETag headers with everything under /assets/."""
+    @server.after_request
+    def cache_assets(response):
+        from flask import request
+        if request.path.startswith('/assets/') and response.status_code in (200, 304):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+            if response.get_etag()[0] is None and not response.direct_passthrough:
+                response.add_etag()
+        return response
+    return cache_assets
+
+
+def make_variants():
+    from PIL import Image
+
+    os.makedirs(os.path.join(ASSETS, 'variants'), exist_ok=True)
+    for name in sorted(os.listdir(ASSETS)):
+        if not name.endswith('.png'):
+            continue
+        original = Image.open(os.path.join(ASSETS, name))
+        for width in VARIANT_WIDTHS:
+            if width >= original.width:
+                continue
+            height = round(original.height * width / original.width)
+            path = os.path.join(ASSETS, variant_name(name, width))
+            original.resize((width, height), Image.LANCZOS).save(path, optimize=True)
+            size, variant_size = os.path.getsize(os.path.join(ASSETS, name)), os.path.getsize(path)
+            # Palette PNGs can come out bigger once resampled, and then are not worth it
+            if variant_size >= size:
+                os.remove(path)
+                continue
+            print("%s: %d KB -> %d KB" % (path, size // 1024, variant_size // 1024))
+
+
+if __name__ == '__main__':
+    make_variants()
@@ -0,0 +1,28 @@
+import os, sys
+
+import igraph as ig
+import numpy as np
+import pytest
+
+# The app's modules sit at the top of the repository and read data/ and
+# assets/ relative to it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+@pytest.fixture
+def skill_graph():
+    """A small graph with the attributes of data/skill_scape_graph, its weights full of ties."""
+    rng = np.random.RandomState(0)
+    n = 60
+    G = ig.Graph.Erdos_Renyi(n=n, m=240)
+    G.vs['name'] = ['job %d' % i for i in range(n)]
+    G.vs['title'] = ['Job %d' % i for i in range(n)]
+    G.vs['x'], G.vs['y'] = rng.uniform(-1, 1, n).tolist(), rng.uniform(-1, 1, n).tolist()
+    G.vs['total_pop'] = rng.uniform(0, 50, n).tolist()
+    G.vs['Males'], G.vs['Females'] = rng.uniform(1, 20, n).tolist(), rng.uniform(1, 20, n).tolist()
+    G.vs['unemployment'] = rng.normal(0, 5, n).tolist()
+    G.vs['louvain community'] = rng.randint(0, 5, n).tolist()
+    G.es['weight'] = rng.randint(1, 20, G.ecount()).astype(float).tolist()
+    return G
@@ -0,0 +1,44 @@
+import os
+
+import igraph as ig
+import numpy as np
+import pytest
+
+from edges import EdgeIndex, graph_segments, rank_percentile
+
+
+
+def thresholds(percentile):
+    return np.concatenate([np.linspace(0, 1, 101), np.unique(percentile)])
+
+
+def test_edge_index_keeps_the_edges_above_the_percentile(skill_graph):
+    G = skill_graph
+    percentile = rank_percentile(G.es['weight'])
+    segments = graph_segments(G)
+    index = EdgeIndex(G.get_edgelist(), G.vs['x'], G.vs['y'], G.es['weight'])
+
+    for threshold in thresholds(percentile):
+        kept = index.order[index.start(threshold):]
+        np.testing.assert_array_equal(np.sort(kept), np.flatnonzero(percentile > threshold))
+        np.testing.assert_array_equal(index.threshold(threshold), segments.reshape(2, -1, 3)[:, kept].reshape(2, -1))
+        np.testing.assert_array_equal(index.edges[index.start(threshold):], np.array(G.get_edgelist())[kept])
+
+
+def test_edge_index_is_a_view(skill_graph):
+    G = skill_graph
+    index = EdgeIndex(G.get_edgelist(), G.vs['x'], G.vs['y'], G.es['weight'])
+    assert np.shares_memory(index.threshold(0.5), index.segments)
+
+
+@pytest.mark.parametrize('name', ['skill_scape_graph', 'information_flow_graph'])
+def test_stored_graph_thresholds_as_its_pickle(name):
+    if not os.path.exists(os.path.join('data', '%s.graph' % name)):
+        pytest.skip("data/%s.graph has not been converted" % name)
+    from graphstore import ColumnarGraph, load_graph
+
+    G = load_graph(name)
+    assert isinstance(G, ColumnarGraph), "data/%s.graph is out of date" % name
+    pickled = ig.Graph.Read_Pickle(os.path.join('data', '%s.pickle' % name))
+    np.testing.assert_array_equal(rank_percentile(G.es['weight']), rank_percentile(pickled.es['weight']))
+    np.testing.assert_array_equal(graph_segments(G), graph_segments(pickled))
@@ -0,0 +1,44 @@
+import json, random
+from concurrent.futures import ThreadPoolExecutor
+
+import plotly
+import pytest
+
+import labour
+
+
+def encode(figure):
+    return json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+@pytest.fixture
+def network(skill_graph, monkeypatch, tmp_path):
+    # Without the regional table or stored communities, as in a fresh checkout
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(labour, 'load_graph', lambda name: skill_graph)
+    return labour.LabourNetwork()
+
+
+def test_concurrent_requests_get_their_own_figures(network):
+    combos = [(color, round(1 - slider / 10, 1), size)
+              for color in list(network.markers) + ['leiden']
+              for slider in range(11)
+              for size in network.sizes]
+    expected = {combo: encode(network.get_updated_graph(*combo)) for combo in combos}
+
+    def request(combo):
+        return combo, encode(network.get_updated_graph(*combo))
+
+    rng = random.Random(0)
+    work = [rng.choice(combos) for _ in range(400)]
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(request, work))
+    mismatched = [combo for combo, response in responses if expected[combo] != response]
+    assert not mismatched, "%d responses were for other inputs" % len(mismatched)
+
+
+def test_figures_leave_the_network_unchanged(network):
+    before = encode(network.main_figure), encode(network.node_trace), encode(network.markers)
+    for threshold in [0, 0.5, 1]:
+        network.get_updated_graph('unemployment', threshold, 'total_pop')
+    assert (encode(network.main_figure), encode(network.node_trace), encode(network.markers)) == before